@@ -0,0 +1,613 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of asynchronous Bondora API."""
+
+import json
+import asyncio
+import aiohttp
+import api.urls
+from api.bondora_api import parse_wait_time
+from api.retry import RETRY_POLICIES, DEFAULT_POLICY
+from setup_logger import logger
+
+# maximal number of simultaneously open connections
+POOL_MAXSIZE = 10
+# maximal number of simultaneously open connections per host
+POOL_MAXSIZE_PER_HOST = 10
+# connect and total timeouts in seconds
+TIMEOUT = (3.05, 30)
+
+
+class AsyncBondoraApi:
+    """
+    Asynchronous class representation of Bondora API.
+
+    All endpoint methods are coroutines sharing one connection pool,
+    so that many requests can be awaited concurrently, e.g.::
+
+        async with AsyncBondoraApi(token) as bondora:
+            balance, investments = await asyncio.gather(
+                bondora.get_balance(False),
+                bondora.get_investments(False, LoanStatusCode=2))
+
+    """
+
+    def __init__(self,
+                 token,
+                 url_api=api.urls.URL_BONDORA_API,
+                 url_balance=api.urls.URL_BONDORA_BALANCE,
+                 url_investments=api.urls.URL_BONDORA_INVESTMENTS,
+                 url_eventlog=api.urls.URL_BONDORA_EVENTLOG,
+                 url_auctions=api.urls.URL_BONDORA_AUCTIONS,
+                 url_bid_auction=api.urls.URL_BONDORA_BID_AUCTION,
+                 url_get_bid=api.urls.URL_BONDORA_GET_BID,
+                 url_get_bids=api.urls.URL_BONDORA_GET_BIDS,
+                 url_sm=api.urls.URL_BONDORA_SM,
+                 url_loan_parts=api.urls.URL_LOAN_PARTS,
+                 url_buy_sm=api.urls.URL_BONDORA_BUY_SM,
+                 url_sell_sm=api.urls.URL_BONDORA_SELL_SM,
+                 url_cancel_sm=api.urls.URL_BONDORA_CANCEL_SM,
+                 pool_maxsize=POOL_MAXSIZE,
+                 pool_maxsize_per_host=POOL_MAXSIZE_PER_HOST,
+                 timeout=TIMEOUT,
+                 rate_limiter=None,
+                 json_codec=json,
+                 retry_policies=None):
+        self.token = token
+        self.url_api = url_api
+        self.url_balance = url_balance
+        self.url_investments = url_investments
+        self.url_eventlog = url_eventlog
+        self.url_auctions = url_auctions
+        self.url_bid_auction = url_bid_auction
+        self.url_get_bid = url_get_bid
+        self.url_get_bids = url_get_bids
+        self.url_sm = url_sm
+        self.url_loan_parts = url_loan_parts
+        self.url_buy_sm = url_buy_sm
+        self.url_sell_sm = url_sell_sm
+        self.url_cancel_sm = url_cancel_sm
+        self.pool_maxsize = pool_maxsize
+        self.pool_maxsize_per_host = pool_maxsize_per_host
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        # any object with `loads` and `dumps`, e.g. module orjson
+        self.json_codec = json_codec
+        # retry policies per endpoint (see api.retry)
+        self.retry_policies = (RETRY_POLICIES if retry_policies is None
+                               else retry_policies)
+        self.session = None
+        self.balance = None
+        self.investments = None
+        self.eventlog = None
+        self.auctions = None
+        self.sm = None
+        self.loan_parts = None
+        self.retry = {}
+        self.headers = {'User-Agent':
+                        ('Mozilla/5.0 (X11; Linux x86_64) '
+                         'AppleWebKit/537.11 (KHTML, like Gecko) '
+                         'Chrome/23.0.1271.64 Safari/537.11'),
+                        'Accept-Charset': 'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
+                        'Accept-Encoding': 'none',
+                        'Accept-Language': 'en-US,en;q=0.8',
+                        'Connection': 'keep-alive',
+                        'Content-Type': 'application/json',
+                        'Authorization': 'Bearer {}'.format(self.token)}
+
+    async def __aenter__(self):
+        """Open HTTP session."""
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        """Close HTTP session."""
+        await self.close()
+
+    async def open(self):
+        """
+        Create HTTP session with a pool of keep-alive connections.
+
+        The session is bound to the running event loop, therefore
+        the method must be awaited within that loop.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_maxsize,
+                limit_per_host=self.pool_maxsize_per_host)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.headers,
+                timeout=aiohttp.ClientTimeout(sock_connect=self.timeout[0],
+                                              total=self.timeout[1]))
+
+    async def close(self):
+        """
+        Close HTTP session and release all pooled connections.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            if self.session is not None:
+                await self.session.close()
+        except Exception as e:
+            logger.error(e)
+
+    async def _wait(self, url):
+        """Wait without blocking for free slot, if rate limited."""
+        if self.rate_limiter is not None:
+            # the limiter locks its state file, keep it off the event loop
+            loop = asyncio.get_running_loop()
+            delay = await loop.run_in_executor(None, self.rate_limiter.reserve,
+                                               url)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _params(params):
+        """Convert URL parameters to strings as expected by aiohttp."""
+        if not params:
+            return None
+        return {key: str(value) for key, value in params.items()
+                if value is not None}
+
+    async def post(self, url, content):
+        """
+        Make a POST request to the specified url.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        content : dict
+            Content to send in a POST request.
+
+        Returns
+        -------
+        response : aiohttp.ClientResponse object
+            Response of server to the request with already read content.
+
+        """
+        response = None
+        try:
+            await self.open()
+            await self._wait(url)
+            data = self.json_codec.dumps(content)
+            async with self.session.post(self.url_api + '/{}'.format(url),
+                                         data=data) as response:
+                body = await response.read()
+
+            # check if response is not ok
+            if response.status not in [200, 202]:
+                logger.error('Response status code: {}, url: {}'
+                             .format(response.status, url))
+                # block further requests, if too many requests
+                if response.status == 429 and self.rate_limiter is not None:
+                    self.rate_limiter.throttle(
+                        url, parse_wait_time(self.json_codec.loads(body)))
+
+        except Exception as e:
+            logger.error(e)
+
+        return response
+
+    async def get(self, url, content=None, params=None, retry=False):
+        """
+        Make a GET request to the specified url.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        content : dict, optional
+            Content to send in a GET request. The default is None.
+        params : dict, optional
+            Parameters to pass in URL. The default is None.
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+
+        Returns
+        -------
+        response_json : dict
+            Decoded content of the response.
+
+        """
+        policy = self.retry_policies.get(api.urls.get_endpoint(url),
+                                         DEFAULT_POLICY)
+        attempt = 1
+        while True:
+            response_json, status_code, wait_time = await self._get_once(
+                url, content, params)
+            if (not retry or status_code == 200
+                    or not policy.should_retry(attempt, status_code)):
+                return response_json
+            # wait without blocking other requests
+            await asyncio.sleep(policy.delay(attempt, wait_time))
+            attempt += 1
+            logger.info('Retry.')
+
+    async def _get_once(self, url, content, params):
+        """
+        Make one GET request.
+
+        Returns
+        -------
+        outcome : tuple
+            Decoded response, status code (None, if the request failed),
+            and wait time demanded by a throttled response or None.
+
+        """
+        response_json = None
+        status_code = None
+        wait_time = None
+        try:
+            await self.open()
+            await self._wait(url)
+            data = self.json_codec.dumps(content)
+            async with self.session.get(self.url_api + '/{}'.format(url),
+                                        params=self._params(params),
+                                        data=data) as response:
+                body = await response.read()
+            status_code = response.status
+
+            # check if response ok
+            if status_code == 200:
+                response_json = self.json_codec.loads(body)
+
+            # if too many requests
+            elif status_code == 429:
+                wait_time = parse_wait_time(self.json_codec.loads(body))
+                self.retry[url] = wait_time
+                # block further requests of all processes
+                if self.rate_limiter is not None:
+                    self.rate_limiter.throttle(url, wait_time)
+                logger.error('Response status code: {}, url: {}, '
+                             'retry after {} s.'
+                             .format(status_code, url, wait_time))
+
+            # response is not ok
+            else:
+                logger.error('Response status code: {}, url: {}'
+                             .format(status_code, url))
+
+        except Exception as e:
+            logger.error(e)
+
+        return response_json, status_code, wait_time
+
+    async def _get_payload(self, url, retry, content=None, params=None):
+        """Make a GET request and return its payload."""
+        response_json = await self.get(url, content=content, params=params,
+                                       retry=retry)
+        if not response_json or 'Payload' not in response_json:
+            return None
+        return response_json['Payload']
+
+    async def get_balance(self, retry):
+        """
+        Get balance of the account.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+
+        Returns
+        -------
+        balance : float
+            Total available balance.
+
+        """
+        try:
+            balance = await self._get_payload(self.url_balance, retry)
+            if balance is None:
+                return None
+            self.balance = float(balance['TotalAvailable'])
+            return self.balance
+        except Exception as e:
+            logger.error(e)
+
+    async def get_investments(self, retry, **kwargs):
+        """
+        Get list of investments.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-account-investments?v=1).
+
+        Returns
+        -------
+        investments : list
+            List of investments.
+
+        """
+        try:
+            investments = await self._get_payload(self.url_investments, retry,
+                                                  params=kwargs)
+            if investments is not None:
+                self.investments = investments
+            return investments
+        except Exception as e:
+            logger.error(e)
+
+    async def get_eventlog(self, retry, **kwargs):
+        """
+        Get events that have been made with this application.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-eventlog?v=1).
+
+        Returns
+        -------
+        eventlog : list
+            List of events.
+
+        """
+        try:
+            eventlog = await self._get_payload(self.url_eventlog, retry,
+                                               params=kwargs)
+            if eventlog is not None:
+                self.eventlog = eventlog
+            return eventlog
+        except Exception as e:
+            logger.error(e)
+
+    async def get_auctions(self, retry, **kwargs):
+        """
+        Get list of active auctions.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-auctions?v=1).
+
+        Returns
+        -------
+        auctions : list
+            List of active auctions.
+
+        """
+        try:
+            auctions = await self._get_payload(self.url_auctions, retry,
+                                               params=kwargs)
+            if auctions is not None:
+                self.auctions = auctions
+            return auctions
+        except Exception as e:
+            logger.error(e)
+
+    async def bid_on_auction(self, ids, amount, min_amount=1):
+        """
+        Make bid into auctions by auction IDs.
+
+        Parameters
+        ----------
+        ids : list
+            List of auction IDs to bid.
+        amount : int or list
+            Amount to bid, or list of amounts in the order of `ids`.
+        min_amount : int, optional
+            Minimal amount to accept, if an auction is almost funded.
+            The default is 1.
+
+        Returns
+        -------
+        response : aiohttp.ClientResponse object
+            Response of server to the request.
+
+        """
+        if not isinstance(amount, (list, tuple)):
+            amount = [amount] * len(ids)
+        try:
+            bids = [{'AuctionId': auction_id,
+                     'Amount': auction_amount,
+                     'MinAmount': min_amount}
+                    for auction_id, auction_amount in zip(ids, amount)]
+            return await self.post(self.url_bid_auction, {'Bids': bids})
+        except Exception as e:
+            logger.error(e)
+
+    async def get_bids(self, retry, **kwargs):
+        """
+        Get list of bids the investor has made.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-bids?v=1).
+
+        Returns
+        -------
+        response_json : dict
+            Decoded content of the response.
+
+        """
+        try:
+            return await self.get(self.url_get_bids, params=kwargs,
+                                  retry=retry)
+        except Exception as e:
+            logger.error(e)
+
+    async def get_bid(self, id, retry):
+        """
+        Get status of bid.
+
+        Parameters
+        ----------
+        id : String
+            Bid Id.
+        retry : bool
+            Retry to execute the method.
+
+        Returns
+        -------
+        response_json : dict
+            Decoded content of the response.
+
+        """
+        try:
+            return await self.get(self.url_get_bid + "/" + id, retry=retry)
+        except Exception as e:
+            logger.error(e)
+
+    async def get_secondarymarket(self, retry, **kwargs):
+        """
+        Get list of active secondary market items.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-secondarymarket?v=1).
+
+        Returns
+        -------
+        sm : list
+            List of secondary market items.
+
+        """
+        try:
+            sm = await self._get_payload(self.url_sm, retry, params=kwargs)
+            if sm is not None:
+                self.sm = sm
+            return sm
+        except Exception as e:
+            logger.error(e)
+
+    async def get_loanparts(self, retry, ids):
+        """
+        Get loan part info.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the method.
+        ids : list
+            List of loan part IDs.
+
+        Returns
+        -------
+        loan_parts : list
+            List of loan parts.
+
+        """
+        try:
+            loan_parts = await self._get_payload(self.url_loan_parts, retry,
+                                                 content={'ItemIds': ids})
+            if loan_parts is not None:
+                self.loan_parts = loan_parts
+            return loan_parts
+        except Exception as e:
+            logger.error(e)
+
+    async def buy_on_secondarymarket(self, ids):
+        """
+        Buy loans from secondary market by loans IDs.
+
+        Parameters
+        ----------
+        ids : list
+            List of secondary market item IDs to buy.
+
+        Returns
+        -------
+        response : aiohttp.ClientResponse object
+            Response of server to the request.
+
+        """
+        try:
+            return await self.post(self.url_buy_sm, {'ItemIds': ids})
+        except Exception as e:
+            logger.error(e)
+
+    async def sell_on_secondarymarket(self, loans,
+                                      cancel_on_payment=False,
+                                      cancel_on_reschedule=False):
+        """
+        Sell loans on secondary market.
+
+        The loans are split into chunks of size 100, which are sent
+        concurrently.
+
+        Parameters
+        ----------
+        loans : list
+            List of tuples (LoanPartId, DesiredDiscountRate) to sell.
+        cancel_on_payment : bool, optional
+            Allow to auto cancel the selling of loans
+            if they receive new repayments. The default is False.
+        cancel_on_reschedule : bool, optional
+            Allow to auto cancel the selling of loans
+            if they are rescheduled. The default is False.
+
+        Returns
+        -------
+        responses : list
+            List of aiohttp.ClientResponse objects, one per chunk.
+
+        """
+        try:
+            items = [{'LoanPartId': loan[0], 'DesiredDiscountRate': loan[1]}
+                     for loan in loans]
+            return await asyncio.gather(*[
+                self.post(self.url_sell_sm,
+                          {'Items': items[i:i + 100],
+                           'CancelItemOnPaymentReceived': cancel_on_payment,
+                           'CancelItemOnReschedule': cancel_on_reschedule})
+                for i in range(0, len(items), 100)])
+        except Exception as e:
+            logger.error(e)
+
+    async def cancel_on_secondarymarket(self, ids):
+        """
+        Cancel sale of loans offered on secondary market.
+
+        The IDs are split into chunks of size 100, which are sent
+        concurrently.
+
+        Parameters
+        ----------
+        ids : list
+            List of secondary market item IDs to cancel.
+
+        Returns
+        -------
+        responses : list
+            List of aiohttp.ClientResponse objects, one per chunk.
+
+        """
+        try:
+            return await asyncio.gather(*[
+                self.post(self.url_cancel_sm, {'ItemIds': ids[i:i + 100]})
+                for i in range(0, len(ids), 100)])
+        except Exception as e:
+            logger.error(e)
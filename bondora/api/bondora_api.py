@@ -3,15 +3,64 @@
 
 import sys
 import json
+import math
 import time
+import threading
 import requests
 import urllib3
-import inspect
 import api.urls
+from concurrent.futures import ThreadPoolExecutor, Future, as_completed
+from requests.adapters import HTTPAdapter
+from api.bulk import BulkOperation, BULK_WORKERS, CHUNK_SIZE
+from api.records import SecondaryMarketItem, Investment, LoanPart
+from api.retry import RetryScheduler
 from setup_logger import logger
+from setup_metrics import (API_LATENCY, API_RESPONSES, API_THROTTLED,
+                           API_BYTES_SENT, API_BYTES_RECEIVED, API_WARM,
+                           API_WARM_UP_LATENCY)
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# number of per-host connection pools kept by the session
+POOL_CONNECTIONS = 10
+# maximal number of connections kept alive per host
+POOL_MAXSIZE = 10
+# connect and read timeouts in seconds
+TIMEOUT = (3.05, 30)
+# number of items per page requested by list iterators
+PAGE_SIZE = 1000
+# number of concurrent page requests of snapshots
+SNAPSHOT_WORKERS = 4
+
+
+def parse_wait_time(response_json):
+    """
+    Get wait time from the response to a throttled request.
+
+    Parameters
+    ----------
+    response_json : dict
+        Decoded content of the response with status code 429.
+
+    Returns
+    -------
+    wait_time : int
+        Number of seconds to wait before the next request.
+
+    """
+    wait_time = int(response_json['Errors'][0]['Details'].split()[2])
+    # slightly increase wait time
+    return wait_time + 2
+
+
+class ListingError(Exception):
+    """Pages of a list endpoint could not be received completely."""
+
 
 class BondoraApi:
     """Class representation of Bondora API."""
@@ -29,7 +78,19 @@ class BondoraApi:
                  url_loan_parts=api.urls.URL_LOAN_PARTS,
                  url_buy_sm=api.urls.URL_BONDORA_BUY_SM,
                  url_sell_sm=api.urls.URL_BONDORA_SELL_SM,
-                 url_cancel_sm=api.urls.URL_BONDORA_CANCEL_SM):
+                 url_cancel_sm=api.urls.URL_BONDORA_CANCEL_SM,
+                 pool_connections=POOL_CONNECTIONS,
+                 pool_maxsize=POOL_MAXSIZE,
+                 timeout=TIMEOUT,
+                 session=None,
+                 rate_limiter=None,
+                 cache=None,
+                 json_codec=json,
+                 stream_json=False,
+                 records=False,
+                 retry_scheduler=None,
+                 concurrency=None,
+                 url_get_bids=api.urls.URL_BONDORA_GET_BIDS):
         self.token = token
         self.url_api = url_api
         self.url_balance = url_balance
@@ -38,6 +99,7 @@ class BondoraApi:
         self.url_auctions = url_auctions
         self.url_bid_auction = url_bid_auction
         self.url_get_bid = url_get_bid
+        self.url_get_bids = url_get_bids
         self.url_sm = url_sm
         self.url_loan_parts = url_loan_parts
         self.url_buy_sm = url_buy_sm
@@ -49,6 +111,9 @@ class BondoraApi:
         self.sm = None
         self.loan_parts = None
         self.retry = {}
+        # loan part IDs currently requested by get_loanparts_bulk
+        self.loan_parts_inflight = {}
+        self.loan_parts_lock = threading.Lock()
         self.headers = {'User-Agent':
                         ('Mozilla/5.0 (X11; Linux x86_64) '
                          'AppleWebKit/537.11 (KHTML, like Gecko) '
@@ -59,6 +124,167 @@ class BondoraApi:
                         'Connection': 'keep-alive',
                         'Content-Type': 'application/json',
                         'Authorization': 'Bearer {}'.format(self.token)}
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        # any object with `loads` and `dumps`, e.g. module orjson
+        self.json_codec = json_codec
+        # decode payloads of list iterators incrementally
+        self.stream_json = stream_json
+        # return records instead of payload dicts
+        self.records = records
+        # retries failed requests without sleeping in the calling thread
+        self.retry_scheduler = retry_scheduler or RetryScheduler()
+        # adapts the number of concurrent requests per endpoint
+        self.concurrency = concurrency
+        if stream_json and ijson is None:
+            logger.warning('Package ijson is not installed, '
+                           'payloads are decoded at once.')
+        # reuse provided session or create a new pooled one
+        if session is None:
+            session = self.create_session(pool_connections, pool_maxsize)
+        self.session = session
+
+    @staticmethod
+    def create_session(pool_connections=POOL_CONNECTIONS,
+                       pool_maxsize=POOL_MAXSIZE):
+        """
+        Create HTTP session with a pool of keep-alive connections.
+
+        The session can be passed to several API objects to share
+        the same connections between them.
+
+        Parameters
+        ----------
+        pool_connections : int, optional
+            Number of connection pools (hosts) to cache.
+            The default is POOL_CONNECTIONS.
+        pool_maxsize : int, optional
+            Maximal number of connections to keep alive per host.
+            The default is POOL_MAXSIZE.
+
+        Returns
+        -------
+        session : requests.Session object
+            Session with mounted connection pool.
+
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_maxsize)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def warm_up(self, connections=1):
+        """
+        Open and verify connections to the API host.
+
+        Cheap HEAD requests to `self.url_api` are sent concurrently,
+        so that `connections` connections are established (DNS, TCP,
+        and TLS) and kept in the pool of the session for the next
+        requests. The requests do not count against the rate limits
+        of the endpoints.
+
+        Parameters
+        ----------
+        connections : int, optional
+            Number of connections to open. The default is 1.
+
+        Returns
+        -------
+        warm : bool
+            True, if all connections were established.
+
+        """
+        def head(_):
+            try:
+                self.session.head(self.url_api,
+                                  headers=self.headers,
+                                  timeout=self.timeout,
+                                  allow_redirects=False)
+                return True
+            except Exception as e:
+                logger.error(e)
+                return False
+
+        start = time.perf_counter()
+        if connections <= 1:
+            results = [head(0)]
+        else:
+            with ThreadPoolExecutor(max_workers=connections) as executor:
+                results = list(executor.map(head, range(connections)))
+        warm = all(results)
+        API_WARM.set(1 if warm else 0)
+        API_WARM_UP_LATENCY.observe(time.perf_counter() - start)
+        return warm
+
+    def close(self):
+        """
+        Close HTTP session and release all pooled connections.
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            self.session.close()
+        except Exception as e:
+            logger.error(e)
+
+    @staticmethod
+    def _observe(method, url, status_code, latency, sent, received):
+        """
+        Record metrics of a request.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method of the request.
+        url : str
+            URL of the request.
+        status_code : int
+            Status code of the response.
+        latency : float
+            Time in seconds between sending the request and
+            receiving the response.
+        sent : int
+            Number of bytes of request content.
+        received : int
+            Number of bytes of response content.
+
+        Returns
+        -------
+        None.
+
+        """
+        endpoint = api.urls.get_endpoint(url)
+        API_LATENCY.labels(method, endpoint).observe(latency)
+        API_RESPONSES.labels(method, endpoint, status_code).inc()
+        if status_code == requests.codes.too_many_requests:
+            API_THROTTLED.labels(method, endpoint).inc()
+        API_BYTES_SENT.labels(method, endpoint).inc(sent)
+        API_BYTES_RECEIVED.labels(method, endpoint).inc(received)
+
+    def _acquire(self, url):
+        """Wait for a free slot of the concurrency controller, if set."""
+        if self.concurrency is None:
+            return False
+        return self.concurrency.acquire(url)
+
+    def _pool_size(self, workers):
+        """
+        Get number of threads of a pool sending concurrent requests.
+
+        With a concurrency controller, the pool is sized to its maximal
+        limit and the actual number of concurrent requests is adapted
+        by the controller. Otherwise, `workers` is used.
+
+        """
+        if self.concurrency is None:
+            return workers
+        return self.concurrency.max_limit
 
     def post(self, url, content):
         """
@@ -78,27 +304,66 @@ class BondoraApi:
 
         """
         response = None
+        acquired = False
+        latency = None
+        wait_time = None
         try:
-            response = requests.post(self.url_api + '/{}'.format(url),
-                                     headers=self.headers,
-                                     data=json.dumps(content))
+            # wait for free slot, if rate limited
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+            data = self.json_codec.dumps(content)
+            acquired = self._acquire(url)
+            start = time.perf_counter()
+            response = self.session.post(self.url_api + '/{}'.format(url),
+                                         headers=self.headers,
+                                         data=data,
+                                         timeout=self.timeout)
+            latency = time.perf_counter() - start
+            self._observe('POST', url, response.status_code, latency,
+                          len(data), len(response.content))
+
+            # check if response is ok
+            if response.status_code in [requests.codes.ok, 202]:
+                # drop cached responses changed by the request
+                if self.cache is not None:
+                    self.cache.invalidate_after(url)
 
-            # check if response is not ok
-            if response.status_code not in [requests.codes.ok, 202]:
+            # response is not ok
+            else:
                 # get caller name
-                caller = inspect.stack()[1][3]
+                caller = sys._getframe(1).f_code.co_name
                 logger.error('Response status code: {}, caller: {}'
                              .format(response.status_code, caller))
+                # block further requests, if too many requests
+                if response.status_code == requests.codes.too_many_requests:
+                    wait_time = parse_wait_time(
+                        self.json_codec.loads(response.content))
+                    if self.rate_limiter is not None:
+                        self.rate_limiter.throttle(url, wait_time)
 
         except Exception as e:
             logger.error(e)
 
+        finally:
+            if acquired:
+                self.concurrency.release(
+                    url, None if response is None else response.status_code,
+                    latency, wait_time)
+
         return response
 
-    def get(self, url, content=None, params=None, retry=False):
+    def get(self, url, content=None, params=None, retry=False, caller=None):
         """
         Make a GET request to the specified url.
 
+        Failed requests are retried according to the retry policy of
+        the endpoint (see `api.retry`), if `retry` is set. The first
+        attempt is made in the calling thread, only the retries are
+        scheduled by `self.retry_scheduler`. The result of the last
+        attempt is returned, so the calling thread is blocked for
+        the whole backoff of the retries. Use `get_async` to get
+        a future instead.
+
         Parameters
         ----------
         url : str
@@ -110,60 +375,522 @@ class BondoraApi:
         retry : bool, optional
             Retry to execute the method.
             The default is False.
+        caller : str, optional
+            Name of the calling method used as key in `self.retry`.
+            The default is None, i.e. the name of the calling function.
 
         Returns
         -------
-        response : requests.Response object
-            Response of server to the request.
+        response_json : dict
+            Decoded response of server to the request.
+
+        """
+        if caller is None:
+            caller = sys._getframe(1).f_code.co_name
+        outcome = self._get_once(url, content, params, caller)
+        if not retry or outcome[1] == requests.codes.ok:
+            return outcome[0]
+
+        def attempt(previous):
+            return self._get_once(url, content, params, caller)
+
+        try:
+            return self.retry_scheduler.resume(url, attempt, outcome).result()
+        except Exception as e:
+            logger.error(e)
+            return None
+
+    def get_async(self, url, content=None, params=None, retry=True,
+                  caller=None, executor=None):
+        """
+        Make a GET request without blocking the calling thread.
+
+        The first attempt is executed by `executor`, the retries are
+        scheduled by `self.retry_scheduler`. No thread waits during
+        the backoff, so `executor` is free for other requests.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        content : dict, optional
+            Content to send in a GET request. The default is None.
+        params : dict, optional
+            Parameters to pass in URL. The default is None.
+        retry : bool, optional
+            Retry failed requests. The default is True.
+        caller : str, optional
+            Name of the calling method used as key in `self.retry`.
+            The default is None, i.e. the name of the calling function.
+        executor : concurrent.futures.Executor object, optional
+            Executor of the first attempt. The default is None,
+            i.e. the executor of `self.retry_scheduler`.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of the decoded response of the last attempt.
+
+        """
+        if caller is None:
+            caller = sys._getframe(1).f_code.co_name
+        if executor is None:
+            executor = self.retry_scheduler.executor
+        future = Future()
+
+        def attempt(previous):
+            return self._get_once(url, content, params, caller)
+
+        def resolve(retried):
+            if retried.exception() is not None:
+                future.set_exception(retried.exception())
+            else:
+                future.set_result(retried.result())
+
+        def first():
+            try:
+                outcome = attempt(None)
+                if not retry or outcome[1] == requests.codes.ok:
+                    future.set_result(outcome[0])
+                    return None
+                self.retry_scheduler.resume(
+                    url, attempt, outcome).add_done_callback(resolve)
+            except Exception as e:
+                logger.error(e)
+                future.set_exception(e)
+
+        executor.submit(first)
+        return future
+
+    def _get_once(self, url, content, params, caller):
+        """
+        Make one GET request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        content : dict
+            Content to send in a GET request.
+        params : dict
+            Parameters to pass in URL.
+        caller : str
+            Name of the calling method used as key in `self.retry`.
+
+        Returns
+        -------
+        outcome : tuple
+            Decoded response, status code (None, if the request failed),
+            and wait time demanded by a throttled response or None.
 
         """
         response_json = None
+        status_code = None
+        wait_time = None
+        acquired = False
+        latency = None
         try:
-            response = requests.get(self.url_api + '/{}'.format(url),
-                                    headers=self.headers,
-                                    params=params,
-                                    data=json.dumps(content))
+            # return cached response, if available
+            cacheable = self.cache is not None and self.cache.cacheable(url)
+            if cacheable:
+                response_json = self.cache.get(url, params, content)
+                if response_json is not None:
+                    return response_json, requests.codes.ok, None
+
+            # wait for free slot, if rate limited
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+            data = self.json_codec.dumps(content)
+            acquired = self._acquire(url)
+            start = time.perf_counter()
+            response = self.session.get(self.url_api + '/{}'.format(url),
+                                        headers=self.headers,
+                                        params=params,
+                                        data=data,
+                                        timeout=self.timeout)
+            latency = time.perf_counter() - start
+            status_code = response.status_code
+            self._observe('GET', url, status_code, latency,
+                          len(data), len(response.content))
 
             # check if response ok
-            if response.status_code == requests.codes.ok:
-                response_json = json.loads(response.content)
+            if status_code == requests.codes.ok:
+                response_json = self.json_codec.loads(response.content)
+                if cacheable:
+                    self.cache.put(url, response_json, params, content)
+
+            # if too many requests
+            elif status_code == requests.codes.too_many_requests:
+                # get wait time
+                response_json = self.json_codec.loads(response.content)
+                wait_time = parse_wait_time(response_json)
+                self.retry[caller] = wait_time
+                # block further requests of all processes
+                if self.rate_limiter is not None:
+                    self.rate_limiter.throttle(url, wait_time)
+                logger.error('Response status code: {}, caller: {}, '
+                             'retry after {} s.'
+                             .format(status_code, caller, wait_time))
 
             # response is not ok
             else:
-                # get caller name
-                caller = inspect.stack()[1][3]
-                # if too many requests
-                if response.status_code == requests.codes.too_many_requests:
-                    # get wait time
-                    response_json = json.loads(response.content)
-                    wait_time = int(
-                        response_json['Errors'][0]['Details'].split()[2])
-                    # slightly increase wait time
-                    wait_time += 2
-                    self.retry[caller] = wait_time
-                    logger.error('Response status code: {}, caller: {}, '
-                                 'retry after {} s.'
-                                 .format(response.status_code,
-                                         caller,
-                                         wait_time))
-                # if not too many requests
-                else:
-                    # set waite time to 60 s.
-                    wait_time = 60
-                    logger.error('Response status code: {}, caller: {}'
-                                 .format(response.status_code, caller))
-
-                # second attempt, if required
-                if retry:
-                    # wait before proceed with the second attempt
-                    time.sleep(wait_time)
-                    logger.info('Retry.')
-                    self.get(url, content=content, params=params)
+                logger.error('Response status code: {}, caller: {}'
+                             .format(status_code, caller))
+
+        except Exception as e:
+            logger.error(e)
+
+        finally:
+            if acquired:
+                self.concurrency.release(url, status_code, latency, wait_time)
+
+        return response_json, status_code, wait_time
+
+    def _to_records(self, items, record_class):
+        """
+        Convert list of payload items to records, if required.
+
+        Parameters
+        ----------
+        items : list
+            List of payload items.
+        record_class : type
+            Record class of the items.
+
+        Returns
+        -------
+        items : list
+            List of records, if `self.records` is set, or `items`.
+
+        """
+        if not self.records or items is None:
+            return items
+        return record_class.from_list(items)
+
+    def _iter_records(self, items, record_class):
+        """Convert payload items to records one by one, if required."""
+        if not self.records:
+            return items
+        return map(record_class, items)
+
+    def get_stream(self, url, params=None, caller=None, retry=False):
+        """
+        Make a GET request and decode the payload incrementally.
+
+        The response body is streamed and the items of `Payload`
+        are decoded one by one, so that the whole response is never
+        held in memory. Requires the package ijson. Failed requests
+        are retried like in `get`, if `retry` is set, i.e. the consumer
+        is blocked for the backoff of the retries. ListingError is
+        raised, if the response is not received or breaks off, so that
+        a truncated payload is not taken as a complete one.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        params : dict, optional
+            Parameters to pass in URL. The default is None.
+        caller : str, optional
+            Name of the calling method used as key in `self.retry`.
+            The default is None, i.e. the name of the calling function.
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+
+        Yields
+        ------
+        item : dict
+            Item of `Payload`.
+
+        """
+        if caller is None:
+            caller = sys._getframe(1).f_code.co_name
+
+        def attempt(previous):
+            return self._open_stream(url, params, caller)
+
+        outcome = attempt(None)
+        opened = outcome[0]
+        if opened is None and retry:
+            # the first attempt is done, only retries are scheduled
+            opened = self.retry_scheduler.resume(url, attempt,
+                                                 outcome).result()
+        if opened is None:
+            raise ListingError('Failed to get {}, caller: {}.'
+                               .format(url, caller))
+
+        response, start = opened
+        with response:
+            response.raw.decode_content = True
+            try:
+                yield from ijson.items(response.raw, 'Payload.item',
+                                       use_float=True)
+            except Exception as e:
+                raise ListingError('Response of {} broke off, caller: {}: {}'
+                                   .format(url, caller, e)) from e
+            self._observe('GET', url, response.status_code,
+                          time.perf_counter() - start,
+                          0, response.raw.tell())
+
+    def _open_stream(self, url, params, caller):
+        """
+        Make one GET request streaming the response body.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        params : dict
+            Parameters to pass in URL.
+        caller : str
+            Name of the calling method used as key in `self.retry`.
+
+        Returns
+        -------
+        outcome : tuple
+            Tuple (response, start time) or None, if the response is not
+            ok, status code (None, if the request failed), and wait time
+            demanded by a throttled response or None.
+
+        """
+        status_code = None
+        wait_time = None
+        try:
+            # wait for free slot, if rate limited
+            if self.rate_limiter is not None:
+                self.rate_limiter.wait(url)
+            start = time.perf_counter()
+            response = self.session.get(self.url_api + '/{}'.format(url),
+                                        headers=self.headers,
+                                        params=params,
+                                        timeout=self.timeout,
+                                        stream=True)
+            status_code = response.status_code
+
+            # check if response ok
+            if status_code == requests.codes.ok:
+                return (response, start), status_code, None
+
+            self._observe('GET', url, status_code,
+                          time.perf_counter() - start,
+                          0, len(response.content))
+            response.close()
+
+            # response is not ok
+            if status_code == requests.codes.too_many_requests:
+                wait_time = parse_wait_time(
+                    self.json_codec.loads(response.content))
+                self.retry[caller] = wait_time
+                if self.rate_limiter is not None:
+                    self.rate_limiter.throttle(url, wait_time)
+            logger.error('Response status code: {}, caller: {}'
+                         .format(status_code, caller))
 
         except Exception as e:
             logger.error(e)
 
-        return response_json
+        return None, status_code, wait_time
+
+    def _iter_items(self, url, retry, prefetch, caller, params):
+        """
+        Iterate over items of all pages of a list endpoint.
+
+        The payloads are decoded incrementally, if `self.stream_json`
+        is set and ijson is installed. Background prefetch of pages
+        is not available in this case. ListingError is raised, if
+        a page is not received, so that callers can tell a truncated
+        list from a complete one.
+
+        Parameters
+        ----------
+        url : str
+            URL of the list endpoint.
+        retry : bool
+            Retry to execute the method.
+        prefetch : bool
+            Fetch the next page in background, while the current one
+            is consumed.
+        caller : str
+            Name of the calling method used as key in `self.retry`.
+        params : dict
+            Request information. `PageSize` defaults to PAGE_SIZE and
+            `PageNr` to 1.
+
+        Yields
+        ------
+        item : dict
+            Item of the list.
+
+        """
+        if not self.stream_json or ijson is None:
+            for page in self._iter_pages(url, retry, prefetch, caller,
+                                         params):
+                yield from page
+            return None
+
+        params = dict(params)
+        params.setdefault('PageSize', PAGE_SIZE)
+        page_nr = params.setdefault('PageNr', 1)
+        while True:
+            n_items = 0
+            for item in self.get_stream(url, dict(params, PageNr=page_nr),
+                                        caller, retry):
+                n_items += 1
+                yield item
+            # check if last page
+            if n_items < params['PageSize']:
+                return None
+            page_nr += 1
+
+    def _iter_pages(self, url, retry, prefetch, caller, params):
+        """
+        Iterate over all pages of a list endpoint.
+
+        ListingError is raised, if a page is not received.
+
+        Parameters
+        ----------
+        url : str
+            URL of the list endpoint.
+        retry : bool
+            Retry to execute the method.
+        prefetch : bool
+            Fetch the next page in background, while the current one
+            is consumed.
+        caller : str
+            Name of the calling method used as key in `self.retry`.
+        params : dict
+            Request information. `PageSize` defaults to PAGE_SIZE and
+            `PageNr` to 1.
+
+        Yields
+        ------
+        payload : list
+            List of items of the page.
+
+        """
+        params = dict(params)
+        params.setdefault('PageSize', PAGE_SIZE)
+        params.setdefault('PageNr', 1)
+
+        def get_page(page_nr):
+            return self.get(url, params=dict(params, PageNr=page_nr),
+                            retry=retry, caller=caller)
+
+        page_nr = params['PageNr']
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            page = get_page(page_nr)
+            while True:
+                if not page or 'Payload' not in page:
+                    raise ListingError('Failed to get page {} of {}.'
+                                       .format(page_nr, url))
+                payload = page['Payload'] or []
+                # check if last page
+                last_page = (
+                    len(payload) < params['PageSize']
+                    or
+                    ('TotalCount' in page
+                     and page_nr * params['PageSize'] >= page['TotalCount']))
+                next_page = None
+                if not last_page and executor is not None:
+                    next_page = executor.submit(get_page, page_nr + 1)
+                yield payload
+                if last_page:
+                    return
+                page_nr += 1
+                if next_page is not None:
+                    page = next_page.result()
+                else:
+                    page = get_page(page_nr)
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+    def _get_snapshot(self, url, retry, workers, caller, params):
+        """
+        Get all items of a list endpoint fetching the pages concurrently.
+
+        The total number of items is read from the first page, then
+        the remaining pages are requested by at most `workers` threads.
+        Each request waits for the rate limiter, if provided. Failed
+        pages are retried by `self.retry_scheduler` (see `get_async`),
+        so the threads keep fetching other pages during the backoff.
+
+        Parameters
+        ----------
+        url : str
+            URL of the list endpoint.
+        retry : bool
+            Retry to execute the method.
+        workers : int
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+        caller : str
+            Name of the calling method used as key in `self.retry`.
+        params : dict
+            Request information. `PageSize` defaults to PAGE_SIZE.
+
+        Returns
+        -------
+        items : list
+            Items of all pages in the order of pages, or None
+            if any page could not be received.
+
+        """
+        params = dict(params)
+        params.setdefault('PageSize', PAGE_SIZE)
+        params.pop('PageNr', None)
+
+        def get_page(page_nr):
+            page = self.get(url, params=dict(params, PageNr=page_nr),
+                            retry=retry, caller=caller)
+            if not page or 'Payload' not in page:
+                return None
+            return page
+
+        first_page = get_page(1)
+        if first_page is None:
+            logger.warning('Failed to get page 1 of {}.'.format(url))
+            return None
+        items = list(first_page['Payload'] or [])
+        if 'TotalCount' not in first_page:
+            # total number unknown, walk through remaining pages serially
+            if len(items) < params['PageSize']:
+                return items
+            try:
+                for page in self._iter_pages(url, retry, False, caller,
+                                             dict(params, PageNr=2)):
+                    items.extend(page)
+            except ListingError as e:
+                logger.error(e)
+                return None
+            return items
+
+        n_pages = math.ceil(first_page['TotalCount'] / params['PageSize'])
+        if n_pages > 1:
+            pool_size = self._pool_size(workers)
+            with ThreadPoolExecutor(max_workers=pool_size) as executor:
+                futures = [self.get_async(url,
+                                          params=dict(params, PageNr=page_nr),
+                                          retry=retry, caller=caller,
+                                          executor=executor)
+                           for page_nr in range(2, n_pages + 1)]
+                # futures keep the order of pages
+                for page_nr, future in enumerate(futures, start=2):
+                    try:
+                        page = future.result()
+                    except Exception as e:
+                        logger.error(e)
+                        page = None
+                    if not page or 'Payload' not in page:
+                        logger.error('Failed to get page {} of {}.'
+                                     .format(page_nr, url))
+                        # the snapshot is incomplete, drop pending pages
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        return None
+                    items.extend(page['Payload'] or [])
+        return items
 
     def get_balance(self, retry):
         """
@@ -210,7 +937,67 @@ class BondoraApi:
                                    retry=retry)
             if 'Payload' not in investments:
                 return None
-            self.investments = investments['Payload']
+            self.investments = self._to_records(investments['Payload'],
+                                                Investment)
+        except Exception as e:
+            logger.error(e)
+
+    def iter_investments(self, retry=False, prefetch=False, **kwargs):
+        """
+        Iterate over investments walking through all pages.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        prefetch : bool, optional
+            Fetch the next page in background. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-account-investments?v=1).
+
+        Yields
+        ------
+        investment : dict
+            Investment.
+
+        """
+        investments = self._iter_items(self.url_investments, retry, prefetch,
+                                       'iter_investments', kwargs)
+        yield from self._iter_records(investments, Investment)
+
+    def get_investments_snapshot(self, retry=False, workers=SNAPSHOT_WORKERS,
+                                 **kwargs):
+        """
+        Get list of all investments fetching the pages concurrently.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is SNAPSHOT_WORKERS.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-account-investments?v=1).
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            investments = self._get_snapshot(self.url_investments, retry,
+                                             workers,
+                                             'get_investments_snapshot',
+                                             kwargs)
+            if investments is None:
+                return None
+            self.investments = self._to_records(investments, Investment)
         except Exception as e:
             logger.error(e)
 
@@ -240,6 +1027,30 @@ class BondoraApi:
         except Exception as e:
             logger.error(e)
 
+    def iter_eventlog(self, retry=False, prefetch=False, **kwargs):
+        """
+        Iterate over events walking through all pages.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        prefetch : bool, optional
+            Fetch the next page in background. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-eventlog?v=1).
+
+        Yields
+        ------
+        event : dict
+            Event.
+
+        """
+        yield from self._iter_items(self.url_eventlog, retry, prefetch,
+                                    'iter_eventlog', kwargs)
+
     def get_auctions(self, retry, **kwargs):
         """
         Get list of active auctions.
@@ -266,7 +1077,7 @@ class BondoraApi:
         except Exception as e:
             logger.error(e)
 
-    def bid_on_auction(self, ids, amount):
+    def bid_on_auction(self, ids, amount, min_amount=1):
         """
         Make bid into auctions by auction IDs.
 
@@ -274,8 +1085,11 @@ class BondoraApi:
         ----------
         ids : list
             List of auction IDs to bid.
-        amount : int
-            Amount to bid.
+        amount : int or list
+            Amount to bid, or list of amounts in the order of `ids`.
+        min_amount : int, optional
+            Minimal amount to accept, if an auction is almost funded.
+            The default is 1.
 
         Returns
         -------
@@ -284,12 +1098,14 @@ class BondoraApi:
 
         """
         auctions_ids_list = []
+        if not isinstance(amount, (list, tuple)):
+            amount = [amount] * len(ids)
         try:
             # create list of dicts
-            for auction_id in ids:
+            for auction_id, auction_amount in zip(ids, amount):
                 auctions_ids_list.append({'AuctionId': auction_id,
-                                          'Amount': amount,
-                                          'MinAmount': 1})
+                                          'Amount': auction_amount,
+                                          'MinAmount': min_amount})
             response = self.post(self.url_bid_auction, {'Bids':
                                                         auctions_ids_list})
             return response
@@ -297,12 +1113,18 @@ class BondoraApi:
         except Exception as e:
             logger.error(e)
 
-    def get_bids(self, retry):
+    def get_bids(self, retry, **kwargs):
         """
         Gets list of bids the investor has made..
 
         Parameters
         ----------
+        retry : bool
+            Retry to execute the method.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-bids?v=1).
 
         Returns
         -------
@@ -311,7 +1133,8 @@ class BondoraApi:
 
         """
         try:
-            response = self.get(self.url_get_bids, retry=retry)
+            response = self.get(self.url_get_bids, params=kwargs,
+                                retry=retry)
             return response
 
         except Exception as e:
@@ -361,7 +1184,64 @@ class BondoraApi:
             sm = self.get(self.url_sm, params=kwargs, retry=retry)
             if 'Payload' not in sm:
                 return None
-            self.sm = sm['Payload']
+            self.sm = self._to_records(sm['Payload'], SecondaryMarketItem)
+        except Exception as e:
+            logger.error(e)
+
+    def iter_secondarymarket(self, retry=False, prefetch=False, **kwargs):
+        """
+        Iterate over secondary market items walking through all pages.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        prefetch : bool, optional
+            Fetch the next page in background. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-secondarymarket?v=1).
+
+        Yields
+        ------
+        item : dict
+            Secondary market item.
+
+        """
+        sm = self._iter_items(self.url_sm, retry, prefetch,
+                              'iter_secondarymarket', kwargs)
+        yield from self._iter_records(sm, SecondaryMarketItem)
+
+    def get_secondarymarket_snapshot(self, retry=False,
+                                     workers=SNAPSHOT_WORKERS, **kwargs):
+        """
+        Get list of all secondary market items fetching pages concurrently.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is SNAPSHOT_WORKERS.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-secondarymarket?v=1).
+
+        Returns
+        -------
+        None.
+
+        """
+        try:
+            sm = self._get_snapshot(self.url_sm, retry, workers,
+                                    'get_secondarymarket_snapshot', kwargs)
+            if sm is None:
+                return None
+            self.sm = self._to_records(sm, SecondaryMarketItem)
         except Exception as e:
             logger.error(e)
 
@@ -387,9 +1267,142 @@ class BondoraApi:
                                   retry=retry)
             if 'Payload' not in loan_parts:
                 return None
-            self.loan_parts = loan_parts['Payload']
+            self.loan_parts = self._to_records(loan_parts['Payload'],
+                                               LoanPart)
+        except Exception as e:
+            logger.error(e)
+
+    def iter_loanparts(self, ids, retry=False, batch_size=CHUNK_SIZE,
+                       workers=BULK_WORKERS):
+        """
+        Iterate over loan parts requesting them in concurrent batches.
+
+        The IDs are deduplicated and split into batches of `batch_size`.
+        IDs already requested by a concurrent call are not requested
+        again, but taken from the result of that call. The loan parts
+        are yielded as soon as their batch is received.
+
+        Parameters
+        ----------
+        ids : list
+            List of loan part IDs.
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        batch_size : int, optional
+            Maximal number of IDs per request. The default is CHUNK_SIZE.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is BULK_WORKERS.
+
+        Yields
+        ------
+        loan_part : dict
+            Loan part info.
+
+        """
+        wanted = set(ids)
+        batches = []
+        futures = set()
+        with self.loan_parts_lock:
+            new_ids = []
+            for loan_part_id in dict.fromkeys(ids):
+                future = self.loan_parts_inflight.get(loan_part_id)
+                if future is None:
+                    new_ids.append(loan_part_id)
+                else:
+                    futures.add(future)
+            for i in range(0, len(new_ids), batch_size):
+                batch = new_ids[i:i + batch_size]
+                future = Future()
+                for loan_part_id in batch:
+                    self.loan_parts_inflight[loan_part_id] = future
+                batches.append((batch, future))
+                futures.add(future)
+
+        executor = ThreadPoolExecutor(max_workers=self._pool_size(workers))
+        try:
+            for batch, future in batches:
+                executor.submit(self._get_loanparts_batch, batch, future,
+                                retry)
+            for future in as_completed(futures):
+                for loan_part_id, loan_part in future.result().items():
+                    if loan_part_id in wanted:
+                        wanted.discard(loan_part_id)
+                        if self.records:
+                            loan_part = LoanPart(loan_part)
+                        yield loan_part
+        finally:
+            executor.shutdown(wait=False)
+
+        if wanted:
+            logger.warning('{} of {} loan parts were not received.'
+                           .format(len(wanted), len(set(ids))))
+
+    def _get_loanparts_batch(self, ids, future, retry):
+        """
+        Request one batch of loan parts.
+
+        Parameters
+        ----------
+        ids : list
+            List of loan part IDs.
+        future : concurrent.futures.Future object
+            Future to pass the dict of received loan parts by
+            LoanPartId to.
+        retry : bool
+            Retry to execute the method.
+
+        Returns
+        -------
+        None.
+
+        """
+        loan_parts = {}
+        try:
+            response = self.get(self.url_loan_parts,
+                                content={'ItemIds': ids},
+                                retry=retry,
+                                caller='get_loanparts_bulk')
+            if response and 'Payload' in response:
+                for loan_part in response['Payload'] or []:
+                    loan_parts[loan_part['LoanPartId']] = loan_part
         except Exception as e:
             logger.error(e)
+        finally:
+            with self.loan_parts_lock:
+                for loan_part_id in ids:
+                    if self.loan_parts_inflight.get(loan_part_id) is future:
+                        del self.loan_parts_inflight[loan_part_id]
+            future.set_result(loan_parts)
+
+    def get_loanparts_bulk(self, ids, retry=False, batch_size=CHUNK_SIZE,
+                           workers=BULK_WORKERS):
+        """
+        Get info of many loan parts requesting them in concurrent batches.
+
+        Parameters
+        ----------
+        ids : list
+            List of loan part IDs.
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        batch_size : int, optional
+            Maximal number of IDs per request. The default is CHUNK_SIZE.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is BULK_WORKERS.
+
+        Returns
+        -------
+        loan_parts : dict
+            Loan part info by LoanPartId.
+
+        """
+        return {loan_part['LoanPartId']: loan_part
+                for loan_part in self.iter_loanparts(ids, retry, batch_size,
+                                                     workers)}
 
     def buy_on_secondarymarket(self, ids):
         """
@@ -415,10 +1428,14 @@ class BondoraApi:
 
     def sell_on_secondarymarket(self, loans,
                                 cancel_on_payment=False,
-                                cancel_on_reschedule=False):
+                                cancel_on_reschedule=False,
+                                workers=BULK_WORKERS):
         """
         Sell loans on secondary market.
 
+        The loans are split into chunks of size 100 to avoid errors by
+        selling, which are sent concurrently.
+
         Parameters
         ----------
         loans : list
@@ -429,52 +1446,63 @@ class BondoraApi:
         cancel_on_reschedule : bool, optional
             Allow to auto cancel the selling of loans
             if they are rescheduled. The default is False.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is BULK_WORKERS.
 
         Returns
         -------
-        response : requests.Response object
-            Response of server to the request.
+        result : BulkResult object
+            Status of every chunk and loan. Failed chunks can be sent
+            again by `result.retry()`.
 
         """
-        loans_ids_list = []
         try:
-            # create list of dicts
-            for loan in loans:
-                loans_ids_list.append({'LoanPartId': loan[0],
-                                       'DesiredDiscountRate': loan[1]})
-
-            # split loans_ids_list chunks of size 100 to avoid error by selling
-            for i in range(0, len(loans_ids_list), 100):
-                loans_dict = {'Items': loans_ids_list[i:i + 100],
-                              'CancelItemOnPaymentReceived': cancel_on_payment,
-                              'CancelItemOnReschedule': cancel_on_reschedule}
-                response = self.post(self.url_sell_sm, loans_dict)
-            return response
+            operation = BulkOperation(
+                self, self.url_sell_sm,
+                lambda chunk: {
+                    'Items': [{'LoanPartId': loan[0],
+                               'DesiredDiscountRate': loan[1]}
+                              for loan in chunk],
+                    'CancelItemOnPaymentReceived': cancel_on_payment,
+                    'CancelItemOnReschedule': cancel_on_reschedule},
+                item_key=lambda loan: loan[0],
+                workers=self._pool_size(workers))
+            return operation.run(list(loans))
 
         except Exception as e:
             logger.error(e)
 
-    def cancel_on_secondarymarket(self, ids):
+    def cancel_on_secondarymarket(self, ids, workers=BULK_WORKERS):
         """
         Cancel sale of loans offered on secondary market.
 
+        The IDs are split into chunks of size 100 to avoid errors by
+        cancelling, which are sent concurrently.
+
         Parameters
         ----------
         ids : list
             List of secondary market item IDs to cancel.
+        workers : int, optional
+            Maximal number of concurrent requests, if no concurrency
+            controller is set.
+            The default is BULK_WORKERS.
 
         Returns
         -------
-        response : requests.Response object
-            Response of server to the request.
+        result : BulkResult object
+            Status of every chunk and item. Failed chunks can be sent
+            again by `result.retry()`.
 
         """
         try:
-            # split ids chunks of size 100 to avoid error by cancelling
-            for i in range(0, len(ids), 100):
-                response = self.post(self.url_cancel_sm,
-                                     {'ItemIds': ids[i:i + 100]})
-            return response
+            operation = BulkOperation(
+                self, self.url_cancel_sm,
+                lambda chunk: {'ItemIds': chunk},
+                workers=self._pool_size(workers))
+            return operation.run(list(ids))
 
         except Exception as e:
             logger.error(e)
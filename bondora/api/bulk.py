@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""The file contains classes for bulk operations of Bondora API."""
+
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from setup_logger import logger
+
+# maximal number of items per request
+CHUNK_SIZE = 100
+# maximal number of concurrent requests
+BULK_WORKERS = 4
+# fields of errors referring to an item by its ID
+ERROR_ID_FIELDS = ('ItemId', 'LoanPartId', 'AuctionId', 'Id')
+# reference to an item by its position in the request, e.g. 'ItemIds[3]'
+# or 'Items[3].LoanPartId'
+ERROR_POSITION = re.compile(r'^\w+\[(\d+)\]')
+
+
+def error_positions(errors, ids):
+    """
+    Get positions of the items, which the errors of a request refer to.
+
+    An error refers to an item by a field of ERROR_ID_FIELDS, by the
+    position of the item in the request (ERROR_POSITION), or by
+    `Message` or `Details` consisting of the item ID only. IDs merely
+    mentioned somewhere in the text of an error are not attributed.
+
+    Parameters
+    ----------
+    errors : list
+        List of errors of the response.
+    ids : list
+        List of IDs of the items in the order of the request.
+
+    Returns
+    -------
+    positions : set
+        Set of positions in `ids`, or None, if any error cannot be
+        attributed to an item.
+
+    """
+    index = {}
+    for position, item_id in enumerate(ids):
+        index.setdefault(str(item_id), position)
+    positions = set()
+    for error in errors:
+        position = None
+        for field in ERROR_ID_FIELDS:
+            if error.get(field) is not None:
+                position = index.get(str(error[field]))
+                if position is not None:
+                    break
+        for field in ['Message', 'Details']:
+            if position is not None:
+                break
+            text = str(error.get(field) or '').strip()
+            position = index.get(text)
+            match = ERROR_POSITION.match(text)
+            if position is None and match and int(match.group(1)) < len(ids):
+                position = int(match.group(1))
+        if position is None:
+            return None
+        positions.add(position)
+    return positions
+
+
+class ChunkResult:
+    """Result of a request sending one chunk of items."""
+
+    def __init__(self, index, items, status_code, failed_items, elapsed):
+        self.index = index
+        self.items = items
+        self.status_code = status_code
+        self.failed_items = failed_items
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """Check if the request was accepted."""
+        return self.status_code in [200, 202]
+
+
+class BulkResult:
+    """Result of a bulk operation with per-chunk and per-item status."""
+
+    def __init__(self, operation, chunks, elapsed):
+        self.operation = operation
+        self.chunks = sorted(chunks, key=lambda chunk: chunk.index)
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        """Check if all chunks were accepted."""
+        return all(chunk.ok for chunk in self.chunks)
+
+    @property
+    def status_code(self):
+        """Get status code of the first failed chunk, or of the last one."""
+        for chunk in self.chunks:
+            if not chunk.ok:
+                return chunk.status_code
+        return self.chunks[-1].status_code if self.chunks else None
+
+    @property
+    def failed_chunks(self):
+        """Get list of chunks, which were not accepted."""
+        return [chunk for chunk in self.chunks if not chunk.ok]
+
+    @property
+    def succeeded_items(self):
+        """Get list of accepted items."""
+        return [item for chunk in self.chunks if chunk.ok
+                for item in chunk.items if item not in chunk.failed_items]
+
+    @property
+    def failed_items(self):
+        """Get list of not accepted items."""
+        return [item for chunk in self.chunks
+                for item in chunk.items
+                if not chunk.ok or item in chunk.failed_items]
+
+    def retry(self):
+        """
+        Send the failed chunks again.
+
+        Returns
+        -------
+        result : BulkResult
+            Result with the failed chunks replaced by their new results.
+
+        """
+        return self.operation.retry(self)
+
+
+class BulkOperation:
+    """
+    Send a list of items in chunks with concurrent POST requests.
+
+    """
+
+    def __init__(self, api, url, make_content, item_key=None,
+                 chunk_size=CHUNK_SIZE, workers=BULK_WORKERS):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to send the requests.
+        url : str
+            URL of the requests.
+        make_content : function
+            Function creating content of a request from a chunk of items.
+        item_key : function, optional
+            Function returning ID of an item, which the errors of
+            accepted requests refer to (see `error_positions`).
+            The default is None, i.e. the item itself.
+        chunk_size : int, optional
+            Maximal number of items per request.
+            The default is CHUNK_SIZE.
+        workers : int, optional
+            Maximal number of concurrent requests.
+            The default is BULK_WORKERS.
+
+        """
+        self.api = api
+        self.url = url
+        self.make_content = make_content
+        self.item_key = item_key or (lambda item: item)
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    def run(self, items):
+        """
+        Send all items.
+
+        Parameters
+        ----------
+        items : list
+            Items to send.
+
+        Returns
+        -------
+        result : BulkResult
+            Result of the operation.
+
+        """
+        chunks = [(index, items[i:i + self.chunk_size])
+                  for index, i in enumerate(range(0, len(items),
+                                                  self.chunk_size))]
+        start = time.perf_counter()
+        return BulkResult(self, self._send(chunks),
+                          time.perf_counter() - start)
+
+    def retry(self, result):
+        """
+        Send the failed chunks of a result again.
+
+        Parameters
+        ----------
+        result : BulkResult
+            Result of a previous run.
+
+        Returns
+        -------
+        result : BulkResult
+            Result with the failed chunks replaced by their new results.
+
+        """
+        failed = [(chunk.index, chunk.items) for chunk in result.failed_chunks]
+        if not failed:
+            return result
+        logger.info('Retry {} of {} chunks.'
+                    .format(len(failed), len(result.chunks)))
+        start = time.perf_counter()
+        retried = {chunk.index: chunk for chunk in self._send(failed)}
+        chunks = [retried.get(chunk.index, chunk) for chunk in result.chunks]
+        return BulkResult(self, chunks,
+                          result.elapsed + time.perf_counter() - start)
+
+    def _send(self, chunks):
+        """Send chunks concurrently."""
+        if len(chunks) <= 1 or self.workers <= 1:
+            return [self._send_chunk(index, items) for index, items in chunks]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(lambda chunk: self._send_chunk(*chunk),
+                                     chunks))
+
+    def _send_chunk(self, index, items):
+        """Send one chunk and check which of its items failed."""
+        start = time.perf_counter()
+        response = self.api.post(self.url, self.make_content(items))
+        elapsed = time.perf_counter() - start
+        if response is None:
+            return ChunkResult(index, items, None, [], elapsed)
+
+        failed_items = []
+        if response.status_code in [200, 202]:
+            try:
+                errors = response.json().get('Errors') or []
+            except Exception:
+                errors = []
+            if errors:
+                positions = error_positions(
+                    errors, [self.item_key(item) for item in items])
+                if positions is None:
+                    # errors of unknown items fail the whole chunk
+                    logger.warning('Errors of chunk {} cannot be attributed '
+                                   'to items: {}'.format(index, errors))
+                    failed_items = list(items)
+                else:
+                    failed_items = [items[position]
+                                    for position in sorted(positions)]
+        return ChunkResult(index, items, response.status_code, failed_items,
+                           elapsed)
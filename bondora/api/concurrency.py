@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""The file contains an adaptive concurrency controller of API requests."""
+
+import time
+import threading
+import api.urls
+from setup_logger import logger
+from setup_metrics import API_CONCURRENCY_LIMIT
+
+# initial number of concurrent requests per endpoint
+INITIAL_LIMIT = 2
+# lower and upper bounds of concurrent requests per endpoint
+MIN_LIMIT = 1
+MAX_LIMIT = 16
+# multiplicative decrease of the limit on throttling or rising latency
+DECREASE = 0.5
+# latency above this multiple of the baseline latency counts as congestion
+LATENCY_TOLERANCE = 2.0
+# smoothing factors of the recent and the baseline latency
+RECENT_ALPHA = 0.3
+BASELINE_ALPHA = 0.02
+# time critical endpoints, whose requests never wait for a slot
+EXEMPT_ENDPOINTS = (api.urls.URL_BONDORA_BUY_SM,)
+
+
+class EndpointLimit:
+    """State of the concurrency limit of one endpoint."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.inflight = 0
+        self.recent_latency = None
+        self.baseline_latency = None
+        self.last_decrease = 0.0
+        self.hold_until = 0.0
+        self.condition = threading.Condition()
+
+
+class ConcurrencyController:
+    """
+    AIMD controller of the number of concurrent requests per endpoint.
+
+    Every accepted response (200, 202) increases the limit of its
+    endpoint by `1 / limit`, i.e. by about one request per round trip
+    of all in-flight requests (additive increase). A throttled response
+    (429) or a recent latency above `latency_tolerance` times the
+    baseline latency multiplies the limit by `decrease` (multiplicative
+    decrease). Congestion signals of requests, which were in flight
+    together, cut the limit only once. Requests to `exempt` endpoints
+    (e.g. buys) are not limited.
+
+    Requests acquire a slot before sending and release it with the
+    outcome of the response::
+
+        controller.acquire(url)
+        ...
+        controller.release(url, status_code, latency)
+
+    """
+
+    def __init__(self, initial_limit=INITIAL_LIMIT, min_limit=MIN_LIMIT,
+                 max_limit=MAX_LIMIT, decrease=DECREASE,
+                 latency_tolerance=LATENCY_TOLERANCE,
+                 exempt=EXEMPT_ENDPOINTS):
+        """
+        Parameters
+        ----------
+        initial_limit : int, optional
+            Initial number of concurrent requests per endpoint.
+            The default is INITIAL_LIMIT.
+        min_limit : int, optional
+            Minimal number of concurrent requests per endpoint.
+            The default is MIN_LIMIT.
+        max_limit : int, optional
+            Maximal number of concurrent requests per endpoint.
+            The default is MAX_LIMIT.
+        decrease : float, optional
+            Factor of the limit on congestion. The default is DECREASE.
+        latency_tolerance : float, optional
+            Multiple of the baseline latency considered as congestion.
+            The default is LATENCY_TOLERANCE.
+        exempt : tuple, optional
+            Endpoints, whose requests are not limited.
+            The default is EXEMPT_ENDPOINTS.
+
+        """
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.exempt = set(exempt)
+        self.endpoints = {}
+        self.lock = threading.Lock()
+
+    def _endpoint(self, url):
+        """Get state of the endpoint of an URL."""
+        endpoint = api.urls.get_endpoint(url)
+        with self.lock:
+            state = self.endpoints.get(endpoint)
+            if state is None:
+                state = EndpointLimit(float(self.initial_limit))
+                self.endpoints[endpoint] = state
+                API_CONCURRENCY_LIMIT.labels(endpoint).set(state.limit)
+        return endpoint, state
+
+    def limit(self, url):
+        """
+        Get current number of allowed concurrent requests.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        limit : int
+            Number of concurrent requests to the endpoint of `url`.
+
+        """
+        return max(self.min_limit, int(self._endpoint(url)[1].limit))
+
+    def acquire(self, url, timeout=None):
+        """
+        Wait for a free slot of the endpoint.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None.
+
+        Returns
+        -------
+        acquired : bool
+            False, if the timeout expired or the endpoint is exempt,
+            i.e. no slot has to be released.
+
+        """
+        if api.urls.get_endpoint(url) in self.exempt:
+            return False
+        _, state = self._endpoint(url)
+        with state.condition:
+            acquired = state.condition.wait_for(
+                lambda: state.inflight < max(self.min_limit,
+                                             int(state.limit)),
+                timeout)
+            if acquired:
+                state.inflight += 1
+            return acquired
+
+    def release(self, url, status_code, latency=None, wait_time=None):
+        """
+        Release slot and adapt the limit to the outcome of the request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        status_code : int
+            Status code of the response, or None, if the request failed.
+        latency : float, optional
+            Latency of the request in seconds. The default is None.
+        wait_time : float, optional
+            Wait time in seconds demanded by a throttled response.
+            The limit does not grow until it is over. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        endpoint, state = self._endpoint(url)
+        with state.condition:
+            state.inflight = max(0, state.inflight - 1)
+            now = time.monotonic()
+            start = now - (latency or 0.0)
+            if status_code == 429:
+                self._decrease(endpoint, state, start, 'throttled')
+                if wait_time:
+                    state.hold_until = max(state.hold_until, now + wait_time)
+            elif status_code in [200, 202]:
+                if latency is not None and self._congested(state, latency):
+                    self._decrease(endpoint, state, start, 'latency')
+                elif (now >= state.hold_until
+                      and state.inflight + 1 >= int(state.limit)):
+                    # grow only if the limit is actually used
+                    state.limit = min(float(self.max_limit),
+                                      state.limit + 1.0 / state.limit)
+                    API_CONCURRENCY_LIMIT.labels(endpoint).set(state.limit)
+            state.condition.notify_all()
+
+    def _congested(self, state, latency):
+        """Update latency estimates and check for rising latency."""
+        if state.recent_latency is None:
+            state.recent_latency = latency
+            state.baseline_latency = latency
+            return False
+        state.recent_latency += RECENT_ALPHA * (latency
+                                                - state.recent_latency)
+        state.baseline_latency += BASELINE_ALPHA * (latency
+                                                    - state.baseline_latency)
+        return (state.recent_latency
+                > self.latency_tolerance * state.baseline_latency)
+
+    def _decrease(self, endpoint, state, start, reason):
+        """Cut the limit once per congestion event."""
+        # requests sent before the last decrease report the same event
+        if start < state.last_decrease:
+            return None
+        previous = int(state.limit)
+        state.limit = max(float(self.min_limit), state.limit * self.decrease)
+        state.last_decrease = time.monotonic()
+        # restart latency estimates at the new load
+        state.recent_latency = state.baseline_latency
+        API_CONCURRENCY_LIMIT.labels(endpoint).set(state.limit)
+        if int(state.limit) < previous:
+            logger.info('Concurrency limit of {} decreased to {} ({}).'
+                        .format(endpoint, int(state.limit), reason))
+
+    def stats(self):
+        """
+        Get current limits and in-flight requests of all endpoints.
+
+        Returns
+        -------
+        stats : dict
+            Dict of endpoints with tuples (limit, in-flight requests).
+
+        """
+        with self.lock:
+            endpoints = dict(self.endpoints)
+        return {endpoint: (max(self.min_limit, int(state.limit)),
+                           state.inflight)
+                for endpoint, state in endpoints.items()}
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""The file contains a background keeper of warm API connections."""
+
+import threading
+from setup_logger import logger
+
+# seconds between warm-up requests, shorter than idle timeouts of servers
+KEEP_WARM_INTERVAL = 30
+# number of connections kept warm
+WARM_CONNECTIONS = 2
+
+
+class ConnectionWarmer:
+    """
+    Keep connections to Bondora API open during quiet periods.
+
+    A daemon thread calls `BondoraApi.warm_up` at start and then
+    every `interval` seconds, so that the first request after a quiet
+    period does not pay for DNS lookup, TCP, and TLS handshakes.
+
+    """
+
+    def __init__(self, api, interval=KEEP_WARM_INTERVAL,
+                 connections=WARM_CONNECTIONS):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API, whose connections are kept warm.
+        interval : float, optional
+            Seconds between warm-up requests.
+            The default is KEEP_WARM_INTERVAL.
+        connections : int, optional
+            Number of connections kept warm.
+            The default is WARM_CONNECTIONS.
+
+        """
+        self.api = api
+        self.interval = interval
+        self.connections = connections
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Warm up connections now and keep them warm in background.
+
+        Returns
+        -------
+        warm : bool
+            True, if the connections were established at start.
+
+        """
+        warm = self.api.warm_up(self.connections)
+        if warm:
+            logger.info('{} connections to {} are warm.'
+                        .format(self.connections, self.api.url_api))
+        else:
+            logger.warning('Failed to warm up connections to {}.'
+                           .format(self.api.url_api))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run,
+                                           name='keep-warm',
+                                           daemon=True)
+            self.thread.start()
+        return warm
+
+    def stop(self):
+        """
+        Stop keeping connections warm.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stopped.set()
+
+    def _run(self):
+        """Send warm-up requests until stopped."""
+        while not self.stopped.wait(self.interval):
+            if not self.api.warm_up(self.connections):
+                logger.warning('Connections to {} are cold.'
+                               .format(self.api.url_api))
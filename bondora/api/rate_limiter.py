@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of a shared rate limiter."""
+
+import os
+import json
+import time
+import fcntl
+import api.urls
+from setup_logger import logger
+
+PATH_RATE_LIMITS = '/var/www/flask/bondora/rate_limits.json'
+
+# assumed limits of Bondora API as (number of requests, period in seconds),
+# a throttled request additionally blocks its endpoint for the reported
+# wait time
+RATE_LIMITS = {
+    api.urls.URL_BONDORA_BALANCE: (10, 60),
+    api.urls.URL_BONDORA_INVESTMENTS: (10, 60),
+    api.urls.URL_BONDORA_EVENTLOG: (10, 60),
+    api.urls.URL_BONDORA_AUCTIONS: (10, 60),
+    api.urls.URL_BONDORA_BID_AUCTION: (60, 60),
+    api.urls.ENDPOINT_GET_BID: (10, 60),
+    api.urls.URL_BONDORA_GET_BIDS: (10, 60),
+    api.urls.URL_BONDORA_SM: (10, 60),
+    api.urls.URL_LOAN_PARTS: (10, 60),
+    api.urls.URL_BONDORA_BUY_SM: (60, 60),
+    api.urls.URL_BONDORA_SELL_SM: (60, 60),
+    api.urls.URL_BONDORA_CANCEL_SM: (60, 60),
+    }
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter with the state shared across processes.
+
+    Each endpoint has its own bucket. The state of all buckets is kept
+    in a local JSON file protected by a file lock, so that all processes
+    on the same host (webhook listener workers, cron jobs) draw
+    from the same quota.
+
+    """
+
+    def __init__(self, path=PATH_RATE_LIMITS, limits=None):
+        self.path = path
+        self.limits = dict(RATE_LIMITS)
+        if limits:
+            self.limits.update(limits)
+
+    def _update(self, endpoint, update):
+        """
+        Update state of an endpoint bucket under exclusive file lock.
+
+        Parameters
+        ----------
+        endpoint : str
+            API endpoint.
+        update : function
+            Function receiving the current time and the endpoint state
+            as dict, modifying the state in place and returning a value.
+
+        Returns
+        -------
+        value : object
+            Value returned by `update`.
+
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), 'r+') as state_file:
+                content = state_file.read()
+                state = json.loads(content) if content else {}
+                endpoint_state = state.setdefault(
+                    endpoint, {'tat': 0.0, 'blocked_until': 0.0})
+                value = update(time.time(), endpoint_state)
+                state_file.seek(0)
+                state_file.truncate()
+                json.dump(state, state_file)
+            return value
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def reserve(self, url):
+        """
+        Reserve a request slot for the specified url.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        delay : float
+            Number of seconds to wait before sending the request.
+
+        """
+        endpoint = api.urls.get_endpoint(url)
+        if endpoint not in self.limits:
+            return 0.0
+        n_requests, period = self.limits[endpoint]
+        interval = period / n_requests
+        burst = (n_requests - 1) * interval
+
+        def update(now, endpoint_state):
+            # generic cell rate algorithm: `tat` is the theoretical
+            # arrival time of the next request with an empty bucket
+            tat = max(endpoint_state['tat'], now)
+            send_at = max(now, tat - burst, endpoint_state['blocked_until'])
+            endpoint_state['tat'] = max(tat, send_at) + interval
+            return send_at - now
+
+        try:
+            return self._update(endpoint, update)
+        except Exception as e:
+            logger.error(e)
+            return 0.0
+
+    def wait(self, url):
+        """
+        Block until a request to the specified url is allowed.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        None.
+
+        """
+        delay = self.reserve(url)
+        if delay > 0:
+            logger.info('Rate limit, wait {:.1f} s.'.format(delay))
+            time.sleep(delay)
+
+    def throttle(self, url, wait_time):
+        """
+        Block all requests to the url after a throttled request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the throttled request.
+        wait_time : int
+            Number of seconds to wait as reported by Bondora.
+
+        Returns
+        -------
+        None.
+
+        """
+        endpoint = api.urls.get_endpoint(url)
+
+        def update(now, endpoint_state):
+            endpoint_state['blocked_until'] = max(
+                endpoint_state['blocked_until'], now + wait_time)
+
+        try:
+            self._update(endpoint, update)
+        except Exception as e:
+            logger.error(e)
@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""The file contains compact record classes of Bondora payloads."""
+
+from enum import IntEnum
+from datetime import date
+
+
+class LoanStatus(IntEnum):
+    """Loan status codes of Bondora."""
+
+    CURRENT = 2
+    REPAID = 4
+    LATE_60 = 5
+    RELEASED = 8
+    OVERDUE = 100
+
+
+def parse_date(value):
+    """
+    Parse date of ISO format, e.g. '2021-03-01T00:00:00'.
+
+    Parameters
+    ----------
+    value : str
+        Date string or None.
+
+    Returns
+    -------
+    value : datetime.date
+        Parsed date or None.
+
+    """
+    if not value:
+        return None
+    return date.fromisoformat(value[:10])
+
+
+def parse_loan_status(value):
+    """Convert loan status code to LoanStatus, if known."""
+    try:
+        return LoanStatus(value)
+    except ValueError:
+        return value
+
+
+class Record:
+    """
+    Base class of compact records of Bondora payloads.
+
+    Fields listed in `FIELDS` are stored in slots, all other fields
+    of the payload in the dict `extra`. Values are accessible both as
+    attributes with snake case names and by the original keys
+    (`record['NextPaymentDate']`), so records can replace payload
+    dicts. Attributes of fields missing in the payload are None, but
+    access by key behaves like a dict, i.e. `key in record` is False,
+    `record[key]` raises KeyError, and `record.get(key, default)`
+    returns `default`. The original values of the fields listed in `PARSERS`
+    (e.g. date strings) are parsed on first access to the attributes
+    `<name>_value` (e.g. `record.next_payment_date_value`) and cached.
+
+    """
+
+    __slots__ = ('extra', 'missing')
+    FIELDS = {}
+    PARSERS = {}
+
+    def __init__(self, data):
+        fields = self.FIELDS
+        extra = None
+        for key, value in data.items():
+            name = fields.get(key)
+            if name is None:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+            else:
+                setattr(self, name, value)
+        # keys of fields not contained in the payload
+        missing = None
+        for key, name in fields.items():
+            if not hasattr(self, name):
+                setattr(self, name, None)
+                if missing is None:
+                    missing = set()
+                missing.add(key)
+        self.extra = extra
+        self.missing = missing
+
+    def __getitem__(self, key):
+        name = self.FIELDS.get(key)
+        if name is not None and (self.missing is None
+                                 or key not in self.missing):
+            return getattr(self, name)
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in self.FIELDS:
+            return self.missing is None or key not in self.missing
+        return self.extra is not None and key in self.extra
+
+    def __repr__(self):
+        return '{}({!r})'.format(type(self).__name__, self.to_dict())
+
+    def get(self, key, default=None):
+        """Get value by original key with default like dict.get."""
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """Convert record back to payload dict."""
+        data = {}
+        for key, name in self.FIELDS.items():
+            if self.missing is not None and key in self.missing:
+                continue
+            value = getattr(self, name)
+            data[key] = value.to_dict() if isinstance(value, Record) else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_list(cls, items):
+        """Convert list of payload dicts to list of records."""
+        return [cls(item) for item in items]
+
+
+def _record_class(name, fields, parsers, doc):
+    """
+    Create record class with slots for the fields.
+
+    Parsed values are cached in the slots `_<name>_value` and
+    returned by properties `<name>_value`.
+
+    """
+    namespace = {'__doc__': doc,
+                 'FIELDS': fields,
+                 'PARSERS': parsers}
+    slots = list(fields.values())
+    for field in parsers:
+        cache = '_{}_value'.format(field)
+        slots.append(cache)
+
+        def parsed(self, field=field, cache=cache):
+            try:
+                return getattr(self, cache)
+            except AttributeError:
+                value = self.PARSERS[field](getattr(self, field))
+                setattr(self, cache, value)
+                return value
+
+        namespace[field + '_value'] = property(parsed)
+    namespace['__slots__'] = tuple(slots)
+    return type(name, (Record,), namespace)
+
+
+def _snake_case(key):
+    """Convert key like 'NextPaymentDate' to 'next_payment_date'."""
+    name = ''
+    for i, char in enumerate(key):
+        if char.isupper() and i > 0 and not key[i - 1].isupper():
+            name += '_'
+        name += char.lower()
+    return name
+
+
+def _fields(*keys):
+    """Map payload keys to attribute names."""
+    return {key: _snake_case(key) for key in keys}
+
+
+SecondaryMarketItem = _record_class(
+    'SecondaryMarketItem',
+    _fields('Id', 'LoanPartId', 'LoanId', 'AuctionId', 'Amount', 'Price',
+            'DesiredDiscountRate', 'Interest', 'Rating', 'Country',
+            'LoanStatusCode', 'NextPaymentNr', 'NextPaymentDate',
+            'NrOfScheduledPayments', 'LateAmountTotal', 'PrincipalRemaining',
+            'ReScheduledOn', 'DebtOccuredOn', 'DebtOccuredOnForSecondary',
+            'ListedInSecondMarketOn', 'DebtManagmentEvents', 'LoanTransfers'),
+    {'next_payment_date': parse_date,
+     're_scheduled_on': parse_date,
+     'debt_occured_on': parse_date,
+     'debt_occured_on_for_secondary': parse_date,
+     'listed_in_second_market_on': parse_date,
+     'loan_status_code': parse_loan_status},
+    'Record of an item offered on secondary market.')
+
+Investment = _record_class(
+    'Investment',
+    _fields('LoanPartId', 'LoanId', 'AuctionId', 'Amount', 'Interest',
+            'Rating', 'Country', 'LoanStatusCode',
+            'LoanDebtManagementStageType', 'NextPaymentNr', 'NextPaymentDate',
+            'NextPaymentSum', 'NrOfScheduledPayments', 'LastPaymentDate',
+            'PrincipalRepaid', 'PrincipalRemaining', 'LateAmountTotal',
+            'PurchasePrice', 'SalePrice', 'ListedInSecondMarketOn',
+            'ReScheduledOn', 'DebtOccuredOn', 'DebtOccuredOnForSecondary'),
+    {'next_payment_date': parse_date,
+     'last_payment_date': parse_date,
+     'listed_in_second_market_on': parse_date,
+     're_scheduled_on': parse_date,
+     'debt_occured_on': parse_date,
+     'debt_occured_on_for_secondary': parse_date,
+     'loan_status_code': parse_loan_status},
+    'Record of an investment of the account.')
+
+LoanPart = _record_class(
+    'LoanPart',
+    _fields('LoanPartId', 'LoanId', 'AuctionId', 'Amount', 'Interest',
+            'Rating', 'Country', 'Status', 'LoanStatusCode',
+            'PrincipalRemaining', 'NextPaymentNr', 'NextPaymentDate',
+            'NrOfScheduledPayments', 'LastPaymentDate', 'DebtOccuredOn',
+            'DebtManagmentEvents', 'LoanTransfers'),
+    {'next_payment_date': parse_date,
+     'last_payment_date': parse_date,
+     'debt_occured_on': parse_date,
+     'loan_status_code': parse_loan_status},
+    'Record of loan part info.')
+
+
+class WebhookEvent(Record):
+    """
+    Record of a webhook notification.
+
+    The payload of secondary market events is converted to
+    SecondaryMarketItem.
+
+    """
+
+    __slots__ = ('event_type', 'payload')
+    FIELDS = {'EventType': 'event_type', 'Payload': 'payload'}
+
+    def __init__(self, data):
+        Record.__init__(self, data)
+        if (isinstance(self.payload, dict)
+                and str(self.event_type).startswith('secondmarket.')):
+            self.payload = SecondaryMarketItem(self.payload)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of a response cache."""
+
+import json
+import time
+import threading
+from collections import OrderedDict
+import api.urls
+
+# maximal number of cached responses
+CACHE_SIZE = 256
+
+# time to live of cached responses in seconds per endpoint,
+# responses of other endpoints are not cached
+CACHE_TTLS = {
+    api.urls.URL_BONDORA_BALANCE: 10,
+    api.urls.URL_BONDORA_INVESTMENTS: 60,
+    api.urls.ENDPOINT_GET_BID: 10,
+    api.urls.URL_LOAN_PARTS: 60,
+    }
+
+# endpoints with responses changed by successful POST requests
+CACHE_INVALIDATIONS = {
+    api.urls.URL_BONDORA_BUY_SM: [api.urls.URL_BONDORA_BALANCE,
+                                  api.urls.URL_BONDORA_INVESTMENTS,
+                                  api.urls.URL_BONDORA_SM,
+                                  api.urls.URL_LOAN_PARTS],
+    api.urls.URL_BONDORA_SELL_SM: [api.urls.URL_BONDORA_INVESTMENTS,
+                                   api.urls.URL_BONDORA_SM,
+                                   api.urls.URL_LOAN_PARTS],
+    api.urls.URL_BONDORA_CANCEL_SM: [api.urls.URL_BONDORA_INVESTMENTS,
+                                     api.urls.URL_BONDORA_SM,
+                                     api.urls.URL_LOAN_PARTS],
+    api.urls.URL_BONDORA_BID_AUCTION: [api.urls.URL_BONDORA_BALANCE,
+                                       api.urls.ENDPOINT_GET_BID,
+                                       api.urls.URL_BONDORA_GET_BIDS],
+    }
+
+
+class ResponseCache:
+    """
+    Bounded cache of decoded responses with time to live and LRU eviction.
+
+    Responses are cached per url, URL parameters and content of
+    the request. The cached objects are returned as they are, so they
+    must not be modified by the caller.
+
+    """
+
+    def __init__(self, maxsize=CACHE_SIZE, ttls=None,
+                 invalidations=CACHE_INVALIDATIONS):
+        self.maxsize = maxsize
+        self.ttls = dict(CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.invalidations = invalidations
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _key(url, params, content):
+        """Create cache key of a request."""
+        return (api.urls.get_endpoint(url),
+                url,
+                json.dumps(params, sort_keys=True, default=str),
+                json.dumps(content, sort_keys=True, default=str))
+
+    def cacheable(self, url):
+        """
+        Check if responses of the url are cached.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+
+        Returns
+        -------
+        cacheable : bool
+            True, if time to live is defined for the endpoint of the url.
+
+        """
+        return api.urls.get_endpoint(url) in self.ttls
+
+    def get(self, url, params=None, content=None):
+        """
+        Get cached response of a request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        params : dict, optional
+            Parameters passed in URL. The default is None.
+        content : dict, optional
+            Content sent in the request. The default is None.
+
+        Returns
+        -------
+        response_json : dict
+            Cached decoded response, or None if not cached or expired.
+
+        """
+        key = self._key(url, params, content)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, url, response_json, params=None, content=None):
+        """
+        Cache response of a request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        response_json : dict
+            Decoded response.
+        params : dict, optional
+            Parameters passed in URL. The default is None.
+        content : dict, optional
+            Content sent in the request. The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        key = self._key(url, params, content)
+        expires = time.monotonic() + self.ttls[key[0]]
+        with self.lock:
+            self.entries[key] = (expires, response_json)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, *endpoints):
+        """
+        Remove cached responses of the endpoints.
+
+        Parameters
+        ----------
+        *endpoints : str
+            API endpoints. All responses are removed, if not provided.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            if not endpoints:
+                self.entries.clear()
+                return None
+            for key in [key for key in self.entries if key[0] in endpoints]:
+                del self.entries[key]
+
+    def invalidate_after(self, url):
+        """
+        Remove cached responses changed by a successful POST request.
+
+        Parameters
+        ----------
+        url : str
+            URL of the POST request.
+
+        Returns
+        -------
+        None.
+
+        """
+        endpoints = self.invalidations.get(api.urls.get_endpoint(url))
+        if endpoints:
+            self.invalidate(*endpoints)
+
+    def stats(self):
+        """
+        Get statistics of the cache.
+
+        Returns
+        -------
+        stats : dict
+            Numbers of hits, misses, evictions, and cached responses.
+
+        """
+        with self.lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self.entries)}
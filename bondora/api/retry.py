@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""The file contains classes for scheduling retries of Bondora API requests."""
+
+import random
+import threading
+import api.urls
+from concurrent.futures import ThreadPoolExecutor, Future
+from setup_logger import logger
+from setup_metrics import API_RETRIES
+
+# status codes of responses worth to retry, None means no response
+RETRY_STATUS_CODES = (None, 429, 500, 502, 503, 504)
+# maximal number of concurrently executed attempts
+RETRY_WORKERS = 4
+
+
+class RetryPolicy:
+    """
+    Policy of retrying requests to one endpoint.
+
+    The delay before the attempt `n + 1` is `backoff * factor ** (n - 1)`
+    seconds limited by `max_delay`, or the wait time demanded by a
+    throttled response (429), if `retry_after` is set. The delay is
+    randomly increased by up to `jitter` (fraction of the delay), so
+    that retries of concurrent callers do not hit the API at once.
+
+    """
+
+    def __init__(self, max_attempts=3, backoff=5, factor=4, max_delay=120,
+                 jitter=0.2, retry_after=True,
+                 status_codes=RETRY_STATUS_CODES):
+        """
+        Parameters
+        ----------
+        max_attempts : int, optional
+            Maximal number of attempts including the first one.
+            The default is 3.
+        backoff : float, optional
+            Delay in seconds before the second attempt. The default is 5.
+        factor : float, optional
+            Factor of the delay between following attempts.
+            The default is 4.
+        max_delay : float, optional
+            Maximal delay in seconds. The default is 120.
+        jitter : float, optional
+            Maximal random increase of the delay as fraction of it.
+            The default is 0.2.
+        retry_after : bool, optional
+            Wait as long as demanded by throttled responses.
+            The default is True.
+        status_codes : tuple, optional
+            Status codes of responses to retry.
+            The default is RETRY_STATUS_CODES.
+
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.retry_after = retry_after
+        self.status_codes = status_codes
+
+    def should_retry(self, attempt, status_code):
+        """
+        Check if a failed attempt has to be retried.
+
+        Parameters
+        ----------
+        attempt : int
+            Number of the failed attempt starting from 1.
+        status_code : int
+            Status code of the response or None.
+
+        Returns
+        -------
+        retry : bool
+            True, if another attempt is allowed.
+
+        """
+        return (attempt < self.max_attempts
+                and status_code in self.status_codes)
+
+    def delay(self, attempt, wait_time=None):
+        """
+        Get delay before the next attempt.
+
+        Parameters
+        ----------
+        attempt : int
+            Number of the failed attempt starting from 1.
+        wait_time : float, optional
+            Wait time demanded by a throttled response. The default is None.
+
+        Returns
+        -------
+        delay : float
+            Delay in seconds.
+
+        """
+        if wait_time is not None and self.retry_after:
+            delay = wait_time
+        else:
+            delay = min(self.backoff * self.factor ** (attempt - 1),
+                        self.max_delay)
+        return delay * (1 + random.uniform(0, self.jitter))
+
+
+# policy of endpoints without own policy
+DEFAULT_POLICY = RetryPolicy()
+# policies per endpoint
+RETRY_POLICIES = {
+    # buys are time critical, an item is usually sold before a retry
+    api.urls.URL_BONDORA_BUY_SM: RetryPolicy(max_attempts=1),
+    api.urls.URL_BONDORA_SELL_SM: RetryPolicy(max_attempts=2, backoff=60),
+    api.urls.URL_BONDORA_CANCEL_SM: RetryPolicy(max_attempts=2, backoff=60),
+    }
+
+
+class RetryScheduler:
+    """
+    Retry failed requests without blocking the calling thread.
+
+    Attempts are executed by a thread pool. After a failed attempt,
+    the next one is scheduled by a timer according to the policy of
+    the endpoint, so no thread sleeps while waiting. The caller gets
+    a future of the result of the last attempt.
+
+    """
+
+    def __init__(self, policies=None, default_policy=DEFAULT_POLICY,
+                 workers=RETRY_WORKERS):
+        """
+        Parameters
+        ----------
+        policies : dict, optional
+            Retry policies per endpoint. The default is None,
+            i.e. RETRY_POLICIES.
+        default_policy : RetryPolicy object, optional
+            Policy of endpoints without own policy.
+            The default is DEFAULT_POLICY.
+        workers : int, optional
+            Maximal number of concurrently executed attempts.
+            The default is RETRY_WORKERS.
+
+        """
+        self.policies = RETRY_POLICIES if policies is None else policies
+        self.default_policy = default_policy
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='retry')
+
+    def policy(self, url):
+        """Get retry policy of the endpoint of an URL."""
+        return self.policies.get(api.urls.get_endpoint(url),
+                                 self.default_policy)
+
+    def call(self, url, attempt, method='GET'):
+        """
+        Execute a request with retries.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        attempt : function
+            Function of the result of the previous attempt (None for
+            the first one) returning a tuple (result, status_code,
+            wait_time) of the new attempt.
+        method : str, optional
+            HTTP method of the request. The default is 'GET'.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of the result of the last attempt.
+
+        """
+        future = Future()
+        self.executor.submit(self._attempt, future, url, attempt, method, 1,
+                             None)
+        return future
+
+    def resume(self, url, attempt, outcome, method='GET'):
+        """
+        Retry a request, whose first attempt is already done.
+
+        Parameters
+        ----------
+        url : str
+            URL of the request.
+        attempt : function
+            Function of the result of the previous attempt returning
+            a tuple (result, status_code, wait_time) of the new attempt.
+        outcome : tuple
+            Tuple (result, status_code, wait_time) of the first attempt.
+        method : str, optional
+            HTTP method of the request. The default is 'GET'.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of the result of the last attempt.
+
+        """
+        future = Future()
+        self._schedule(future, url, attempt, method, 1, outcome)
+        return future
+
+    def shutdown(self, wait=True):
+        """
+        Stop executing attempts.
+
+        Parameters
+        ----------
+        wait : bool, optional
+            Wait for running attempts. The default is True.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.executor.shutdown(wait=wait)
+
+    def _attempt(self, future, url, attempt, method, n, previous):
+        """Execute attempt `n` and schedule the next one, if required."""
+        try:
+            outcome = attempt(previous)
+        except Exception as e:
+            logger.error(e)
+            future.set_exception(e)
+            return None
+        self._schedule(future, url, attempt, method, n, outcome)
+
+    def _schedule(self, future, url, attempt, method, n, outcome):
+        """Resolve future or start timer of the next attempt."""
+        result, status_code, wait_time = outcome
+        policy = self.policy(url)
+        if (status_code in [200, 202]
+                or not policy.should_retry(n, status_code)):
+            future.set_result(result)
+            return None
+
+        delay = policy.delay(n, wait_time)
+        logger.info('Retry {} {} in {:.1f} s (attempt {} of {}).'
+                    .format(method, url, delay, n + 1, policy.max_attempts))
+
+        def submit():
+            API_RETRIES.labels(method, api.urls.get_endpoint(url)).inc()
+            try:
+                self.executor.submit(self._attempt, future, url, attempt,
+                                     method, n + 1, result)
+            except RuntimeError as e:
+                # executor is shut down
+                future.set_exception(e)
+
+        # the timer is no daemon, so scripts wait for pending retries
+        timer = threading.Timer(delay, submit)
+        timer.start()
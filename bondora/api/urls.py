@@ -8,6 +8,7 @@ URL_BONDORA_EVENTLOG = 'api/v1/eventlog'
 URL_BONDORA_AUCTIONS = 'api/v1/auctions'
 URL_BONDORA_BID_AUCTION = 'api/v1/bid'
 URL_BONDORA_GET_BID = 'api/v1/bid'
+URL_BONDORA_GET_BIDS = 'api/v1/bids'
 URL_BONDORA_SM = 'api/v1/secondarymarket'
 URL_LOAN_PARTS = 'api/v1/loanpart/list'
 URL_BONDORA_BUY_SM = 'api/v1/secondarymarket/buy'
@@ -16,3 +17,50 @@ URL_BONDORA_CANCEL_SM = 'api/v1/secondarymarket/cancel'
 
 URL_BONDORA_AUTH = 'https://api.bondora.com/Authentication/FormsAuthenticate'
 URL_BONDORA_BUTTON = 'https://api.bondora.com/Application/PingWebHook'
+
+# endpoint of the status of a single bid, which shares its path with
+# the POST endpoint of bids, but has its own rate limit
+ENDPOINT_GET_BID = URL_BONDORA_GET_BID + '/<Id>'
+# endpoints addressing a resource by Id as the last path segment
+ID_ENDPOINTS = {URL_BONDORA_GET_BID: ENDPOINT_GET_BID}
+
+
+# relative endpoints sorted from the most to the least specific one
+ENDPOINTS = sorted({URL_BONDORA_BALANCE,
+                    URL_BONDORA_INVESTMENTS,
+                    URL_BONDORA_EVENTLOG,
+                    URL_BONDORA_AUCTIONS,
+                    URL_BONDORA_BID_AUCTION,
+                    URL_BONDORA_GET_BID,
+                    URL_BONDORA_GET_BIDS,
+                    URL_BONDORA_SM,
+                    URL_LOAN_PARTS,
+                    URL_BONDORA_BUY_SM,
+                    URL_BONDORA_SELL_SM,
+                    URL_BONDORA_CANCEL_SM},
+                   key=len, reverse=True)
+
+
+def get_endpoint(url):
+    """
+    Get API endpoint of the specified url.
+
+    Parameters
+    ----------
+    url : str
+        URL of the request relative to URL_BONDORA_API,
+        e.g. 'api/v1/bid/<Id>'.
+
+    Returns
+    -------
+    endpoint : str
+        Matching endpoint from this collection, e.g. 'api/v1/bid/<Id>',
+        or `url` itself, if no endpoint matches.
+
+    """
+    for endpoint in ENDPOINTS:
+        if url == endpoint:
+            return endpoint
+        if url.startswith(endpoint + '/'):
+            return ID_ENDPOINTS.get(endpoint, endpoint)
+    return url
@@ -14,6 +14,9 @@ sys.path.insert(0, parentdir)
 
 from setup_logger import logger
 from trading.bondora_trading import BondoraTrading
+from api.rate_limiter import RateLimiter
+from api.concurrency import ConcurrencyController
+from trading.portfolio_store import PortfolioStore
 
 PATH_SETTINGS = '/var/www/flask/bondora/settings.cfg'
 
@@ -55,17 +58,19 @@ def offer_green_loans(token, max_price, min_price=None, retry=True):
 
     """
     # initialize trading object
-    bt = BondoraTrading(token)
-
-    # calcel loans with current loans status offered on secondary market
-    bt.cancel_sm_offers(retry=retry,
-                        LoanStatusCode=2)
-
-    # place loans with current loans status on  secondary market for selling
-    bt.place_sm_offers(max_price=max_price,
-                       min_price=min_price,
-                       retry=retry,
-                       LoanStatusCode=2)
+    # share request quota with the webhook listener and other jobs,
+    # load only the investments changed since the last run
+    bt = BondoraTrading(token,
+                        rate_limiter=RateLimiter(),
+                        concurrency=ConcurrencyController(),
+                        portfolio=PortfolioStore())
+
+    # offer loans with current loans status on secondary market for selling,
+    # only offers with changed prices are canceled and placed again
+    bt.reconcile_sm_offers(max_price=max_price,
+                           min_price=min_price,
+                           retry=retry,
+                           LoanStatusCode=2)
 
 
 if __name__ == "__main__":
@@ -15,6 +15,9 @@ sys.path.insert(0, parentdir)
 
 from setup_logger import logger
 from trading.bondora_trading import BondoraTrading
+from api.rate_limiter import RateLimiter
+from api.concurrency import ConcurrencyController
+from trading.portfolio_store import PortfolioStore
 
 PATH_SETTINGS = '/var/www/flask/bondora/settings.cfg'
 
@@ -54,24 +57,24 @@ def offer_red_loans(token, price, retry=True):
 
     """
     # initialize trading object
-    bt = BondoraTrading(token)
-
-    # calcel secondary market offering of loans
+    # share request quota with the webhook listener and other jobs,
+    # load only the investments changed since the last run
+    bt = BondoraTrading(token,
+                        rate_limiter=RateLimiter(),
+                        concurrency=ConcurrencyController(),
+                        portfolio=PortfolioStore())
+
+    # offer loans on secondary market for selling
     # with defaulted loans status
     # and latest debt management stage type of write off
-    # and last payment date not within last 12 months
+    # and last payment date not within last 12 months,
+    # only offers with changed prices are canceled and placed again
     last_payment = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
-    bt.cancel_sm_offers(retry=retry,
-                        LoanStatusCode=5,
-                        LoanDebtManagementStageType=3,
-                        LastPaymentDateTo=last_payment)
-
-    # place these loans on secondary market for selling
-    bt.place_sm_offers(max_price=price,
-                       retry=retry,
-                       LoanStatusCode=5,
-                       LoanDebtManagementStageType=3,
-                       LastPaymentDateTo=last_payment)
+    bt.reconcile_sm_offers(max_price=price,
+                           retry=retry,
+                           LoanStatusCode=5,
+                           LoanDebtManagementStageType=3,
+                           LastPaymentDateTo=last_payment)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,70 @@
+#!/opt/miniconda3/envs/flask/bin/python
+# -*- coding: utf-8 -*-
+"""Example how to scan bondora's secondary market for missed loans."""
+
+import os
+import sys
+import inspect
+import configparser
+
+currentdir = os.path.dirname(
+    os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+from setup_logger import logger
+from trading.bondora_trading import BondoraTrading
+from api.rate_limiter import RateLimiter
+from api.concurrency import ConcurrencyController
+
+PATH_SETTINGS = '/var/www/flask/bondora/settings.cfg'
+
+max_price = 5 # maximal price of scanned loans (5 EUR)
+
+
+# read configuration
+try:
+    logger.info('Reading configuration from {}...'.format(PATH_SETTINGS))
+    config = configparser.ConfigParser()
+    config.read_file(open(PATH_SETTINGS))
+
+    TOKEN = config.get('BONDORA', 'TOKEN')
+
+except Exception as e:
+    logger.critical(e)
+    sys.exit(-1)
+
+
+def scan_sm_loans(token, max_price, retry=True):
+    """
+    Buy loans on bondora's secondary market satisfying buying strategies.
+
+    Parameters
+    ----------
+    token : str
+        Access token.
+    max_price : int
+        Maximal price of loans to scan.
+    retry : bool, optional
+            Retry to execute the underlying methods, if too many requests.
+            The default is True.
+
+    Returns
+    -------
+    None.
+
+    """
+    # initialize trading object
+    # share request quota with the webhook listener and other jobs
+    bt = BondoraTrading(token,
+                        rate_limiter=RateLimiter(),
+                        concurrency=ConcurrencyController())
+
+    # evaluate all buying strategies on all offered loans
+    # not more expensive than max_price and buy the selected ones
+    bt.scan_sm(retry=retry,
+               PriceTo=max_price)
+
+
+if __name__ == "__main__":
+    scan_sm_loans(TOKEN, max_price)
@@ -5,6 +5,8 @@ import os
 import sys
 import inspect
 import json
+import time
+import hmac
 import configparser
 from flask import Flask, request, Response
 
@@ -14,7 +16,13 @@ parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
 from setup_logger import logger
+from setup_metrics import WEBHOOK_EVENTS, WEBHOOK_LATENCY, export_metrics
 from trading.bondora_trading import BondoraTrading
+from api.rate_limiter import RateLimiter
+from api.retry import RetryScheduler
+from api.concurrency import ConcurrencyController
+from api.keep_warm import ConnectionWarmer
+from trading.seen_items import SeenItems
 
 
 PATH_SETTINGS = '/var/www/flask/bondora/settings.cfg'
@@ -28,11 +36,77 @@ try:
 
     TOKEN = config.get('BONDORA', 'TOKEN')
 
+    # connection pool settings
+    POOL_CONNECTIONS = config.getint('SESSION', 'POOL_CONNECTIONS',
+                                     fallback=10)
+    POOL_MAXSIZE = config.getint('SESSION', 'POOL_MAXSIZE', fallback=10)
+    TIMEOUT = (config.getfloat('SESSION', 'CONNECT_TIMEOUT', fallback=3.05),
+               config.getfloat('SESSION', 'READ_TIMEOUT', fallback=30))
+    # connection keep-warm settings, interval 0 disables keep-warm
+    KEEP_WARM_INTERVAL = config.getfloat('SESSION', 'KEEP_WARM_INTERVAL',
+                                         fallback=30)
+    WARM_CONNECTIONS = config.getint('SESSION', 'WARM_CONNECTIONS',
+                                     fallback=2)
+    # adaptive limits of concurrent requests per endpoint, buys are exempt
+    INITIAL_CONCURRENCY = config.getint('SESSION', 'INITIAL_CONCURRENCY',
+                                        fallback=8)
+    MIN_CONCURRENCY = config.getint('SESSION', 'MIN_CONCURRENCY',
+                                    fallback=2)
+    MAX_CONCURRENCY = config.getint('SESSION', 'MAX_CONCURRENCY',
+                                    fallback=16)
+    # maximal number of concurrently executed retries
+    RETRY_WORKERS = config.getint('SESSION', 'RETRY_WORKERS', fallback=4)
+
+    # buy coalescing settings
+    BUY_WINDOW = config.getfloat('TRADING', 'BUY_WINDOW', fallback=0)
+    BUY_BATCH_SIZE = config.getint('TRADING', 'BUY_BATCH_SIZE',
+                                   fallback=100)
+    # index of decisions about seen items
+    SEEN_SIZE = config.getint('TRADING', 'SEEN_SIZE', fallback=10000)
+    SEEN_TTL = config.getfloat('TRADING', 'SEEN_TTL', fallback=3600)
+    # seconds between synchronizations of the balance ledger
+    BALANCE_SYNC_INTERVAL = config.getfloat('TRADING',
+                                            'BALANCE_SYNC_INTERVAL',
+                                            fallback=300)
+    # bid on auctions of webhooks and sweeps, off by default
+    AUCTION_BIDDING = config.getboolean('TRADING', 'AUCTION_BIDDING',
+                                        fallback=False)
+    # seconds between sweeps of active auctions, 0 disables sweeps
+    AUCTION_SWEEP_INTERVAL = config.getfloat('TRADING',
+                                             'AUCTION_SWEEP_INTERVAL',
+                                             fallback=0)
+
+    # credentials of the metrics route, empty user disables the route
+    METRICS_USER = config.get('METRICS', 'USER', fallback='')
+    METRICS_PASSWORD = config.get('METRICS', 'PASSWORD', fallback='')
+
 except Exception as e:
     logger.critical(e)
     sys.exit(-1)
 
-trading = BondoraTrading(TOKEN)
+trading = BondoraTrading(TOKEN,
+                         pool_connections=POOL_CONNECTIONS,
+                         pool_maxsize=POOL_MAXSIZE,
+                         timeout=TIMEOUT,
+                         rate_limiter=RateLimiter(),
+                         retry_scheduler=RetryScheduler(workers=RETRY_WORKERS),
+                         concurrency=ConcurrencyController(
+                             INITIAL_CONCURRENCY, MIN_CONCURRENCY,
+                             MAX_CONCURRENCY),
+                         buy_window=BUY_WINDOW,
+                         buy_batch_size=BUY_BATCH_SIZE,
+                         seen=SeenItems(SEEN_SIZE, SEEN_TTL))
+trading.ledger.sync_interval = BALANCE_SYNC_INTERVAL
+# seed the balance ledger before the first webhook
+trading.ledger.sync('initial')
+
+# bid on auctions missed by webhooks and track outstanding bids
+if AUCTION_BIDDING and AUCTION_SWEEP_INTERVAL:
+    trading.bidder.start(AUCTION_SWEEP_INTERVAL)
+
+# open connections at startup and keep them warm during quiet periods
+if KEEP_WARM_INTERVAL:
+    ConnectionWarmer(trading, KEEP_WARM_INTERVAL, WARM_CONNECTIONS).start()
 
 app = Flask(__name__)
 
@@ -48,11 +122,15 @@ def responder():
             Response object that is used by default in Flask.
 
     """
+    start = time.perf_counter()
     response = Response(status=200)
     try:
         loan_data = request.get_json(force=True, silent=True)
-        trading.buy_red_loan(loan_data)
-        trading.buy_green_loan(loan_data)
+        WEBHOOK_EVENTS.labels(
+            (loan_data or {}).get('EventType', 'unknown')).inc()
+        trading.buy_loan(loan_data)
+        if AUCTION_BIDDING:
+            trading.bid_loan(loan_data)
         # comment next three lines to avoid the saving of loan info
         with open(PATH_DATA + '/data_{}.json'.format(USER_NAME[0:5]),
                   'w', encoding='utf-8') as outfile:
@@ -62,4 +140,34 @@ def responder():
         logger.critical(e)
         response = Response(status=400)
 
+    WEBHOOK_LATENCY.observe(time.perf_counter() - start)
     return response
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Expose metrics of API requests and webhooks for Prometheus.
+
+    The route requires HTTP basic authentication with the credentials
+    of the `[METRICS]` section of the settings and is disabled,
+    if no user is set.
+
+    Returns
+    -------
+    response : flask.Response object
+            Metrics in Prometheus text format.
+
+    """
+    if not METRICS_USER:
+        return Response(status=404)
+    auth = request.authorization
+    if (auth is None
+            or not hmac.compare_digest((auth.username or '').encode(),
+                                       METRICS_USER.encode())
+            or not hmac.compare_digest((auth.password or '').encode(),
+                                       METRICS_PASSWORD.encode())):
+        return Response(status=401,
+                        headers={'WWW-Authenticate': 'Basic realm="metrics"'})
+    content, content_type = export_metrics()
+    return Response(content, mimetype=content_type)
@@ -0,0 +1,452 @@
+#!/opt/miniconda3/envs/flask/bin/python
+# -*- coding: utf-8 -*-
+"""Local stand-in of Bondora API for offline benchmarking."""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import inspect
+import argparse
+import threading
+from datetime import datetime, timedelta
+import requests
+from flask import Flask, request, jsonify
+
+currentdir = os.path.dirname(
+    os.path.abspath(inspect.getfile(inspect.currentframe())))
+parentdir = os.path.dirname(currentdir)
+sys.path.insert(0, parentdir)
+
+import api.urls
+from setup_logger import logger
+
+# default limits as (number of requests, period in seconds) per endpoint
+MOCK_RATE_LIMITS = {
+    api.urls.URL_BONDORA_INVESTMENTS: (10, 60),
+    api.urls.URL_BONDORA_SM: (10, 60),
+    api.urls.URL_BONDORA_EVENTLOG: (10, 60),
+    }
+
+
+class MockBondora:
+    """
+    State and behaviour of the mock Bondora API.
+
+    Parameters
+    ----------
+    latency : float, optional
+        Mean latency of responses in seconds. The default is 0.
+    jitter : float, optional
+        Maximal random deviation of the latency in seconds.
+        The default is 0.
+    rate_limits : dict, optional
+        Limits as (number of requests, period in seconds) per endpoint.
+        The default is None, i.e. no throttling.
+    data : dict, optional
+        Recorded payloads with the keys 'investments', 'secondarymarket',
+        'auctions', and 'balance'. The default is None, i.e. synthetic
+        payloads are generated.
+    n_items : int, optional
+        Number of synthetic investments and secondary market items.
+        The default is 1000.
+    seed : int, optional
+        Seed of the random generator. The default is None.
+
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, rate_limits=None, data=None,
+                 n_items=1000, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limits = rate_limits or {}
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.eventlog = []
+        self.bids = []
+        data = data or {}
+        self.balance = data.get('balance', 1000.0)
+        self.investments = data.get('investments') or [
+            self.synthetic_investment() for _ in range(n_items)]
+        self.sm = data.get('secondarymarket') or [
+            self.synthetic_sm_item() for _ in range(n_items)]
+        self.auctions = data.get('auctions') or []
+
+    def synthetic_investment(self):
+        """Generate synthetic investment."""
+        today = datetime.now()
+        status = self.random.choice([2, 2, 2, 2, 5, 100])
+        return {
+            'LoanPartId': str(uuid.UUID(int=self.random.getrandbits(128))),
+            'LoanId': str(uuid.UUID(int=self.random.getrandbits(128))),
+            'Amount': round(self.random.uniform(1, 50), 2),
+            'Interest': round(self.random.uniform(8, 40), 2),
+            'LoanStatusCode': status,
+            'LoanDebtManagementStageType': 3 if status == 5 else None,
+            'NextPaymentNr': self.random.randint(1, 60),
+            'NextPaymentDate': (today + timedelta(
+                days=self.random.randint(0, 30))).strftime(
+                    '%Y-%m-%dT00:00:00'),
+            'NrOfScheduledPayments': self.random.choice([36, 48, 60]),
+            'PrincipalRemaining': round(self.random.uniform(0.5, 50), 2),
+            'LateAmountTotal': 0.0 if status == 2 else round(
+                self.random.uniform(1, 20), 2),
+            'LastPaymentDate': (today - timedelta(
+                days=self.random.randint(1, 400))).strftime(
+                    '%Y-%m-%dT00:00:00'),
+            }
+
+    def synthetic_sm_item(self, my_item=False):
+        """Generate synthetic secondary market item."""
+        item = self.synthetic_investment()
+        today = datetime.now()
+        red = item['LoanStatusCode'] != 2
+        item.update({
+            'Id': str(uuid.UUID(int=self.random.getrandbits(128))),
+            'DesiredDiscountRate': round(
+                self.random.uniform(-99, -60) if red
+                else self.random.uniform(-5, 10), 1),
+            'Price': round(self.random.uniform(0.5, 10), 2),
+            'ReScheduledOn': None,
+            'DebtOccuredOn': (today - timedelta(days=200)).strftime(
+                '%Y-%m-%dT00:00:00') if red else None,
+            'DebtOccuredOnForSecondary': None,
+            'ListedInSecondMarketOn': today.strftime('%Y-%m-%dT%H:%M:%S'),
+            'MyItem': my_item,
+            })
+        return item
+
+    def wait(self):
+        """Simulate latency of a response."""
+        latency = self.latency + self.random.uniform(-self.jitter,
+                                                     self.jitter)
+        if latency > 0:
+            time.sleep(latency)
+
+    def throttle(self, endpoint):
+        """
+        Check rate limit of an endpoint.
+
+        Parameters
+        ----------
+        endpoint : str
+            API endpoint.
+
+        Returns
+        -------
+        wait_time : int
+            Number of seconds to wait, or 0 if the request is allowed.
+
+        """
+        if endpoint not in self.rate_limits:
+            return 0
+        n_requests, period = self.rate_limits[endpoint]
+        now = time.time()
+        with self.lock:
+            history = [t for t in self.requests.get(endpoint, [])
+                       if t > now - period]
+            if len(history) >= n_requests:
+                self.requests[endpoint] = history
+                return int(history[0] + period - now) + 1
+            history.append(now)
+            self.requests[endpoint] = history
+        return 0
+
+    @staticmethod
+    def page(items, params):
+        """Create paged response of a list endpoint."""
+        page_size = int(params.get('PageSize', 1000))
+        page_nr = int(params.get('PageNr', 1))
+        payload = items[(page_nr - 1) * page_size:page_nr * page_size]
+        return {'PageSize': page_size,
+                'PageNr': page_nr,
+                'TotalCount': len(items),
+                'Count': len(payload),
+                'Payload': payload,
+                'Success': True,
+                'Errors': None}
+
+    @staticmethod
+    def select(items, params):
+        """Select items with values equal to the URL parameters."""
+        conditions = {key: value for key, value in params.items()
+                      if key not in ['PageSize', 'PageNr', 'ShowMyItems']}
+        return [item for item in items
+                if all(str(item.get(key)) == value
+                       for key, value in conditions.items()
+                       if key in item)]
+
+    def log_event(self, event_type, payload):
+        """Add event to the event log."""
+        self.eventlog.append({'EventType': event_type,
+                              'EventDate': datetime.now().isoformat(),
+                              'Payload': payload})
+
+    def buy(self, ids):
+        """Buy secondary market items."""
+        with self.lock:
+            ids = set(ids)
+            bought = [item for item in self.sm
+                      if item['Id'] in ids and not item.get('MyItem')]
+            for item in bought:
+                if item['Price'] > self.balance:
+                    continue
+                self.balance -= item['Price']
+                self.sm.remove(item)
+                investment = {key: value for key, value in item.items()
+                              if key not in ['Id', 'DesiredDiscountRate',
+                                             'Price', 'MyItem']}
+                self.investments.append(investment)
+                self.log_event('secondmarket.bought', item)
+            return len(bought)
+
+    def sell(self, items):
+        """Offer investments on secondary market."""
+        with self.lock:
+            investments = {investment['LoanPartId']: investment
+                           for investment in self.investments}
+            for sell_item in items:
+                investment = investments.get(sell_item['LoanPartId'])
+                if investment is None:
+                    continue
+                item = dict(investment,
+                            Id=str(uuid.UUID(int=self.random.getrandbits(128))),
+                            DesiredDiscountRate=sell_item[
+                                'DesiredDiscountRate'],
+                            Price=investment['PrincipalRemaining'],
+                            MyItem=True,
+                            ListedInSecondMarketOn=datetime.now().strftime(
+                                '%Y-%m-%dT%H:%M:%S'))
+                self.sm.append(item)
+                self.log_event('secondmarket.listed', item)
+
+    def cancel(self, ids):
+        """Cancel own offers on secondary market."""
+        with self.lock:
+            ids = set(ids)
+            canceled = [item for item in self.sm
+                        if item['Id'] in ids and item.get('MyItem')]
+            for item in canceled:
+                self.sm.remove(item)
+                self.log_event('secondmarket.canceled', item)
+
+
+def create_app(mock):
+    """
+    Create Flask application of the mock Bondora API.
+
+    Parameters
+    ----------
+    mock : MockBondora object
+        State of the mock API.
+
+    Returns
+    -------
+    app : flask.Flask object
+        Application implementing the endpoints of `api.urls`.
+
+    """
+    app = Flask(__name__)
+
+    def respond(endpoint, make_response, status=200):
+        mock.wait()
+        wait_time = mock.throttle(endpoint)
+        if wait_time:
+            return jsonify({'Success': False,
+                            'Errors': [{'Code': 429,
+                                        'Message': 'Too many requests.',
+                                        'Details': 'Retry in {} seconds.'
+                                        .format(wait_time)}]}), 429
+        return jsonify(make_response()), status
+
+    def content():
+        return json.loads(request.get_data() or 'null') or {}
+
+    @app.route('/' + api.urls.URL_BONDORA_BALANCE, methods=['GET'])
+    def balance():
+        return respond(api.urls.URL_BONDORA_BALANCE, lambda: {
+            'Payload': {'Balance': mock.balance,
+                        'TotalAvailable': mock.balance},
+            'Success': True, 'Errors': None})
+
+    @app.route('/' + api.urls.URL_BONDORA_INVESTMENTS, methods=['GET'])
+    def investments():
+        params = request.args.to_dict()
+        return respond(api.urls.URL_BONDORA_INVESTMENTS, lambda: mock.page(
+            mock.select(mock.investments, params), params))
+
+    @app.route('/' + api.urls.URL_BONDORA_EVENTLOG, methods=['GET'])
+    def eventlog():
+        params = request.args.to_dict()
+        return respond(api.urls.URL_BONDORA_EVENTLOG, lambda: mock.page(
+            mock.select(mock.eventlog, params), params))
+
+    @app.route('/' + api.urls.URL_BONDORA_AUCTIONS, methods=['GET'])
+    def auctions():
+        params = request.args.to_dict()
+        return respond(api.urls.URL_BONDORA_AUCTIONS, lambda: mock.page(
+            mock.select(mock.auctions, params), params))
+
+    @app.route('/' + api.urls.URL_BONDORA_BID_AUCTION, methods=['POST'])
+    def bid_auction():
+        bids = content().get('Bids', [])
+
+        def make_response():
+            with mock.lock:
+                for bid in bids:
+                    mock.bids.append(dict(
+                        bid, BidId=str(uuid.uuid4()), StatusCode=0))
+            return {'Payload': bids, 'Success': True, 'Errors': None}
+        return respond(api.urls.URL_BONDORA_BID_AUCTION, make_response, 202)
+
+    @app.route('/' + api.urls.URL_BONDORA_GET_BIDS, methods=['GET'])
+    def bids():
+        return respond(api.urls.URL_BONDORA_GET_BIDS, lambda: {
+            'Payload': mock.bids, 'Success': True, 'Errors': None})
+
+    @app.route('/' + api.urls.URL_BONDORA_GET_BID + '/<bid_id>',
+               methods=['GET'])
+    def bid(bid_id):
+        return respond(api.urls.ENDPOINT_GET_BID, lambda: {
+            'Payload': next((bid for bid in mock.bids
+                             if bid['BidId'] == bid_id), None),
+            'Success': True, 'Errors': None})
+
+    @app.route('/' + api.urls.URL_BONDORA_SM, methods=['GET'])
+    def sm():
+        params = request.args.to_dict()
+        my_items = params.get('ShowMyItems', 'False').lower() == 'true'
+        return respond(api.urls.URL_BONDORA_SM, lambda: mock.page(
+            mock.select([item for item in mock.sm
+                         if bool(item.get('MyItem')) == my_items], params),
+            params))
+
+    @app.route('/' + api.urls.URL_LOAN_PARTS, methods=['GET'])
+    def loan_parts():
+        ids = set(content().get('ItemIds') or [])
+        return respond(api.urls.URL_LOAN_PARTS, lambda: {
+            'Payload': [investment for investment in mock.investments
+                        if investment['LoanPartId'] in ids],
+            'Success': True, 'Errors': None})
+
+    @app.route('/' + api.urls.URL_BONDORA_BUY_SM, methods=['POST'])
+    def buy_sm():
+        ids = content().get('ItemIds') or []
+        return respond(api.urls.URL_BONDORA_BUY_SM, lambda: {
+            'Payload': None, 'Success': mock.buy(ids) > 0, 'Errors': None},
+            202)
+
+    @app.route('/' + api.urls.URL_BONDORA_SELL_SM, methods=['POST'])
+    def sell_sm():
+        items = content().get('Items') or []
+        return respond(api.urls.URL_BONDORA_SELL_SM, lambda: {
+            'Payload': mock.sell(items), 'Success': True, 'Errors': None},
+            202)
+
+    @app.route('/' + api.urls.URL_BONDORA_CANCEL_SM, methods=['POST'])
+    def cancel_sm():
+        ids = content().get('ItemIds') or []
+        return respond(api.urls.URL_BONDORA_CANCEL_SM, lambda: {
+            'Payload': mock.cancel(ids), 'Success': True, 'Errors': None},
+            202)
+
+    return app
+
+
+def fire_webhooks(mock, url, n_webhooks, rate=10.0, event_type=None):
+    """
+    Send webhooks about secondary market items to a listener.
+
+    Parameters
+    ----------
+    mock : MockBondora object
+        State of the mock API.
+    url : str
+        URL of the webhook listener, e.g. 'http://localhost/webhook'.
+    n_webhooks : int
+        Number of webhooks to send.
+    rate : float, optional
+        Number of webhooks per second. The default is 10.
+    event_type : str, optional
+        Event type of the webhooks. The default is None, i.e. randomly
+        'secondmarket.published' or 'secondmarket.updated'.
+
+    Returns
+    -------
+    latencies : list
+        Response times of the listener in seconds.
+
+    """
+    session = requests.Session()
+    latencies = []
+    for _ in range(n_webhooks):
+        with mock.lock:
+            item = mock.random.choice(mock.sm)
+        hook = {'EventType': event_type or mock.random.choice(
+                    ['secondmarket.published', 'secondmarket.updated']),
+                'Payload': item}
+        start = time.perf_counter()
+        try:
+            session.post(url, data=json.dumps(hook),
+                         headers={'Content-Type': 'application/json'})
+        except Exception as e:
+            logger.error(e)
+        latencies.append(time.perf_counter() - start)
+        time.sleep(1.0 / rate)
+    return latencies
+
+
+def main():
+    """Run the mock Bondora API."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='mean latency of responses in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='maximal deviation of latency in seconds')
+    parser.add_argument('--throttle', action='store_true',
+                        help='throttle requests with MOCK_RATE_LIMITS')
+    parser.add_argument('--data', help='JSON file with recorded payloads')
+    parser.add_argument('--items', type=int, default=1000,
+                        help='number of synthetic items')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--webhook-url',
+                        help='URL of the webhook listener to send webhooks')
+    parser.add_argument('--webhooks', type=int, default=0,
+                        help='number of webhooks to send')
+    parser.add_argument('--webhook-rate', type=float, default=10.0,
+                        help='number of webhooks per second')
+    args = parser.parse_args()
+
+    data = None
+    if args.data:
+        with open(args.data, encoding='utf-8') as infile:
+            data = json.load(infile)
+    mock = MockBondora(latency=args.latency,
+                       jitter=args.jitter,
+                       rate_limits=MOCK_RATE_LIMITS if args.throttle else None,
+                       data=data,
+                       n_items=args.items,
+                       seed=args.seed)
+
+    if args.webhook_url and args.webhooks:
+        def send():
+            latencies = sorted(fire_webhooks(mock, args.webhook_url,
+                                             args.webhooks,
+                                             args.webhook_rate))
+            logger.info('Sent {} webhooks, median latency {:.1f} ms, '
+                        'p99 latency {:.1f} ms.'
+                        .format(len(latencies),
+                                1000 * latencies[len(latencies) // 2],
+                                1000 * latencies[int(0.99 * len(latencies))]))
+        threading.Thread(target=send, daemon=True).start()
+
+    create_app(mock).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""The file contains Prometheus metrics."""
+
+import os
+from prometheus_client import (CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, CONTENT_TYPE_LATEST, REGISTRY)
+from prometheus_client import multiprocess
+
+# latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Bondora API
+API_LATENCY = Histogram('bondora_api_request_seconds',
+                        'Latency of requests to Bondora API.',
+                        ['method', 'endpoint'], buckets=BUCKETS)
+API_RESPONSES = Counter('bondora_api_responses_total',
+                        'Responses of Bondora API by status code.',
+                        ['method', 'endpoint', 'status'])
+API_THROTTLED = Counter('bondora_api_throttled_total',
+                        'Requests rejected by Bondora API with status 429.',
+                        ['method', 'endpoint'])
+API_RETRIES = Counter('bondora_api_retries_total',
+                      'Retried requests to Bondora API.',
+                      ['method', 'endpoint'])
+API_BYTES_SENT = Counter('bondora_api_sent_bytes_total',
+                         'Bytes of request content sent to Bondora API.',
+                         ['method', 'endpoint'])
+API_BYTES_RECEIVED = Counter('bondora_api_received_bytes_total',
+                             'Bytes of response content received '
+                             'from Bondora API.',
+                             ['method', 'endpoint'])
+API_CONCURRENCY_LIMIT = Gauge('bondora_api_concurrency_limit',
+                              'Adaptive limit of concurrent requests '
+                              'to Bondora API.',
+                              ['endpoint'], multiprocess_mode='max')
+API_WARM = Gauge('bondora_api_connections_warm',
+                 'Connections to Bondora API are open and verified (1) '
+                 'or cold (0).',
+                 multiprocess_mode='min')
+API_WARM_UP_LATENCY = Histogram('bondora_api_warm_up_seconds',
+                                'Time to open and verify connections '
+                                'to Bondora API.',
+                                buckets=BUCKETS)
+
+# balance ledger
+BALANCE_AVAILABLE = Gauge('bondora_balance_available',
+                          'Funds available for buying according to '
+                          'the local balance ledger.',
+                          multiprocess_mode='min')
+BALANCE_SYNCS = Counter('bondora_balance_syncs_total',
+                        'Synchronizations of the local balance ledger '
+                        'with Bondora API by reason.',
+                        ['reason'])
+
+# webhooks
+WEBHOOK_EVENTS = Counter('bondora_webhook_events_total',
+                         'Received webhooks by event type.',
+                         ['event_type'])
+WEBHOOK_LATENCY = Histogram('bondora_webhook_handler_seconds',
+                            'Time to handle a webhook.',
+                            buckets=BUCKETS)
+WEBHOOK_DECISIONS = Counter('bondora_webhook_decisions_total',
+                            'Buying decisions on webhooks by strategy.',
+                            ['strategy', 'decision'])
+BUYS_ATTEMPTED = Counter('bondora_buys_attempted_total',
+                         'Buy requests sent by strategy.',
+                         ['strategy'])
+BUYS_SUCCEEDED = Counter('bondora_buys_succeeded_total',
+                         'Buy requests accepted by Bondora by strategy.',
+                         ['strategy'])
+BIDS_ATTEMPTED = Counter('bondora_bids_attempted_total',
+                         'Bids on auctions sent by strategy.',
+                         ['strategy'])
+BIDS_SUCCEEDED = Counter('bondora_bids_succeeded_total',
+                         'Bids on auctions accepted by Bondora by strategy.',
+                         ['strategy'])
+BIDS_FINISHED = Counter('bondora_bids_finished_total',
+                        'Bids on auctions by strategy and final status.',
+                        ['strategy', 'status'])
+
+
+def export_metrics():
+    """
+    Export all metrics in Prometheus text format.
+
+    If the environment variable PROMETHEUS_MULTIPROC_DIR is set,
+    e.g. for several mod_wsgi processes, the metrics of all processes
+    are collected from that directory.
+
+    Returns
+    -------
+    content : bytes
+        Metrics in Prometheus text format.
+    content_type : str
+        Content type of the metrics.
+
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
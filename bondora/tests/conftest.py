@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Configuration of the tests, modules are imported like in the project."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
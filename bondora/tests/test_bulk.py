@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""Attribution of errors to items by bulk operations."""
+
+import threading
+import pytest
+from api.bulk import BulkOperation, error_positions
+
+URL = 'https://api.bondora.com/api/v1/secondarymarket/sell'
+
+
+class Response:
+    """Response with status code and JSON content."""
+
+    def __init__(self, status_code, content=None):
+        self.status_code = status_code
+        self.content = content or {}
+
+    def json(self):
+        return self.content
+
+
+class FakeApi:
+    """
+    API answering POST requests by the first item ID of the content.
+
+    `answers` maps item IDs to lists of responses, one per request,
+    requests of other chunks are accepted without errors.
+
+    """
+
+    def __init__(self, answers=None):
+        self.answers = answers or {}
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def post(self, url, content):
+        ids = [item['LoanPartId'] for item in content['Items']]
+        with self.lock:
+            self.requests.append(ids)
+            answers = self.answers.get(ids[0])
+            if answers:
+                # None stands for a request without response
+                return answers.pop(0)
+        return Response(202, {'Payload': None, 'Errors': None})
+
+
+def make_content(items):
+    return {'Items': [{'LoanPartId': part_id, 'DesiredDiscountRate': price}
+                      for part_id, price in items]}
+
+
+def operation(api, chunk_size=3, workers=2):
+    return BulkOperation(api, URL, make_content,
+                         item_key=lambda item: item[0],
+                         chunk_size=chunk_size, workers=workers)
+
+
+def items(n):
+    return [('part-{}'.format(i), -i) for i in range(n)]
+
+
+@pytest.mark.parametrize('error, position', [
+    ({'Code': 1, 'LoanPartId': 'b'}, 1),
+    ({'Code': 1, 'ItemId': 'c'}, 2),
+    ({'Code': 1, 'Id': 'a'}, 0),
+    ({'Code': 1, 'Message': 'c'}, 2),
+    ({'Code': 1, 'Details': ' b '}, 1),
+    ({'Code': 1, 'Message': 'ItemIds[2]'}, 2),
+    ({'Code': 1, 'Details': 'Items[1].LoanPartId'}, 1),
+    # unknown ID field falls back to the message
+    ({'Code': 1, 'LoanPartId': 'x', 'Message': 'a'}, 0),
+    ])
+def test_error_positions(error, position):
+    assert error_positions([error], ['a', 'b', 'c']) == {position}
+
+
+@pytest.mark.parametrize('error', [
+    {'Code': 1, 'Message': 'Loan part b cannot be sold.'},
+    {'Code': 1, 'Message': 'ItemIds[3]'},
+    {'Code': 1, 'LoanPartId': 'x'},
+    {'Code': 1},
+    ])
+def test_error_positions_unattributable(error):
+    errors = [{'Code': 1, 'LoanPartId': 'a'}, error]
+    assert error_positions(errors, ['a', 'b', 'c']) is None
+
+
+def test_error_positions_ids_of_other_types():
+    assert error_positions([{'ItemId': 7}, {'Message': '9'}],
+                           ['7', 8, 9]) == {0, 2}
+
+
+def test_all_accepted():
+    api = FakeApi()
+    result = operation(api).run(items(8))
+    assert result.ok
+    assert result.status_code == 202
+    assert result.succeeded_items == items(8)
+    assert result.failed_items == []
+    assert sorted(map(len, api.requests)) == [2, 3, 3]
+
+
+def test_attribution():
+    answers = {
+        # rejected request fails the whole chunk
+        'part-0': [Response(400, {'Errors': [{'Code': 1}]})],
+        # errors of accepted request fail their items only
+        'part-3': [Response(202, {'Errors': [
+            {'Code': 1, 'LoanPartId': 'part-4'},
+            {'Code': 1, 'Message': 'ItemIds[2]'}]})],
+        # unattributable error of accepted request fails the whole chunk
+        'part-6': [Response(202, {'Errors': [
+            {'Code': 1, 'Message': 'Loan part part-7 is not yours.'}]})],
+        # request without response fails the whole chunk
+        'part-9': [None],
+        }
+    api = FakeApi(answers)
+    all_items = items(14)
+    result = operation(api).run(all_items)
+
+    failed = [all_items[i] for i in [0, 1, 2, 4, 5, 6, 7, 8, 9, 10, 11]]
+    assert not result.ok
+    assert result.status_code == 400
+    assert [chunk.status_code for chunk in result.failed_chunks] == [400,
+                                                                     None]
+    assert result.failed_items == failed
+    assert result.succeeded_items == [all_items[i] for i in [3, 12, 13]]
+    assert (sorted(result.failed_items + result.succeeded_items)
+            == sorted(all_items))
+
+
+def test_retry_replaces_failed_chunks():
+    answers = {'part-3': [Response(429), Response(429)],
+               'part-6': [Response(500)]}
+    api = FakeApi(answers)
+    all_items = items(9)
+    result = operation(api).run(all_items)
+    assert result.failed_items == all_items[3:]
+
+    retried = result.retry()
+    assert [chunk.index for chunk in retried.chunks] == [0, 1, 2]
+    assert retried.status_code == 429
+    assert retried.failed_items == all_items[3:6]
+    assert retried.succeeded_items == all_items[:3] + all_items[6:]
+    # accepted chunks are not sent again
+    assert len(api.requests) == 5
+
+    retried = retried.retry()
+    assert retried.ok
+    assert retried.succeeded_items == all_items
+    assert len(api.requests) == 6
+    assert retried.elapsed >= result.elapsed
+
+
+def test_retry_without_failures():
+    api = FakeApi()
+    result = operation(api).run(items(4))
+    assert result.retry() is result
+    assert len(api.requests) == 2
+
+
+def test_errors_of_accepted_chunks_not_retried():
+    answers = {'part-0': [Response(202, {'Errors': [
+        {'Code': 1, 'LoanPartId': 'part-1'}]})]}
+    api = FakeApi(answers)
+    result = operation(api).run(items(3))
+    assert result.ok
+    assert result.failed_items == [items(3)[1]]
+    # item errors are final, only rejected requests are sent again
+    assert result.retry() is result
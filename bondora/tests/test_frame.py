@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Equivalence of the portfolio frame with the per-item price loop."""
+
+import random
+from datetime import date, datetime, timedelta
+import pytest
+from trading.frame import PortfolioFrame
+
+# number of synthetic investments per test
+N_ITEMS = 3000
+
+# arguments (max_price, min_price, days_before_payment) of the tests
+PRICES = [(0, None, 2), (0, -10, 2), (5, -20, 0), (-1, -30, 5),
+          (3, 0, 2), (2.5, -7.5, 1)]
+
+
+def baseline_prices(investments, max_price, min_price, days_before_payment):
+    """Price loop of `_sell_prices` before the portfolio frame."""
+    price = max_price
+    if min_price:
+        latest_sell_date = date.today() + timedelta(days=days_before_payment)
+    part_ids_prices = []
+    for investment in investments:
+        try:
+            if min_price:
+                next_payment_date = datetime.strptime(
+                    investment['NextPaymentDate'],
+                    '%Y-%m-%dT00:00:00').date()
+                price = min_price + (next_payment_date -
+                                     latest_sell_date).days
+                if price > max_price:
+                    price = max_price
+                elif price < min_price:
+                    price = min_price
+            part_ids_prices.append((investment['LoanPartId'], price))
+        except Exception:
+            pass
+    return part_ids_prices
+
+
+def next_payment_date(rng):
+    """Get random next payment date of the API format, missing or broken."""
+    choice = rng.random()
+    if choice < 0.05:
+        return None
+    if choice < 0.08:
+        return ''
+    if choice < 0.1:
+        return 'n/a'
+    if choice < 0.12:
+        return '2021-02-30T00:00:00'
+    day = date.today() + timedelta(days=rng.randint(-60, 60))
+    return day.strftime('%Y-%m-%dT00:00:00')
+
+
+@pytest.fixture
+def investments():
+    rng = random.Random(13)
+    return [{'LoanPartId': 'part-{}'.format(i),
+             'NextPaymentDate': next_payment_date(rng),
+             'PrincipalRemaining': rng.uniform(0.0, 100.0),
+             'LoanStatusCode': rng.choice([2, 2, 2, 5, 8, 100]),
+             'Interest': rng.uniform(5.0, 30.0),
+             'LateAmountTotal': rng.choice([0.0, 0.0, 1.5])}
+            for i in range(N_ITEMS)]
+
+
+@pytest.mark.parametrize('max_price, min_price, days_before_payment', PRICES)
+def test_part_ids_prices(investments, max_price, min_price,
+                         days_before_payment):
+    expected = baseline_prices(investments, max_price, min_price,
+                               days_before_payment)
+    frame = PortfolioFrame.from_items(investments)
+    actual = frame.part_ids_prices(max_price, min_price, days_before_payment,
+                                   date.today())
+    assert actual == expected
+    assert ([type(price) for _, price in actual]
+            == [type(price) for _, price in expected])
+
+
+def test_missing_dates_skipped_with_min_price(investments):
+    frame = PortfolioFrame.from_items(investments)
+    part_ids = {part_id for part_id, _ in frame.part_ids_prices(
+        0, -10, 2, date.today())}
+    for investment in investments:
+        try:
+            datetime.strptime(investment['NextPaymentDate'],
+                              '%Y-%m-%dT00:00:00')
+        except (TypeError, ValueError):
+            assert investment['LoanPartId'] not in part_ids
+        else:
+            assert investment['LoanPartId'] in part_ids
+
+
+def test_part_ids_prices_after_where(investments):
+    frame = PortfolioFrame.from_items(investments).where(LoanStatusCode=2)
+    expected = baseline_prices(
+        [investment for investment in investments
+         if investment['LoanStatusCode'] == 2], 0, -10, 2)
+    assert frame.part_ids_prices(0, -10, 2, date.today()) == expected
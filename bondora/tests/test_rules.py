@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Equivalence of the rule engine with the hard-coded buy selectors."""
+
+import random
+from datetime import date, datetime, timedelta
+import numpy as np
+import pytest
+from trading.frame import MarketFrame
+from trading.rules import RuleEngine, DEFAULT_STRATEGIES, scan_strategy
+
+PATH_STRATEGIES = 'strategies.json'
+
+# number of synthetic items per test
+N_ITEMS = 3000
+
+
+def baseline_green(payload):
+    """Selector of `buy_green_loan` before the rule engine."""
+    try:
+        today = datetime.now()
+        next_pm_date = date.fromisoformat(payload['NextPaymentDate'][:10])
+        pm_date_min = (today + timedelta(days=7)).date()
+        return (
+            payload['NextPaymentNr'] == 1
+            and payload['DesiredDiscountRate'] <= 2.0
+            and payload['LoanStatusCode'] == 2
+            and not payload['ReScheduledOn']
+            and not payload['DebtOccuredOn']
+            and not payload['DebtOccuredOnForSecondary']
+            and payload['LateAmountTotal'] == 0.0
+            and payload['Amount'] <= 5.0
+            and payload['Interest'] > 12.0
+            and payload['NrOfScheduledPayments'] > 36
+            and next_pm_date > pm_date_min)
+    except Exception:
+        return False
+
+
+def baseline_red(payload):
+    """Selector of `buy_red_loan` before the rule engine."""
+    try:
+        today = datetime.now()
+        if payload['DesiredDiscountRate'] <= -94.0 and payload['Price'] <= 5.0:
+            return 'red_1'
+        if payload['DesiredDiscountRate'] > -69.0:
+            return None
+        transfers = payload['LoanTransfers']
+        price = (payload['PrincipalRemaining']
+                 * (1.0 + payload['DesiredDiscountRate'] / 100.0))
+        selected = (
+            date.fromisoformat(payload['DebtOccuredOn'][:10])
+            < (today - timedelta(days=90)).date()
+            and date.fromisoformat(
+                payload['DebtManagmentEvents'][1]['CreatedOn'][:10])
+            < date.fromisoformat(transfers[-1]['Date'][:10])
+            and date.fromisoformat(transfers[-1]['Date'][:10])
+            > (today - timedelta(days=90)).date()
+            and date.fromisoformat(transfers[-2]['Date'][:10])
+            > (today - timedelta(days=90)).date()
+            and date.fromisoformat(transfers[-3]['Date'][:10])
+            > (today - timedelta(days=90)).date()
+            and 12.0 * transfers[-1]['TotalAmount'] / price > 0.19
+            and 12.0 * transfers[-2]['TotalAmount'] / price > 0.19
+            and 12.0 * transfers[-3]['TotalAmount'] / price > 0.19
+            and payload['Price'] <= 5.0)
+        return 'red_2' if selected else None
+    except Exception:
+        return None
+
+
+def _date(rng, low, high, missing=0.1):
+    """Random ISO timestamp relative to today, None, or malformed."""
+    draw = rng.random()
+    if draw < missing:
+        return rng.choice([None, None, '', 'n/a'])
+    day = date.today() + timedelta(days=rng.randint(low, high))
+    return day.isoformat() + 'T00:00:00'
+
+
+def _number(rng, values, missing=0.05):
+    """Random value from the list or None."""
+    return None if rng.random() < missing else rng.choice(values)
+
+
+def green_item(rng):
+    """Secondary market item around the thresholds of the green strategy."""
+    return {
+        'Id': str(rng.getrandbits(64)),
+        'LoanPartId': str(rng.getrandbits(64)),
+        'NextPaymentNr': _number(rng, [1, 1, 1, 2]),
+        'DesiredDiscountRate': _number(rng, [-1.0, 0.0, 2.0, 2.5, 5.0]),
+        'LoanStatusCode': _number(rng, [2, 2, 2, 5]),
+        'ReScheduledOn': _date(rng, -100, -1, missing=0.9),
+        'DebtOccuredOn': _date(rng, -100, -1, missing=0.9),
+        'DebtOccuredOnForSecondary': _date(rng, -100, -1, missing=0.9),
+        'LateAmountTotal': _number(rng, [0.0, 0.0, 0.0, 1.5]),
+        'Amount': _number(rng, [1.0, 4.99, 5.0, 5.01, 10.0]),
+        'Price': _number(rng, [1.0, 5.0, 6.0]),
+        'Interest': _number(rng, [10.0, 12.0, 12.01, 25.0]),
+        'NrOfScheduledPayments': _number(rng, [36, 48, 60]),
+        'NextPaymentDate': _date(rng, 0, 14),
+        }
+
+
+def red_item(rng):
+    """Secondary market item around the thresholds of the red strategies."""
+    def transfer():
+        return {'Date': _date(rng, -100, -1, missing=0.05),
+                'TotalAmount': _number(rng, [0.01, 0.1, 0.5, 1.0])}
+
+    events = [{'CreatedOn': _date(rng, -200, -1, missing=0.05)}
+              for _ in range(rng.choice([0, 1, 2, 3]))]
+    return {
+        'Id': str(rng.getrandbits(64)),
+        'LoanPartId': str(rng.getrandbits(64)),
+        'DesiredDiscountRate': _number(rng, [-95.0, -94.0, -80.0, -69.0,
+                                             -68.0, -10.0]),
+        'Price': _number(rng, [0.5, 5.0, 5.01]),
+        'PrincipalRemaining': _number(rng, [0.0, 5.0, 20.0, 50.0]),
+        'DebtOccuredOn': _date(rng, -200, -1),
+        'DebtManagmentEvents': events,
+        'LoanTransfers': [transfer()
+                          for _ in range(rng.choice([0, 2, 3, 4, 5]))],
+        }
+
+
+@pytest.fixture(scope='module')
+def items():
+    rng = random.Random(20210301)
+    return ([green_item(rng) for _ in range(N_ITEMS)]
+            + [red_item(rng) for _ in range(N_ITEMS)])
+
+
+@pytest.fixture(scope='module', params=['file', 'default'])
+def engine(request):
+    if request.param == 'file':
+        return RuleEngine(PATH_STRATEGIES)
+    return RuleEngine('/nonexistent', default=DEFAULT_STRATEGIES)
+
+
+def test_config_file_equals_default():
+    assert RuleEngine(PATH_STRATEGIES).groups.keys() == {'green', 'red'}
+    assert ([strategy.source for strategy
+             in RuleEngine(PATH_STRATEGIES).strategies]
+            == [strategy.source for strategy
+                in RuleEngine('/nonexistent').strategies])
+
+
+def test_fixture_covers_both_decisions(items):
+    green = [baseline_green(item) for item in items]
+    red = [baseline_red(item) for item in items]
+    assert any(green) and not all(green)
+    assert red.count('red_1') and red.count('red_2') and red.count(None)
+
+
+def test_evaluate_green(engine, items):
+    for item in items:
+        strategy, _ = engine.evaluate(item, 'green')
+        assert (strategy is not None) == baseline_green(item), item
+
+
+def test_evaluate_red(engine, items):
+    for item in items:
+        strategy, _ = engine.evaluate(item, 'red')
+        name = None if strategy is None else strategy.name
+        assert name == baseline_red(item), item
+
+
+def test_scan_green(engine, items):
+    frame = MarketFrame.from_items(items)
+    rows = engine.scan(frame, 'green', date.today())['green']
+    expected = [i for i, item in enumerate(items) if baseline_green(item)]
+    assert rows.tolist() == expected
+
+
+def test_scan_red(engine, items):
+    frame = MarketFrame.from_items(items)
+    matches = engine.scan(frame, 'red', date.today())
+    for name in ['red_1', 'red_2']:
+        expected = [i for i, item in enumerate(items)
+                    if baseline_red(item) == name]
+        assert sorted(matches[name].tolist()) == expected, name
+
+
+def test_scan_strategy_equals_evaluate(engine, items):
+    frame = MarketFrame.from_items(items)
+    context = engine.context()
+    for strategy in engine.strategies:
+        rows = scan_strategy(strategy, frame, np.arange(len(items)),
+                             date.today())
+        expected = []
+        for i, item in enumerate(items):
+            try:
+                if strategy.predicate(item, context):
+                    expected.append(i)
+            except Exception:
+                pass
+        assert rows.tolist() == expected, strategy.name
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""Decisions remembered by the index of seen items."""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import trading.seen_items
+from trading.seen_items import (SeenItems, SKIPPED, FAILED_EVALUATION,
+                                BUYING, BOUGHT, BUY_FAILED)
+
+KEY = ('green', 'item-1')
+
+
+class Clock:
+    """Monotonic clock advanced by the tests."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(trading.seen_items, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def seen(clock):
+    return SeenItems(maxsize=3, ttl=60)
+
+
+def test_unknown_item(seen):
+    assert seen.get(KEY, 1) is None
+    assert seen.stats() == {'size': 0, 'hits': 0, 'misses': 1}
+
+
+def test_put_get(seen):
+    seen.put(KEY, 1, SKIPPED)
+    assert seen.get(KEY, 1) == SKIPPED
+    assert seen.get(('red', 'item-1'), 1) is None
+    assert seen.stats() == {'size': 1, 'hits': 1, 'misses': 1}
+
+
+@pytest.mark.parametrize('outcome', [SKIPPED, FAILED_EVALUATION, BUY_FAILED])
+def test_changed_fields_decided_again(seen, outcome):
+    seen.put(KEY, 1, outcome)
+    assert seen.get(KEY, 2) is None
+    assert seen.claim(KEY, 2, BUYING) is None
+    assert seen.get(KEY, 2) == BUYING
+
+
+@pytest.mark.parametrize('outcome', [BUYING, BOUGHT])
+def test_final_outcomes_kept_for_changed_fields(seen, outcome):
+    seen.put(KEY, 1, outcome)
+    assert seen.get(KEY, 2) == outcome
+    assert seen.claim(KEY, 2, BUYING) == outcome
+
+
+def test_claim(seen):
+    assert seen.claim(KEY, 1, BUYING) is None
+    # repeated webhook of the item being bought
+    assert seen.claim(KEY, 1, BUYING) == BUYING
+    seen.put(KEY, 1, BOUGHT)
+    assert seen.claim(KEY, 1, BUYING) == BOUGHT
+    assert seen.stats() == {'size': 1, 'hits': 2, 'misses': 1}
+
+
+def test_claim_skipped_item(seen):
+    seen.put(KEY, 1, SKIPPED)
+    assert seen.claim(KEY, 1, BUYING) == SKIPPED
+    assert seen.get(KEY, 1) == SKIPPED
+
+
+def test_discard(seen):
+    assert seen.claim(KEY, 1, BUYING) is None
+    # outcome of the buy is unknown
+    seen.discard(KEY)
+    assert len(seen) == 0
+    assert seen.get(KEY, 1) is None
+    assert seen.claim(KEY, 1, BUYING) is None
+    # unknown items are ignored
+    seen.discard(('red', 'item-2'))
+    assert len(seen) == 1
+
+
+def test_expiry(seen, clock):
+    seen.put(KEY, 1, BOUGHT)
+    clock.now += 59.9
+    assert seen.get(KEY, 1) == BOUGHT
+    clock.now += 0.1
+    assert seen.get(KEY, 1) is None
+    assert seen.claim(KEY, 1, BUYING) is None
+    clock.now += 30
+    assert seen.get(KEY, 1) == BUYING
+
+
+def test_put_renews_expiry(seen, clock):
+    seen.put(KEY, 1, BUYING)
+    clock.now += 50
+    seen.put(KEY, 1, BOUGHT)
+    clock.now += 50
+    assert seen.get(KEY, 1) == BOUGHT
+
+
+def test_least_recently_used_evicted(seen):
+    for i in range(3):
+        seen.put(('green', i), 1, SKIPPED)
+    # access makes an entry recently used
+    assert seen.get(('green', 0), 1) == SKIPPED
+    assert seen.claim(('green', 1), 1, BUYING) == SKIPPED
+    seen.put(('green', 3), 1, SKIPPED)
+    assert len(seen) == 3
+    assert seen.get(('green', 2), 1) is None
+    assert seen.get(('green', 0), 1) == SKIPPED
+    seen.put(('green', 4), 1, SKIPPED)
+    assert seen.get(('green', 1), 1) is None
+
+
+def test_concurrent_claims():
+    seen = SeenItems()
+    barrier = threading.Barrier(8)
+
+    def claim(_):
+        barrier.wait()
+        return seen.claim(KEY, 1, BUYING)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        outcomes = list(executor.map(claim, range(8)))
+    assert outcomes.count(None) == 1
+    assert outcomes.count(BUYING) == 7
@@ -0,0 +1,369 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of an auction bidding pipeline."""
+
+import time
+import threading
+from collections import namedtuple
+from setup_logger import logger
+from setup_metrics import BIDS_ATTEMPTED, BIDS_SUCCEEDED, BIDS_FINISHED
+from trading.batching import (MicroBatcher, failed_ids, BATCH_WINDOW,
+                              BATCH_SIZE)
+from trading.ledger import RESERVED
+from trading.rules import RuleEngine
+
+PATH_AUCTION_STRATEGIES = '/var/www/flask/bondora/auction_strategies.json'
+
+# no bids, unless strategies are configured, see `RuleEngine` for format
+DEFAULT_AUCTION_STRATEGIES = {'strategies': []}
+# group of bidding strategies
+AUCTION_GROUP = 'auction'
+
+# amount to bid, if not provided by the strategy
+BID_AMOUNT = 5
+# minimal amount to accept, if an auction is almost funded
+MIN_BID_AMOUNT = 1
+# seconds to track bids, which are not listed by Bondora
+BID_TTL = 86400
+# seconds between sweeps of active auctions
+SWEEP_INTERVAL = 60
+
+# status codes of bids
+BID_STATUSES = {0: 'pending', 1: 'open', 2: 'successful', 3: 'failed',
+                4: 'cancelled', 5: 'accepted'}
+FINAL_BID_STATUSES = (2, 3, 4)
+
+BidResult = namedtuple('BidResult', ['auction_id', 'amount', 'success',
+                                     'status_code'])
+
+
+class Bid:
+    """State of an outstanding bid."""
+
+    def __init__(self, strategy, amount):
+        self.strategy = strategy
+        self.amount = amount
+        self.status = None
+        self.created = time.monotonic()
+
+
+class AuctionBidder:
+    """
+    Bid on auctions in batched requests.
+
+    Auctions of `auction.published` webhooks and of periodic sweeps
+    of `get_auctions` are evaluated by the strategies of the group
+    'auction' (see `RuleEngine`). The amount to bid is taken from the
+    `params` of the satisfied strategy, e.g. {"amount": 10}. Bids on
+    qualifying auctions are collected for a short window and sent
+    with one `bid_on_auction` request. Every auction is bid once.
+
+    Outstanding bids are tracked with one `get_bids` request until
+    they are finished. Their amounts are reserved in the balance
+    ledger, if provided.
+
+    """
+
+    def __init__(self, api, rules=None, window=BATCH_WINDOW,
+                 max_items=BATCH_SIZE, ledger=None, amount=BID_AMOUNT,
+                 min_amount=MIN_BID_AMOUNT):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to send the requests.
+        rules : RuleEngine object, optional
+            Bidding strategies. The default is None, i.e. loaded from
+            PATH_AUCTION_STRATEGIES or DEFAULT_AUCTION_STRATEGIES.
+        window : float, optional
+            Maximal time in seconds to wait for more bids.
+            The default is BATCH_WINDOW.
+        max_items : int, optional
+            Maximal number of bids per request. The default is BATCH_SIZE.
+        ledger : BalanceLedger object, optional
+            Ledger to reserve the amounts of bids. The default is None.
+        amount : int, optional
+            Amount to bid, if not provided by the strategy.
+            The default is BID_AMOUNT.
+        min_amount : int, optional
+            Minimal amount to accept, if an auction is almost funded.
+            The default is MIN_BID_AMOUNT.
+
+        """
+        self.api = api
+        self.rules = rules or RuleEngine(PATH_AUCTION_STRATEGIES,
+                                         default=DEFAULT_AUCTION_STRATEGIES)
+        self.ledger = ledger
+        self.amount = amount
+        self.min_amount = min_amount
+        self.batcher = MicroBatcher(self._bid, window, max_items)
+        # outstanding bids by auction ID
+        self.bids = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def submit(self, auction, context=None):
+        """
+        Add bid to the next request, if the auction qualifies.
+
+        Parameters
+        ----------
+        auction : dict
+            Auction.
+        context : dict, optional
+            Thresholds of the current tick. The default is None.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of BidResult of the auction, or None, if the auction
+            does not qualify, is already bid, or cannot be afforded.
+
+        """
+        strategy, _ = self.rules.evaluate(auction, AUCTION_GROUP, context)
+        if strategy is None:
+            return None
+        auction_id = auction['AuctionId']
+        amount = strategy.params.get('amount', self.amount)
+        with self.lock:
+            # expire bids also, if they are not tracked by sweeps
+            self._expire(time.monotonic())
+            if auction_id in self.bids:
+                return None
+            self.bids[auction_id] = Bid(strategy.name, amount)
+        if (self.ledger is not None
+                and self.ledger.reserve(auction_id, amount) != RESERVED):
+            with self.lock:
+                del self.bids[auction_id]
+            return None
+
+        BIDS_ATTEMPTED.labels(strategy.name).inc()
+        future = self.batcher.submit((auction_id, amount))
+        future.add_done_callback(
+            lambda future: self._finish(auction_id, strategy.name, future))
+        return future
+
+    def on_webhook(self, event):
+        """
+        Bid on the auction of a webhook.
+
+        Parameters
+        ----------
+        event : dict
+            Webhook with `EventType` and `Payload`.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of BidResult, or None, if no bid is made.
+
+        """
+        if (event or {}).get('EventType') != 'auction.published':
+            return None
+        return self.submit(event['Payload'])
+
+    def sweep(self, retry=False, **kwargs):
+        """
+        Bid on all qualifying active auctions.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-auctions?v=1).
+
+        Returns
+        -------
+        results : list
+            List of BidResult of the new bids.
+
+        """
+        self.api.auctions = None
+        self.api.get_auctions(retry, **kwargs)
+        if not self.api.auctions:
+            return []
+
+        context = self.rules.context()
+        futures = []
+        for auction in self.api.auctions:
+            try:
+                future = self.submit(auction, context)
+            except Exception as e:
+                logger.error(e)
+                continue
+            if future is not None:
+                futures.append(future)
+        self.batcher.flush()
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(e)
+        if results:
+            logger.info('Bid on {} of {} qualifying auctions.'
+                        .format(sum(result.success for result in results),
+                                len(results)))
+        return results
+
+    def track(self, retry=False, **kwargs):
+        """
+        Update status of outstanding bids with one request.
+
+        Finished bids are removed, and the amounts of failed or
+        cancelled bids make the balance ledger synchronize.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information (see
+                https://api.bondora.com/doc/Api/GET-api-v1-bids?v=1).
+
+        Returns
+        -------
+        counts : dict
+            Number of outstanding bids by status, or None, if the bids
+            could not be loaded.
+
+        """
+        response = self.api.get_bids(retry, **kwargs)
+        if not response or 'Payload' not in response:
+            return None
+
+        now = time.monotonic()
+        finished = []
+        with self.lock:
+            for bid_summary in response['Payload'] or []:
+                bid = self.bids.get(bid_summary.get('AuctionId'))
+                if bid is not None:
+                    bid.status = bid_summary.get('StatusCode')
+            for auction_id, bid in list(self.bids.items()):
+                if bid.status in FINAL_BID_STATUSES:
+                    finished.append(bid)
+                    del self.bids[auction_id]
+            self._expire(now)
+            counts = {}
+            for bid in self.bids.values():
+                status = BID_STATUSES.get(bid.status, 'unknown')
+                counts[status] = counts.get(status, 0) + 1
+
+        for bid in finished:
+            BIDS_FINISHED.labels(bid.strategy,
+                                 BID_STATUSES[bid.status]).inc()
+        if self.ledger is not None and any(bid.status != 2
+                                           for bid in finished):
+            # amounts of failed bids are available again
+            self.ledger.invalidate()
+        if finished:
+            logger.info('{} bids finished, {} outstanding.'
+                        .format(len(finished), len(self.bids)))
+        return counts
+
+    def start(self, interval=SWEEP_INTERVAL, retry=False, **kwargs):
+        """
+        Sweep auctions and track bids in background.
+
+        Parameters
+        ----------
+        interval : float, optional
+            Seconds between sweeps. The default is SWEEP_INTERVAL.
+        retry : bool, optional
+            Retry to execute the requests. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Request information of `get_auctions`.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run,
+                                           args=(interval, retry, kwargs),
+                                           name='auction-sweep',
+                                           daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        """
+        Stop sweeping auctions.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.stopped.set()
+
+    def _run(self, interval, retry, kwargs):
+        """Sweep auctions and track bids until stopped."""
+        while not self.stopped.wait(interval):
+            try:
+                self.sweep(retry, **kwargs)
+                if self.bids:
+                    self.track(retry)
+            except Exception as e:
+                logger.error(e)
+
+    def _expire(self, now):
+        """Remove bids older than BID_TTL, the lock must be held."""
+        # bids are kept in the order of their creation
+        expired = []
+        for auction_id, bid in self.bids.items():
+            if now - bid.created <= BID_TTL:
+                break
+            expired.append(auction_id)
+        for auction_id in expired:
+            del self.bids[auction_id]
+
+    def _bid(self, items):
+        """
+        Bid on auctions with one request.
+
+        Parameters
+        ----------
+        items : list
+            List of tuples (AuctionId, Amount).
+
+        Returns
+        -------
+        results : list
+            List of BidResult in the order of `items`.
+
+        """
+        ids = [auction_id for auction_id, _ in items]
+        response = self.api.bid_on_auction(
+            ids, [amount for _, amount in items], self.min_amount)
+        if response is None:
+            return [BidResult(auction_id, amount, False, None)
+                    for auction_id, amount in items]
+
+        failed = failed_ids(response, ids)
+        if len(items) > 1:
+            logger.info('Bid on {} of {} auctions with one request.'
+                        .format(len(items) - len(failed), len(items)))
+        return [BidResult(auction_id, amount, auction_id not in failed,
+                          response.status_code)
+                for auction_id, amount in items]
+
+    def _finish(self, auction_id, strategy, future):
+        """Record the outcome of a bid request."""
+        success = future.exception() is None and future.result().success
+        if success:
+            BIDS_SUCCEEDED.labels(strategy).inc()
+            if self.ledger is not None:
+                self.ledger.settle(auction_id)
+            return None
+        # auctions of rejected bids can be bid again
+        with self.lock:
+            self.bids.pop(auction_id, None)
+        if self.ledger is not None:
+            self.ledger.release(auction_id, discrepancy=True)
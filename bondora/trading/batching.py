@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""The file contains classes for micro-batching of requests."""
+
+import threading
+from collections import namedtuple
+from concurrent.futures import Future
+from api.bulk import error_positions
+from setup_logger import logger
+
+# maximal time in seconds to wait for more items before sending a batch
+BATCH_WINDOW = 0.05
+# maximal number of items per batch
+BATCH_SIZE = 100
+# maximal time in seconds to wait for a buy, if the request has no timeout
+BUY_TIMEOUT = 60
+
+BuyResult = namedtuple('BuyResult', ['item_id', 'success', 'status_code'])
+
+
+def failed_ids(response, ids):
+    """
+    Get IDs, which were not accepted by a batched request.
+
+    IDs, which the errors of an accepted request (202) refer to (see
+    `error_positions`), are considered as failed. All IDs are failed,
+    if the request was rejected, or if any error cannot be attributed
+    to an item, since the outcome of every item is unknown then.
+
+    Parameters
+    ----------
+    response : requests.Response object
+        Response of server to the request.
+    ids : list
+        List of IDs sent with the request.
+
+    Returns
+    -------
+    failed : set
+        Set of failed IDs.
+
+    """
+    if response.status_code != 202:
+        return set(ids)
+    try:
+        errors = response.json().get('Errors') or []
+    except Exception as e:
+        logger.warning('Errors of accepted request cannot be read: {}'
+                       .format(e))
+        return set(ids)
+    positions = error_positions(errors, ids)
+    if positions is None:
+        logger.warning('Errors cannot be attributed to items: {}'
+                       .format(errors))
+        return set(ids)
+    return {ids[position] for position in positions}
+
+
+class MicroBatcher:
+    """
+    Collect items from concurrent callers and process them in batches.
+
+    A batch is processed as soon as it contains `max_items` items or
+    `window` seconds after its first item was submitted, whichever
+    comes first. So, the latency added to an item is at most `window`.
+
+    """
+
+    def __init__(self, process, window=BATCH_WINDOW, max_items=BATCH_SIZE):
+        """
+        Parameters
+        ----------
+        process : function
+            Function processing a list of items and returning a list
+            of results in the same order.
+        window : float, optional
+            Maximal time in seconds to wait for more items.
+            The default is BATCH_WINDOW.
+        max_items : int, optional
+            Maximal number of items per batch. The default is BATCH_SIZE.
+
+        """
+        self.process = process
+        self.window = window
+        self.max_items = max_items
+        self.pending = []
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def submit(self, item):
+        """
+        Add item to the current batch.
+
+        Parameters
+        ----------
+        item : object
+            Item to process.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of the item result.
+
+        """
+        future = Future()
+        batch = None
+        with self.lock:
+            self.pending.append((item, future))
+            if len(self.pending) >= self.max_items:
+                batch = self._take()
+            elif len(self.pending) == 1:
+                timer = threading.Timer(self.window, self._flush_expired,
+                                        args=(self.generation,))
+                timer.daemon = True
+                timer.start()
+        # process full batch in the calling thread
+        if batch:
+            self._process(batch)
+        return future
+
+    def flush(self):
+        """
+        Process the current batch immediately.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._process(batch)
+
+    def _take(self):
+        """Take the current batch and start a new one."""
+        batch = self.pending
+        self.pending = []
+        self.generation += 1
+        return batch
+
+    def _flush_expired(self, generation):
+        """Process the batch, if its window is over and it is not sent."""
+        with self.lock:
+            if generation != self.generation:
+                return None
+            batch = self._take()
+        if batch:
+            self._process(batch)
+
+    def _process(self, batch):
+        """Process batch and pass the results to the futures."""
+        try:
+            results = self.process([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+        except Exception as e:
+            logger.error(e)
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+class BuyDispatcher:
+    """
+    Coalesce buys on secondary market into batched requests.
+
+    Item IDs submitted by concurrent webhook handlers are collected
+    for a short window and bought with one request. The result of
+    the request is mapped back to every item.
+
+    """
+
+    def __init__(self, api, window=BATCH_WINDOW, max_items=BATCH_SIZE):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to send the buy requests.
+        window : float, optional
+            Maximal time in seconds to wait for more items.
+            The default is BATCH_WINDOW.
+        max_items : int, optional
+            Maximal number of items per request. The default is BATCH_SIZE.
+
+        """
+        self.api = api
+        self.batcher = MicroBatcher(self._buy, window, max_items)
+
+    def submit(self, item_id):
+        """
+        Add item to the next buy request.
+
+        Parameters
+        ----------
+        item_id : str
+            Secondary market item ID to buy.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of BuyResult of the item.
+
+        """
+        return self.batcher.submit(item_id)
+
+    def buy(self, item_id, timeout=None):
+        """
+        Buy item with the next buy request and wait for the result.
+
+        Parameters
+        ----------
+        item_id : str
+            Secondary market item ID to buy.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None,
+            i.e. the window plus the timeout of the request.
+
+        Returns
+        -------
+        result : BuyResult
+            Result of buying the item. concurrent.futures.TimeoutError
+            is raised, if the result is not available in time.
+
+        """
+        if timeout is None:
+            timeout = self.batcher.window + self._request_timeout()
+        return self.submit(item_id).result(timeout)
+
+    def _request_timeout(self):
+        """Get maximal duration of a buy request in seconds."""
+        timeout = getattr(self.api, 'timeout', None)
+        if isinstance(timeout, (tuple, list)):
+            return sum(timeout)
+        return timeout or BUY_TIMEOUT
+
+    def flush(self):
+        """
+        Send the collected items immediately.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.batcher.flush()
+
+    def _buy(self, ids):
+        """
+        Buy items with one request.
+
+        Items, which the errors of an accepted request refer to, are
+        considered as failed (see `failed_ids`). Items submitted
+        several times are sent once and get the same result.
+
+        Parameters
+        ----------
+        ids : list
+            List of secondary market item IDs to buy.
+
+        Returns
+        -------
+        results : list
+            List of BuyResult in the order of `ids`.
+
+        """
+        unique_ids = list(dict.fromkeys(ids))
+        response = self.api.buy_on_secondarymarket(unique_ids)
+        if response is None:
+            return [BuyResult(item_id, False, None) for item_id in ids]
+
+        failed = failed_ids(response, unique_ids)
+        if len(unique_ids) > 1:
+            logger.info('Bought {} of {} items with one request.'
+                        .format(len(unique_ids) - len(failed),
+                                len(unique_ids)))
+        return [BuyResult(item_id, item_id not in failed,
+                          response.status_code) for item_id in ids]
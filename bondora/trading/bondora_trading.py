@@ -6,7 +6,8 @@ import sys
 import inspect
 import urllib3
 import time
-from datetime import date, datetime, timedelta
+import itertools
+import numpy as np
 from setup_logger import logger
 
 currentdir = os.path.dirname(
@@ -15,7 +16,18 @@ parentdir = os.path.dirname(currentdir)
 sys.path.insert(0, parentdir)
 
 from setup_logger import logger
-from api.bondora_api import BondoraApi
+from setup_metrics import WEBHOOK_DECISIONS, BUYS_ATTEMPTED, BUYS_SUCCEEDED
+from api.bondora_api import BondoraApi, ListingError, PAGE_SIZE
+from api.retry import RETRY_STATUS_CODES
+from trading.batching import (BuyDispatcher, BuyResult, failed_ids,
+                              BATCH_WINDOW, BATCH_SIZE)
+from trading.auctions import AuctionBidder
+from trading.completion import CompletionTracker
+from trading.ledger import BalanceLedger, RESERVED, DUPLICATE
+from trading.frame import PortfolioFrame, MarketFrame
+from trading.rules import RuleEngine
+from trading.seen_items import (SeenItems, SKIPPED, FAILED_EVALUATION,
+                                BUYING, BOUGHT, BUY_FAILED)
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -25,51 +37,101 @@ PATH_DATA = '/var/www/flask/bondora'
 class BondoraTrading(BondoraApi):
     """Class representation of trading on Bondora."""
 
-    def __init__(self, user):
+    def __init__(self, user, buy_window=None, buy_batch_size=BATCH_SIZE,
+                 rules=None, seen=None, completion=None, ledger=None,
+                 bidder=None, portfolio=None, **kwargs):
         self.user = user
-        BondoraApi.__init__(self, self.user)
+        BondoraApi.__init__(self, self.user, **kwargs)
+        # buying strategies loaded from config
+        self.rules = rules or RuleEngine()
+        # decisions about items of previous webhooks
+        self.seen = seen or SeenItems()
+        # waits for asynchronous operations to be completed
+        self.completion = completion or CompletionTracker(self)
+        # funds available for buying without balance requests
+        self.ledger = ledger or BalanceLedger(self)
+        # coalesce buys of concurrent webhooks, if window is provided
+        self.buy_dispatcher = None
+        if buy_window:
+            self.buy_dispatcher = BuyDispatcher(self, buy_window,
+                                                buy_batch_size)
+        # local store of investments, if provided
+        self.portfolio = portfolio
+        # bid on auctions in batches
+        self.bidder = bidder or AuctionBidder(
+            self, window=buy_window or BATCH_WINDOW,
+            max_items=buy_batch_size, ledger=self.ledger)
 
     def bid_loan(self, auction):
         """
-        Make bid into specified auction.
+        Make bid into specified auction, if bidding conditions are satisfied.
+
+        The bid is sent together with the bids of concurrent webhooks
+        by `self.bidder` without waiting for the result.
 
         Parameters
         ----------
-        hook : dict
-            Loan related data with summary, collection process, and schedules.
+        auction : dict
+            Auction related data of an `auction.published` webhook.
 
         Returns
         -------
         None.
 
         """
-        loan_selector = False
         try:
-            # get payload
-            if 'EventType' not in auction:
-                return None
-            else:
-                if auction['EventType'] != 'auction.published':
-                    return None
-                else:
-                    payload = auction['Payload']
-
-            if loan_selector:
-                self.bid_on_auction([payload['AuctionId']], 5)
-                today = datetime.now()
-                with open(PATH_DATA + '/bid_{}.log'.format(
-                        self.user[0:5]), 'a') as outfile:
-                    outfile.write(
-                        (today + timedelta(seconds=0*60*60)
-                         ).strftime(
-                             '%d.%m.%Y %H:%M:%S') + ': Try to invest 5 EUR\n')
-
+            self.bidder.on_webhook(auction)
         except Exception as e:
             logger.error(e)
 
-    def buy_green_loan(self, loan):
+    def bid_auctions(self, retry=False, **kwargs):
         """
-        Buy green loan on secondary market, if buying conditions are satisfied.
+        Bid on all active auctions satisfying bidding strategies.
+
+        Auctions can be specified by the conditions defined in `kwargs`.
+        See the full list of possible conditions at:
+        https://api.bondora.com/doc/Api/GET-api-v1-auctions?v=1
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Auction conditions.
+
+        Returns
+        -------
+        results : list
+            List of BidResult of the new bids.
+
+        """
+        return self.bidder.sweep(retry, **kwargs)
+
+    def track_bids(self, retry=False):
+        """
+        Update status of outstanding bids.
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+
+        Returns
+        -------
+        counts : dict
+            Number of outstanding bids by status, or None, if the bids
+            could not be loaded.
+
+        """
+        return self.bidder.track(retry)
+
+    def buy_loan(self, loan):
+        """
+        Buy loan on secondary market, if any buying strategy is satisfied.
+
+        All groups of strategies are evaluated (see `self.rules`) and
+        the item is bought once for the first satisfied group.
 
         Parameters
         ----------
@@ -81,61 +143,31 @@ class BondoraTrading(BondoraApi):
         None.
 
         """
-        loan_selector = False
-        try:
-            # get payload
-            if 'EventType' not in loan:
+        payload = self._sm_payload(loan)
+        if payload is None:
+            return None
+        context = self.rules.context()
+        for group in self.rules.groups:
+            if self._buy_group(group, payload, context):
                 return None
-            else:
-                if loan['EventType'] not in ['secondmarket.published',
-                                             'secondmarket.updated']:
-                    return None
-                else:
-                    payload = loan['Payload']
-
-            # check buying conditions
-            today = datetime.now()
-            next_pm_date = date.fromisoformat(payload['NextPaymentDate'][:10])
-            pm_date_min = (today + timedelta(days=7)).date()
-            loan_selector = (
-                payload['NextPaymentNr'] == 1
-                and
-                payload['DesiredDiscountRate'] <= 2.0
-                and
-                payload['LoanStatusCode'] == 2
-                and
-                not payload['ReScheduledOn']
-                and
-                not payload['DebtOccuredOn']
-                and
-                not payload['DebtOccuredOnForSecondary']
-                and
-                payload['LateAmountTotal'] == 0.0
-                and
-                payload['Amount'] <= 5.0
-                and
-                payload['Interest'] > 12.0
-                and
-                payload['NrOfScheduledPayments'] > 36
-                and
-                next_pm_date > pm_date_min
-                )
-
-            if loan_selector:
-                self.buy_on_secondarymarket([payload['Id']])
-                #with open(PATH_DATA + '/buy_green_{}.log'.format(
-                #        self.user[0:5]), 'a') as outfile:
-                #    outfile.write(
-                #        (today + timedelta(seconds=0*60*60)
-                #         ).strftime('%d.%m.%Y %H:%M:%S') + ': Try to invest ' +
-                #        str(payload['Price']) +
-                #        ' EUR in ' + payload['LoanPartId'] +
-                #        ' on the secondary market with discount ' +
-                #        str(payload['DesiredDiscountRate']) + '\n')
 
-        except Exception as e:
-            #logger.error(e)
-            pass
+    def buy_green_loan(self, loan):
+        """
+        Buy green loan on secondary market, if buying conditions are satisfied.
+
+        Parameters
+        ----------
+        loan : dict
+            Loan related data with summary, collection process, and schedules.
+
+        Returns
+        -------
+        None.
+
+        """
+        payload = self._sm_payload(loan)
+        if payload is not None:
+            self._buy_group('green', payload)
 
     def buy_red_loan(self, loan):
         """
@@ -151,100 +183,246 @@ class BondoraTrading(BondoraApi):
         None.
 
         """
-        loan_selector_1 = False
-        loan_selector_2 = False
+        payload = self._sm_payload(loan)
+        if payload is not None:
+            self._buy_group('red', payload)
+
+    @staticmethod
+    def _sm_payload(loan):
+        """Get payload of a secondary market webhook or None."""
         try:
-            # get payload
-            if 'EventType' not in loan:
+            if loan['EventType'] not in ['secondmarket.published',
+                                         'secondmarket.updated']:
                 return None
+            return loan['Payload']
+        except Exception:
+            return None
+
+    def _buy_group(self, group, payload, context=None):
+        """
+        Buy item, if a strategy of the group is satisfied.
+
+        Decisions are remembered in `self.seen`. A repeated webhook of
+        an item with unchanged decision relevant fields gets the
+        remembered decision, so the item is neither evaluated nor
+        bought again. Buys with unknown outcome, e.g. without response
+        or with status code 429 or 5xx, are forgotten, so that a later
+        webhook can buy the item. Items, whose price exceeds the funds available
+        according to `self.ledger`, are skipped without any request.
+
+        Parameters
+        ----------
+        group : str
+            Group of strategies, e.g. 'green' or 'red'.
+        payload : dict
+            Secondary market item.
+        context : dict, optional
+            Thresholds of the current tick. The default is None.
+
+        Returns
+        -------
+        bought : bool
+            True, if the item was selected for buying.
+
+        """
+        item_id = None
+        try:
+            if context is None:
+                context = self.rules.context()
+            # answer repeated webhooks of unchanged items from the index
+            key = (group, payload['Id'])
+            digest = self.rules.digest(payload, context)
+            outcome = self.seen.get(key, digest)
+            if outcome is not None:
+                WEBHOOK_DECISIONS.labels(group, 'duplicate').inc()
+                return outcome in [BUYING, BOUGHT, BUY_FAILED]
+
+            strategy, error = self.rules.evaluate(payload, group, context)
+            if strategy is None:
+                outcome = FAILED_EVALUATION if error else SKIPPED
+                self.seen.put(key, digest, outcome)
+                WEBHOOK_DECISIONS.labels(group, outcome).inc()
+                return False
+
+            # skip items, which cannot be afforded, without remembering
+            # them, since funds may be available later, and items, whose
+            # funds are reserved by a concurrent webhook buying them
+            reservation = self.ledger.reserve(payload['Id'],
+                                              payload.get('Price', 0.0))
+            if reservation != RESERVED:
+                WEBHOOK_DECISIONS.labels(group, reservation).inc()
+                return reservation == DUPLICATE
+            item_id = payload['Id']
+
+            # only one of concurrent webhooks of the item buys it
+            if self.seen.claim(key, digest, BUYING) is not None:
+                self.ledger.release(item_id)
+                WEBHOOK_DECISIONS.labels(group, 'duplicate').inc()
+                return True
+            WEBHOOK_DECISIONS.labels(group, 'buy').inc()
+            try:
+                result = self._buy_item(group, item_id)
+            except Exception:
+                # outcome unknown, e.g. the batch failed or timed out
+                self.seen.discard(key)
+                raise
+            if result.success:
+                self.ledger.settle(item_id)
+                self.seen.put(key, digest, BOUGHT)
             else:
-                if loan['EventType'] not in ['secondmarket.published',
-                                             'secondmarket.updated']:
-                    return None
+                self.ledger.release(item_id, discrepancy=True)
+                if result.status_code in RETRY_STATUS_CODES:
+                    self.seen.discard(key)
                 else:
-                    payload = loan['Payload']
-
-            today = datetime.now()
-            # check buying conditions 1
-            loan_selector_1 = (
-                payload['DesiredDiscountRate'] <= -94.0
-                and
-                payload['Price'] <= 5.0
-                )
-
-            if loan_selector_1:
-                self.buy_on_secondarymarket([payload['Id']])
-                #with open(PATH_DATA + '/buy_red_{}.log'.format(
-                #        self.user[0:5]), 'a') as outfile:
-                #    outfile.write(
-                #        (today + timedelta(seconds=0*60*60)
-                #         ).strftime('%d.%m.%Y %H:%M:%S') + ': Try to invest ' +
-                #        'with with discount at least 94% ' +
-                #        str(payload['Price']) +
-                #        ' EUR in ' + payload['LoanPartId'] +
-                #        ' on the secondary market with discount ' +
-                #        str(payload['DesiredDiscountRate']) + '\n')
-                return None
+                    self.seen.put(key, digest, BUY_FAILED)
+            return True
+        except Exception as e:
+            logger.error(e)
+            if item_id is not None:
+                self.ledger.release(item_id, discrepancy=True)
+            WEBHOOK_DECISIONS.labels(group, 'error').inc()
+            return False
 
-            # check buying conditions 2
-            if payload['DesiredDiscountRate'] > -69.0:
-                return None
-            loan_selector_2 = (
-                # default at least 90 days ago
-                date.fromisoformat(payload['DebtOccuredOn'][:10]) <
-                (today - timedelta(days=90)).date()
-                and
-                # last payment after last event
-                date.fromisoformat(
-                    payload['DebtManagmentEvents'][1]['CreatedOn'][:10]) <
-                date.fromisoformat(payload['LoanTransfers'][-1]['Date'][:10])
-                and
-                # at leat 3 payment within last 90 days
-                date.fromisoformat(payload['LoanTransfers'][-1]['Date'][:10]) >
-                (today - timedelta(days=90)).date()
-                and
-                date.fromisoformat(payload['LoanTransfers'][-2]['Date'][:10]) >
-                (today - timedelta(days=90)).date()
-                and
-                date.fromisoformat(payload['LoanTransfers'][-3]['Date'][:10]) >
-                (today - timedelta(days=90)).date()
-                and
-                # payment p.a. is larger than 19% (last payment)
-                (12.0 * payload['LoanTransfers'][-1]['TotalAmount'] /
-                 (payload['PrincipalRemaining'] *
-                  (1.0 + payload['DesiredDiscountRate'] / 100.0))) > 0.19
-                and
-                # payment p.a. is larger than 19% (second last payment)
-                (12.0 * payload['LoanTransfers'][-2]['TotalAmount'] /
-                 (payload['PrincipalRemaining'] *
-                  (1.0 + payload['DesiredDiscountRate'] / 100.0))) > 0.19
-                and
-                # payment p.a. is larger than 19% (third last payment)
-                (12.0 * payload['LoanTransfers'][-3]['TotalAmount'] /
-                 (payload['PrincipalRemaining'] *
-                  (1.0 + payload['DesiredDiscountRate'] / 100.0))) > 0.19
-                and
-                payload['Price'] <= 5.0
-                )
-
-            if loan_selector_2:
-                self.buy_on_secondarymarket([payload['Id']])
-                #with open(PATH_DATA + '/buy_red_{}.log'.format(
-                #        self.user[0:5]), 'a') as outfile:
-                #    outfile.write(
-                #        (today + timedelta(seconds=0*60*60)
-                #         ).strftime('%d.%m.%Y %H:%M:%S') + ': Try to invest ' +
-                #        'with with discount at least 69% ' +
-                #        str(payload['Price']) +
-                #        ' EUR in ' + payload['LoanPartId'] +
-                #        ' on the secondary market with discount ' +
-                #        str(payload['DesiredDiscountRate']) + '\n')
+    def scan_sm(self, retry=False, groups=None, wait=False, **kwargs):
+        """
+        Scan all secondary market items and buy the satisfying ones.
 
-        except Exception as e:
-            #logger.error(e)
-            pass
+        The listing is loaded as snapshot, the buying strategies are
+        evaluated on all items at once with NumPy column operations,
+        and the selected items are bought in batched requests. Items,
+        whose price exceeds the funds available according to
+        `self.ledger`, are skipped. A periodic scan catches items,
+        whose webhooks were missed.
+
+        Loans for scanning can be specified by the conditions defined
+        in `kwargs`. See the full list of possible conditions at:
+        https://api.bondora.com/doc/Api/GET-api-v1-secondarymarket?v=1
+
+        Parameters
+        ----------
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        groups : list, optional
+            Groups of strategies to evaluate. The default is None,
+            i.e. all groups.
+        wait : bool, optional
+            Wait until the bought loans are part of the portfolio.
+            The default is False.
+        **kwargs : dict
+            Keyword arguments:
+                Loans conditions to scan.
+
+        Returns
+        -------
+        results : list
+            List of BuyResult of the bought items.
 
-    def cancel_sm_offers(self, retry=False, **kwargs):
+        """
+        # drop items of a previous call, if loading fails
+        self.sm = None
+        self.get_secondarymarket_snapshot(retry, **kwargs)
+        if not self.sm:
+            logger.warning('No loans offered on secondary market '
+                           'were found.')
+            return []
+
+        # evaluate all strategies on all items at once
+        start = time.perf_counter()
+        frame = MarketFrame.from_items(self.sm)
+        selected = []
+        bought = np.zeros(len(frame), dtype=bool)
+        for group in groups or list(self.rules.groups):
+            for rows in self.rules.scan(frame, group).values():
+                # buy each item at most once
+                rows = rows[~bought[rows]]
+                bought[rows] = True
+                selected.extend(zip(
+                    itertools.repeat(group),
+                    frame['Id'][rows].tolist(),
+                    frame['LoanPartId'][rows].tolist(),
+                    np.nan_to_num(frame['Price'][rows]).tolist()))
+        logger.info('Selected {} of {} loans on secondary market in {:.1f} '
+                    'ms.'.format(len(selected), len(frame),
+                                 1000 * (time.perf_counter() - start)))
+        if not selected:
+            return []
+
+        # buy selected items in batches
+        dispatcher = self.buy_dispatcher or BuyDispatcher(self)
+        futures = []
+        n_unaffordable = 0
+        for group, item_id, part_id, price in selected:
+            reservation = self.ledger.reserve(item_id, price)
+            if reservation != RESERVED:
+                # duplicates are being bought by webhooks
+                n_unaffordable += reservation != DUPLICATE
+                continue
+            BUYS_ATTEMPTED.labels(group).inc()
+            futures.append((group, item_id, part_id,
+                            dispatcher.submit(item_id)))
+        dispatcher.flush()
+        if n_unaffordable:
+            logger.info('Skipped {} selected loans exceeding available '
+                        'funds.'.format(n_unaffordable))
+        results = []
+        bought_part_ids = []
+        for group, item_id, part_id, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(e)
+                self.ledger.release(item_id)
+                continue
+            if result.success:
+                self.ledger.settle(item_id)
+                BUYS_SUCCEEDED.labels(group).inc()
+                bought_part_ids.append(part_id)
+            else:
+                self.ledger.release(item_id, discrepancy=True)
+            results.append(result)
+        logger.info('Bought {} of {} selected loans on secondary market.'
+                    .format(len(bought_part_ids), len(selected)))
+        if wait and bought_part_ids:
+            self.completion.wait_bought(bought_part_ids)
+        return results
+
+    def _buy_item(self, strategy, item_id):
+        """
+        Buy item on secondary market and record the outcome.
+
+        If a buy dispatcher is set up, the item is bought together
+        with the items of concurrent webhooks.
+
+        Parameters
+        ----------
+        strategy : str
+            Name of the buying strategy.
+        item_id : str
+            Secondary market item ID to buy.
+
+        Returns
+        -------
+        result : BuyResult
+            Result of buying the item.
+
+        """
+        BUYS_ATTEMPTED.labels(strategy).inc()
+        if self.buy_dispatcher is not None:
+            result = self.buy_dispatcher.buy(item_id)
+        else:
+            response = self.buy_on_secondarymarket([item_id])
+            if response is None:
+                result = BuyResult(item_id, False, None)
+            else:
+                result = BuyResult(item_id,
+                                   not failed_ids(response, [item_id]),
+                                   response.status_code)
+        if result.success:
+            BUYS_SUCCEEDED.labels(strategy).inc()
+        return result
+
+    def cancel_sm_offers(self, retry=False, stream=False, snapshot=False,
+                         wait=True, **kwargs):
         """
         Cancel selling of own loans offered on secondary market.
 
@@ -256,6 +434,16 @@ class BondoraTrading(BondoraApi):
         ----------
         retry : bool, optional
             Retry to execute the method. The default is False.
+        stream : bool, optional
+            Walk through all pages of offered loans instead of
+            loading the first page only. The default is False.
+        snapshot : bool, optional
+            Load all pages of offered loans concurrently instead of
+            the first page only. The default is False.
+        wait : bool, optional
+            Wait until the canceled offers are removed from secondary
+            market, so that the loans can be placed again.
+            The default is True.
         **kwargs : dict
             Keyword arguments:
                 Loans conditions to cancel.
@@ -265,50 +453,58 @@ class BondoraTrading(BondoraApi):
         None.
 
         """
-        # wait 1 second before proceed
-        time.sleep(1)
-
         # select only own loans offered on secondary market
         if isinstance(kwargs, dict):
             kwargs['ShowMyItems'] = True
         else:
             kwargs = {'ShowMyItems': True}
-        self.get_secondarymarket(retry, **kwargs)
+        if stream:
+            caller = 'iter_secondarymarket'
+            loans_on_sm = self.iter_secondarymarket(retry, **kwargs)
+        elif snapshot:
+            caller = 'get_secondarymarket_snapshot'
+            self.sm = None
+            self.get_secondarymarket_snapshot(retry, **kwargs)
+            loans_on_sm = self.sm or []
+        else:
+            caller = 'get_secondarymarket'
+            self.sm = None
+            self.get_secondarymarket(retry, **kwargs)
+            loans_on_sm = self.sm or []
 
         # get list of secondary market item IDs
         ids = []
-        if self.sm:
-            for loan_on_sm in self.sm:
+        try:
+            for loan_on_sm in loans_on_sm:
                 try:
                     ids.append(loan_on_sm['Id'])
                 except Exception as e:
                     logger.error(e)
-        else:
+        except ListingError as e:
+            # offers of the missing pages would be left on the market
+            logger.error('{} No offers canceled.'.format(e))
+            return None
+        if not ids:
             if self.retry:
-                if 'get_secondarymarket' in self.retry:
+                if caller in self.retry:
                     logger.warning('Too many requests. Retry after {} s.'
-                                   .format(self.retry['get_secondarymarket']))
+                                   .format(self.retry[caller]))
                     return None
             logger.warning('No loans satisfying provided conditions '
                            'and offered for selling were found.')
             return None
 
         # cancel loans offered on secondary market
-        if ids:
-            response = self.cancel_on_secondarymarket(ids)
-            if response.status_code == 202:
-                if len(ids) == 1:
-                    logger.info('1 loan was successfully canceled on '
-                                'secondary market.')
-                else:
-                    logger.info(' {} loans were successfully canceled on '
-                                'secondary market.'.format(len(ids)))
-            else:
-                logger.error('Error by canceling loans on secondary market. '
-                             'Error code: {}'.format(response.status_code))
+        result = self.cancel_on_secondarymarket(ids)
+        self._finish_bulk(result, self.url_cancel_sm, retry,
+                          'canceled on secondary market',
+                          'canceling loans on secondary market')
+        if wait and result is not None and result.succeeded_items:
+            self.completion.wait_canceled(result.succeeded_items)
 
     def place_sm_offers(self, max_price, min_price=None,
-                        days_before_payment=2, retry=False, **kwargs):
+                        days_before_payment=2, retry=False, stream=False,
+                        snapshot=False, wait=False, **kwargs):
         """
         Place loans for selling on secondary market.
 
@@ -330,6 +526,17 @@ class BondoraTrading(BondoraApi):
             The default is 2.
         retry : bool, optional
             Retry to execute the method. The default is False.
+        stream : bool, optional
+            Walk through all pages of investments and put them on
+            secondary market page by page instead of loading the first
+            page only. The default is False.
+        snapshot : bool, optional
+            Load all pages of investments concurrently, or from
+            `self.portfolio`, if set, instead of the first page only.
+            The default is False.
+        wait : bool, optional
+            Wait until the loans are offered on secondary market.
+            The default is False.
         **kwargs : dict
             Keyword arguments:
                 Loans conditions to select for selling.
@@ -339,76 +546,371 @@ class BondoraTrading(BondoraApi):
         None.
 
         """
-        # wait 60 seconds before proceed
-        time.sleep(60)
-
-        price = max_price
-        self.get_investments(retry, **kwargs)
-
-        # calculate latest selling date of loans before the next payment
-        if min_price:
-            latest_sell_date = date.today() + timedelta(
-                days=days_before_payment)
+        if stream:
+            caller = 'iter_investments'
+            investments = self.iter_investments(retry, **kwargs)
+            # number of loans to put on secondary market at once
+            batch_size = PAGE_SIZE
+        elif snapshot:
+            caller = 'get_investments_snapshot'
+            self._load_investments(retry, **kwargs)
+            investments = iter(self.investments or [])
+            batch_size = None
+        else:
+            caller = 'get_investments'
+            self.investments = None
+            self.get_investments(retry, **kwargs)
+            investments = iter(self.investments or [])
+            batch_size = None
 
         # get list of loan parts IDs and selling prices
-        part_ids_prices = []
-        if self.investments:
-            for investment in self.investments:
-                try:
-                    # calculate selling price
-                    if min_price:
-                        next_payment_date = datetime.strptime(
-                            investment['NextPaymentDate'],
-                            '%Y-%m-%dT00:00:00').date()
-                        price = min_price + (next_payment_date -
-                                             latest_sell_date).days
-                        if price > max_price:
-                            price = max_price
-                        elif price < min_price:
-                            price = min_price
-                    part_ids_prices.append((investment['LoanPartId'], price))
-                except Exception as e:
-                    logger.error(e)
-        else:
+        n_loans = 0
+        placed_part_ids = []
+        while True:
+            try:
+                batch = list(itertools.islice(investments, batch_size))
+            except ListingError as e:
+                logger.error('{} Placed {} loans before.'
+                             .format(e, n_loans))
+                return None
+            if not batch:
+                break
+            # calculate selling prices of all loans at once
+            portfolio = PortfolioFrame.from_items(batch)
+            part_ids_prices = portfolio.part_ids_prices(
+                max_price, min_price, days_before_payment)
+            if len(part_ids_prices) < len(portfolio):
+                logger.error('{} loans without next payment date.'
+                             .format(len(portfolio) - len(part_ids_prices)))
+            if part_ids_prices:
+                n_loans += len(part_ids_prices)
+                result = self._sell_loans(part_ids_prices, retry)
+                if result is not None:
+                    placed_part_ids.extend(
+                        loan[0] for loan in result.succeeded_items)
+
+        if not n_loans:
             if self.retry:
-                if 'get_investments' in self.retry:
+                if caller in self.retry:
                     logger.warning('Too many requests. Retry after {} s.'
-                                   .format(self.retry['get_investments']))
+                                   .format(self.retry[caller]))
                     return None
             logger.warning('No loans satisfying provided conditions '
                            'were found.')
+        elif wait and placed_part_ids:
+            self.completion.wait_listed(placed_part_ids)
+
+    def reconcile_sm_offers(self, max_price, min_price=None,
+                            days_before_payment=2, retry=False,
+                            offer_conditions=None, timeout=None, **kwargs):
+        """
+        Bring own offers on secondary market to the target prices.
+
+        Unlike `cancel_sm_offers` followed by `place_sm_offers`, only
+        the differences are sent: offers with unchanged price are left
+        alone, loans not offered yet are put on secondary market, offers
+        of loans not selected anymore are canceled, and offers with
+        changed price are canceled and placed again with the new price.
+
+        Loans for selling can be specified by the conditions defined
+        in `kwargs`. See the full list of possible conditions at:
+        https://api.bondora.com/doc/Api/GET-api-v1-account-investments?v=1
+        The selling prices are calculated like in `place_sm_offers`.
+        If `self.portfolio` is set, the investments are taken from the
+        incrementally synced portfolio store.
+
+        Parameters
+        ----------
+        max_price : int
+            Maximal price to sell loan.
+        min_price : int, optional
+            Minimal price to sell loan. The default is None.
+        days_before_payment : int, optional
+            Latest selling date of loans before the next payment.
+            The default is 2.
+        retry : bool, optional
+            Retry to execute the method. The default is False.
+        offer_conditions : dict, optional
+            Conditions of own offers to reconcile, see
+            https://api.bondora.com/doc/Api/GET-api-v1-secondarymarket?v=1
+            The default is None, i.e. `kwargs`.
+        timeout : float, optional
+            Maximal time in seconds to wait for canceled offers to be
+            removed before placing them again with the new price.
+            The default is None, i.e. the timeout of `self.completion`.
+        **kwargs : dict
+            Keyword arguments:
+                Loans conditions to select for selling.
+
+        Returns
+        -------
+        summary : dict
+            Number of unchanged, canceled, placed, and replaced offers,
+            and of changed offers, which were not replaced, since their
+            cancellation failed or was not confirmed within `timeout`,
+            or None, if offers or investments could not be loaded.
+
+        """
+        # get own offers on secondary market
+        offer_conditions = dict(kwargs if offer_conditions is None
+                                else offer_conditions)
+        offer_conditions['ShowMyItems'] = True
+        # drop items of a previous call, if loading fails
+        self.sm = None
+        self.get_secondarymarket_snapshot(retry, **offer_conditions)
+        if self.sm is None:
+            logger.error('Error by loading offers on secondary market.')
             return None
+        offers = list(self.sm)
 
-        # sell loans on secondary market
-        if part_ids_prices:
-            response = self.sell_on_secondarymarket(part_ids_prices)
-            if response.status_code == 202:
-                if len(part_ids_prices) == 1:
-                    logger.info('1 loan was successfully put on '
-                                'secondary market for selling.')
-                else:
-                    logger.info(' {} loans were successfully put on '
-                                'secondary market for selling.'
-                                .format(len(part_ids_prices)))
+        # get investments and their target prices
+        self._load_investments(retry, **kwargs)
+        if self.investments is None:
+            logger.error('Error by loading investments.')
+            return None
+        part_ids_prices = []
+        if self.investments:
+            portfolio = PortfolioFrame.from_items(self.investments)
+            part_ids_prices = portfolio.part_ids_prices(
+                max_price, min_price, days_before_payment)
+
+        cancel_ids, new_loans, changed_loans, n_unchanged = \
+            self._diff_offers(offers, part_ids_prices)
+        summary = {'unchanged': n_unchanged,
+                   'canceled': len(cancel_ids) - len(changed_loans),
+                   'placed': len(new_loans),
+                   'replaced': len(changed_loans)}
+        logger.info('Reconciling offers on secondary market: {} unchanged, '
+                    '{} to cancel, {} to place, {} to replace.'
+                    .format(summary['unchanged'], summary['canceled'],
+                            summary['placed'], summary['replaced']))
+
+        canceled_ids = set()
+        if cancel_ids:
+            result = self.cancel_on_secondarymarket(cancel_ids)
+            # changed loans are placed again only after the retries
+            future = self._finish_bulk(result, self.url_cancel_sm, retry,
+                                       'canceled on secondary market',
+                                       'canceling loans on secondary market')
+            if future is not None:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(e)
+            if result is not None:
+                canceled_ids = set(result.succeeded_items)
+        if new_loans:
+            self._sell_loans(new_loans, retry)
+
+        # loans are placed again only after all their offers are removed
+        offer_ids = {}
+        for offer in offers:
+            offer_ids.setdefault(offer['LoanPartId'], set()).add(offer['Id'])
+        changed_ids = set()
+        for part_id, _ in changed_loans:
+            changed_ids |= offer_ids[part_id]
+        removed_ids = set()
+        if changed_ids & canceled_ids:
+            remaining = self.completion.wait_canceled(
+                changed_ids & canceled_ids, timeout)
+            if remaining is not None:
+                removed_ids = (changed_ids & canceled_ids) - remaining
+        replaced_loans = [loan for loan in changed_loans
+                          if offer_ids[loan[0]] <= removed_ids]
+        if replaced_loans:
+            self._sell_loans(replaced_loans, retry)
+        summary['replaced'] = len(replaced_loans)
+        summary['not_replaced'] = len(changed_loans) - len(replaced_loans)
+        if summary['not_replaced']:
+            logger.warning('{} offers with changed price were not replaced, '
+                           'since their cancellation was not confirmed.'
+                           .format(summary['not_replaced']))
+        return summary
+
+    def _load_investments(self, retry, **kwargs):
+        """
+        Load investments from the portfolio store or from the API.
+
+        If a portfolio store is set and supports the conditions, it is
+        synced incrementally and queried locally. Otherwise, all pages
+        of investments are loaded concurrently.
+
+        Parameters
+        ----------
+        retry : bool
+            Retry to execute the requests.
+        **kwargs : dict
+            Keyword arguments:
+                Loans conditions to select.
 
+        Returns
+        -------
+        None.
+
+        """
+        # drop investments of a previous call, if loading fails
+        self.investments = None
+        if self.portfolio is not None and self.portfolio.supports(kwargs):
+            if self.portfolio.sync(self, retry) is not None:
+                self.investments = self.portfolio.investments(**kwargs)
+                return None
+            logger.warning('Portfolio store could not be synced.')
+        self.get_investments_snapshot(retry, **kwargs)
+
+    @staticmethod
+    def _diff_offers(offers, part_ids_prices):
+        """
+        Compare own offers with the target prices of loans.
+
+        Parameters
+        ----------
+        offers : list
+            Own secondary market items.
+        part_ids_prices : list
+            List of tuples (LoanPartId, DesiredDiscountRate) to offer.
+
+        Returns
+        -------
+        cancel_ids : list
+            Secondary market item IDs of offers to cancel.
+        new_loans : list
+            Tuples (LoanPartId, DesiredDiscountRate) of loans to place.
+        changed_loans : list
+            Tuples (LoanPartId, DesiredDiscountRate) of loans to place
+            again after canceling their offers.
+        n_unchanged : int
+            Number of offers with target price.
+
+        """
+        targets = dict(part_ids_prices)
+        cancel_ids = []
+        changed_loans = []
+        offered = set()
+        n_unchanged = 0
+        for offer in offers:
+            part_id = offer['LoanPartId']
+            if part_id in offered:
+                # duplicated offer of the same loan
+                cancel_ids.append(offer['Id'])
+                continue
+            offered.add(part_id)
+            price = targets.get(part_id)
+            if price is None:
+                cancel_ids.append(offer['Id'])
+            elif offer['DesiredDiscountRate'] == price:
+                n_unchanged += 1
             else:
-                if retry:
-                    # set waite time to 60 s.
-                    wait_time = 60
-                    # wait before proceed with the second attempt
-                    time.sleep(wait_time)
-                    logger.info('Retry selling.')
-                    response = self.sell_on_secondarymarket(part_ids_prices)
-                    if response.status_code == 202:
-                        if len(part_ids_prices) == 1:
-                            logger.info('1 loan was successfully put on '
-                                        'secondary market for selling.')
-                        else:
-                            logger.info(' {} loans were successfully put on '
-                                        'secondary market for selling.'
-                                        .format(len(part_ids_prices)))
-                        return None
-
-                logger.error('Error by putting loans on secondary market. '
-                             'Error code: {}'
-                             .format(response.status_code))
+                cancel_ids.append(offer['Id'])
+                changed_loans.append((part_id, price))
+        new_loans = [(part_id, price) for part_id, price in part_ids_prices
+                     if part_id not in offered]
+        return cancel_ids, new_loans, changed_loans, n_unchanged
+
+    def _sell_loans(self, part_ids_prices, retry):
+        """
+        Sell loans on secondary market.
+
+        Parameters
+        ----------
+        part_ids_prices : list
+            List of tuples (LoanPartId, DesiredDiscountRate) to sell.
+        retry : bool
+            Retry to send the failed chunks of loans.
+
+        Returns
+        -------
+        result : BulkResult object
+            Status of every chunk and loan of the first attempt.
+
+        """
+        result = self.sell_on_secondarymarket(part_ids_prices)
+        self._finish_bulk(result, self.url_sell_sm, retry,
+                          'put on secondary market for selling',
+                          'putting loans on secondary market')
+        return result
+
+    def _finish_bulk(self, result, url, retry, done, action):
+        """
+        Log outcome of a bulk operation and retry its failed chunks.
+
+        The failed chunks are retried in background according to the
+        retry policy of `url`, and the outcome is logged after the
+        last attempt.
+
+        Parameters
+        ----------
+        result : BulkResult object
+            Result of the operation.
+        url : str
+            URL of the operation.
+        retry : bool
+            Retry to send the failed chunks.
+        done : str
+            Description of the succeeded operation.
+        action : str
+            Description of the operation for errors.
+
+        Returns
+        -------
+        future : concurrent.futures.Future object
+            Future of the result of the last attempt, or None,
+            if no retry is scheduled.
+
+        """
+        if result is None or result.ok or not retry:
+            self._log_bulk_result(result, done, action)
+            return None
+
+        def attempt(previous):
+            logger.info('Retry {}.'.format(action))
+            result = previous.retry()
+            return result, result.status_code, None
+
+        def log(future):
+            if future.exception() is None:
+                self._log_bulk_result(future.result(), done, action)
+
+        future = self.retry_scheduler.resume(
+            url, attempt, (result, result.status_code, None), 'POST')
+        future.add_done_callback(log)
+        return future
+
+    @staticmethod
+    def _log_bulk_result(result, done, action):
+        """
+        Log outcome of a bulk operation.
+
+        Parameters
+        ----------
+        result : BulkResult object
+            Result of the operation.
+        done : str
+            Description of the succeeded operation.
+        action : str
+            Description of the operation for errors.
+
+        Returns
+        -------
+        None.
+
+        """
+        if result is None:
+            logger.error('Error by {}.'.format(action))
+            return None
+
+        n_succeeded = len(result.succeeded_items)
+        if n_succeeded == 1:
+            logger.info('1 loan was successfully {}.'.format(done))
+        elif n_succeeded > 1:
+            logger.info('{} loans were successfully {} in {:.1f} s.'
+                        .format(n_succeeded, done, result.elapsed))
+
+        failed_items = result.failed_items
+        if failed_items:
+            logger.error('Error by {}. {} of {} loans failed in {} of {} '
+                         'requests. Error code: {}'
+                         .format(action, len(failed_items),
+                                 n_succeeded + len(failed_items),
+                                 len(result.failed_chunks),
+                                 len(result.chunks),
+                                 result.status_code))
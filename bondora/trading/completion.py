@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of a completion tracker."""
+
+import time
+from datetime import date, timedelta
+from api.bondora_api import ListingError
+from setup_logger import logger
+
+# first interval in seconds between polls
+POLL_INTERVAL = 2.0
+# maximal interval in seconds between polls
+MAX_POLL_INTERVAL = 15.0
+# factor of the interval after each poll
+POLL_BACKOFF = 1.5
+# maximal time in seconds to wait for completion
+COMPLETION_TIMEOUT = 180.0
+# days of the event log searched for confirmations
+EVENT_DAYS = 1
+# event types confirming operations on secondary market
+EVENT_LISTED = 'secondmarket.listed'
+EVENT_CANCELED = 'secondmarket.canceled'
+
+
+class CompletionTracker:
+    """
+    Wait for asynchronous operations of Bondora API to be completed.
+
+    Buy, sell, and cancel requests are accepted (202) before they are
+    executed. Instead of sleeping for a fixed time, the tracker polls
+    the state of the submitted items with growing intervals and returns
+    as soon as they are confirmed, or when the timeout is over. Offers
+    are confirmed by the recent events of the event log, bought loans
+    by their loan part info, so no poll loads the whole secondary
+    market or changes the state of `api`.
+
+    """
+
+    def __init__(self, api, timeout=COMPLETION_TIMEOUT,
+                 interval=POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL,
+                 backoff=POLL_BACKOFF):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to poll the state.
+        timeout : float, optional
+            Maximal time in seconds to wait.
+            The default is COMPLETION_TIMEOUT.
+        interval : float, optional
+            First interval in seconds between polls.
+            The default is POLL_INTERVAL.
+        max_interval : float, optional
+            Maximal interval in seconds between polls.
+            The default is MAX_POLL_INTERVAL.
+        backoff : float, optional
+            Factor of the interval after each poll.
+            The default is POLL_BACKOFF.
+
+        """
+        self.api = api
+        self.timeout = timeout
+        self.interval = interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+    def wait(self, pending, description, timeout=None):
+        """
+        Poll until no items are pending.
+
+        Parameters
+        ----------
+        pending : function
+            Function returning the set of pending items, or None,
+            if the state could not be loaded.
+        description : str
+            Description of the operation for logging.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None,
+            i.e. `self.timeout`.
+
+        Returns
+        -------
+        remaining : set
+            Items not confirmed before the timeout, i.e. an empty set,
+            if all items were confirmed, or None, if the state could
+            not be loaded.
+
+        """
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        interval = self.interval
+        remaining = None
+        while True:
+            remaining = pending()
+            elapsed = time.monotonic() - start
+            if remaining is not None and not remaining:
+                logger.info('{} completed in {:.1f} s.'
+                            .format(description, elapsed))
+                return remaining
+            if elapsed + interval > timeout:
+                break
+            time.sleep(interval)
+            interval = min(interval * self.backoff, self.max_interval)
+        logger.warning('{} not completed within {:.0f} s, {} items pending.'
+                       .format(description, timeout,
+                               'unknown' if remaining is None
+                               else len(remaining)))
+        return remaining
+
+    def _recent_events(self):
+        """Get recent events in chronological order, or None on errors."""
+        since = (date.today() - timedelta(days=EVENT_DAYS)).strftime(
+            '%Y-%m-%d')
+        try:
+            events = list(self.api.iter_eventlog(False, EventDateFrom=since))
+        except ListingError as e:
+            logger.error(e)
+            return None
+        return sorted(events, key=lambda event: event.get('EventDate') or '')
+
+    def wait_canceled(self, ids, timeout=None):
+        """
+        Wait until canceled offers are removed from secondary market.
+
+        Parameters
+        ----------
+        ids : iterable
+            Secondary market item IDs of canceled offers.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None,
+            i.e. `self.timeout`.
+
+        Returns
+        -------
+        remaining : set
+            IDs of offers not removed before the timeout, or None,
+            if the event log could not be loaded.
+
+        """
+        ids = set(ids)
+
+        def pending():
+            events = self._recent_events()
+            if events is None:
+                return None
+            # item IDs are unique per offer
+            return ids - {event['Payload'].get('Id') for event in events
+                          if event.get('EventType') == EVENT_CANCELED}
+
+        return self.wait(pending, 'Canceling {} offers'.format(len(ids)),
+                         timeout)
+
+    def wait_listed(self, part_ids, timeout=None):
+        """
+        Wait until loans are offered on secondary market.
+
+        Parameters
+        ----------
+        part_ids : iterable
+            Loan part IDs of loans put on secondary market.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None,
+            i.e. `self.timeout`.
+
+        Returns
+        -------
+        remaining : set
+            Loan part IDs not offered before the timeout, or None,
+            if the event log could not be loaded.
+
+        """
+        part_ids = set(part_ids)
+
+        def pending():
+            events = self._recent_events()
+            if events is None:
+                return None
+            # a loan part is offered, if its latest event is a listing,
+            # e.g. not the cancellation of a replaced offer
+            latest = {}
+            for event in events:
+                if event.get('EventType') in [EVENT_LISTED, EVENT_CANCELED]:
+                    latest[event['Payload'].get('LoanPartId')] = (
+                        event['EventType'])
+            return {part_id for part_id in part_ids
+                    if latest.get(part_id) != EVENT_LISTED}
+
+        return self.wait(pending, 'Placing {} offers'.format(len(part_ids)),
+                         timeout)
+
+    def wait_bought(self, part_ids, timeout=None):
+        """
+        Wait until bought loans are part of the portfolio.
+
+        Parameters
+        ----------
+        part_ids : iterable
+            Loan part IDs of bought secondary market items.
+        timeout : float, optional
+            Maximal time in seconds to wait. The default is None,
+            i.e. `self.timeout`.
+
+        Returns
+        -------
+        remaining : set
+            Loan part IDs not bought before the timeout.
+
+        """
+        part_ids = set(part_ids)
+
+        def pending():
+            # only own loan parts are returned
+            return part_ids - set(self.api.get_loanparts_bulk(list(part_ids)))
+
+        return self.wait(pending, 'Buying {} loans'.format(len(part_ids)),
+                         timeout)
@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""The file contains columnar frames of Bondora payloads."""
+
+import numpy as np
+from datetime import date
+
+# kinds of columns
+FLOAT = 'float'
+DATE = 'date'
+OBJECT = 'object'
+
+
+def parse_dates(values):
+    """
+    Parse ISO dates, e.g. '2021-03-01T00:00:00', to datetime64[D].
+
+    The dates are parsed by NumPy in one pass. If any value is malformed,
+    the values are parsed one by one and the malformed ones become NaT.
+
+    Parameters
+    ----------
+    values : list
+        Date strings or None.
+
+    Returns
+    -------
+    dates : numpy.ndarray
+        Parsed dates, NaT for missing or malformed values.
+
+    """
+    try:
+        return np.array([value[:10] if value else 'NaT' for value in values],
+                        dtype='datetime64[D]')
+    except (TypeError, ValueError):
+        pass
+    dates = np.full(len(values), np.datetime64('NaT'), dtype='datetime64[D]')
+    for i, value in enumerate(values):
+        try:
+            if isinstance(value, str):
+                dates[i] = np.datetime64(value[:10], 'D')
+            elif isinstance(value, date):
+                dates[i] = np.datetime64(value, 'D')
+        except ValueError:
+            pass
+    return dates
+
+
+class Frame:
+    """
+    Columnar table of payload items backed by NumPy arrays.
+
+    The columns are defined in `COLUMNS` as mapping of payload keys to
+    kinds of columns: FLOAT (missing values are NaN), DATE (dates of
+    type datetime64[D], missing values are NaT) or OBJECT.
+
+    """
+
+    COLUMNS = {}
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    @classmethod
+    def from_items(cls, items, columns=None):
+        """
+        Create frame from payload items.
+
+        Parameters
+        ----------
+        items : iterable
+            Payload items as dicts or records.
+        columns : dict, optional
+            Columns to load as mapping of keys to kinds of columns.
+            The default is None, i.e. `COLUMNS`.
+
+        Returns
+        -------
+        frame : Frame object
+            Frame with the columns of the items.
+
+        """
+        columns = columns or cls.COLUMNS
+        values = {key: [] for key in columns}
+        for item in items:
+            for key, column in values.items():
+                column.append(item.get(key))
+
+        arrays = {}
+        for key, kind in columns.items():
+            column = values[key]
+            if kind == FLOAT:
+                arrays[key] = np.array(
+                    [np.nan if value is None else value for value in column],
+                    dtype=float)
+            elif kind == DATE:
+                arrays[key] = parse_dates(column)
+            else:
+                arrays[key] = np.array(column, dtype=object)
+        return cls(arrays)
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, key):
+        return self.columns[key]
+
+    def __contains__(self, key):
+        return key in self.columns
+
+    def filter(self, mask):
+        """
+        Select rows of the frame.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            Boolean mask or indices of the rows.
+
+        Returns
+        -------
+        frame : Frame object
+            Frame with the selected rows.
+
+        """
+        return type(self)({key: column[mask]
+                           for key, column in self.columns.items()})
+
+    def where(self, **conditions):
+        """
+        Select rows with the specified values.
+
+        Parameters
+        ----------
+        **conditions : dict
+            Keyword arguments:
+                Values of columns, e.g. `LoanStatusCode=2`.
+                A list or tuple selects any of its values.
+
+        Returns
+        -------
+        frame : Frame object
+            Frame with the selected rows.
+
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for key, value in conditions.items():
+            if isinstance(value, (list, tuple, set)):
+                mask &= np.isin(self.columns[key], list(value))
+            else:
+                mask &= self.columns[key] == value
+        return self.filter(mask)
+
+
+class PortfolioFrame(Frame):
+    """Columnar table of investments."""
+
+    COLUMNS = {'LoanPartId': OBJECT,
+               'NextPaymentDate': DATE,
+               'PrincipalRemaining': FLOAT,
+               'LoanStatusCode': FLOAT,
+               'Interest': FLOAT,
+               'LateAmountTotal': FLOAT}
+
+    def sell_prices(self, max_price, min_price=None, days_before_payment=2,
+                    today=None):
+        """
+        Calculate selling prices of all investments.
+
+        If `min_price` is not specified, the selling price is `max_price`.
+        Otherwise, the price is `min_price` plus the number of days
+        between the latest selling date and the next payment date,
+        clipped to [`min_price`, `max_price`].
+
+        Parameters
+        ----------
+        max_price : int
+            Maximal price to sell loan.
+        min_price : int, optional
+            Minimal price to sell loan. The default is None.
+        days_before_payment : int, optional
+            Latest selling date of loans before the next payment.
+            The default is 2.
+        today : datetime.date, optional
+            Current date. The default is None, i.e. today.
+
+        Returns
+        -------
+        prices : numpy.ndarray
+            Selling prices, NaN for investments without next payment date.
+
+        """
+        if not min_price:
+            return np.full(len(self), max_price, dtype=float)
+
+        latest_sell_date = np.datetime64(today or date.today(), 'D') + \
+            np.timedelta64(days_before_payment, 'D')
+        days = (self.columns['NextPaymentDate'] - latest_sell_date) / \
+            np.timedelta64(1, 'D')
+        return np.clip(min_price + days, min_price, max_price)
+
+    def part_ids_prices(self, max_price, min_price=None,
+                        days_before_payment=2, today=None):
+        """
+        Get loan part IDs and selling prices of all investments.
+
+        Investments without valid next payment date are skipped,
+        if `min_price` is specified.
+
+        Parameters
+        ----------
+        max_price : int
+            Maximal price to sell loan.
+        min_price : int, optional
+            Minimal price to sell loan. The default is None.
+        days_before_payment : int, optional
+            Latest selling date of loans before the next payment.
+            The default is 2.
+        today : datetime.date, optional
+            Current date. The default is None, i.e. today.
+
+        Returns
+        -------
+        part_ids_prices : list
+            List of tuples (LoanPartId, DesiredDiscountRate).
+
+        """
+        prices = self.sell_prices(max_price, min_price, days_before_payment,
+                                  today)
+        valid = ~np.isnan(prices)
+        return [(part_id, int(price) if price.is_integer() else price)
+                for part_id, price in zip(
+                    self.columns['LoanPartId'][valid].tolist(),
+                    prices[valid].tolist())]
+
+
+class MarketFrame(Frame):
+    """
+    Columnar table of secondary market items.
+
+    Besides the columns, the frame keeps the items, so that nested
+    values (e.g. 'LoanTransfers.-1.Date') can be extracted on demand
+    for the rows still in question only.
+
+    """
+
+    COLUMNS = {'Id': OBJECT,
+               'LoanPartId': OBJECT,
+               'Price': FLOAT,
+               'DesiredDiscountRate': FLOAT,
+               'Amount': FLOAT,
+               'Interest': FLOAT,
+               'LoanStatusCode': FLOAT,
+               'NextPaymentNr': FLOAT,
+               'NrOfScheduledPayments': FLOAT,
+               'LateAmountTotal': FLOAT,
+               'PrincipalRemaining': FLOAT,
+               'NextPaymentDate': DATE,
+               'ReScheduledOn': DATE,
+               'DebtOccuredOn': DATE,
+               'DebtOccuredOnForSecondary': DATE,
+               'ListedInSecondMarketOn': DATE}
+
+    def __init__(self, columns, items=None, kinds=None):
+        Frame.__init__(self, columns)
+        self.items = items
+        self.kinds = kinds or self.COLUMNS
+
+    @classmethod
+    def from_items(cls, items, columns=None):
+        """
+        Create frame from secondary market items.
+
+        Parameters
+        ----------
+        items : iterable
+            Secondary market items as dicts or records.
+        columns : dict, optional
+            Columns to load as mapping of keys to kinds of columns.
+            The default is None, i.e. `COLUMNS`.
+
+        Returns
+        -------
+        frame : MarketFrame object
+            Frame with the columns and the items.
+
+        """
+        items = list(items)
+        frame = super().from_items(items, columns)
+        array = np.empty(len(items), dtype=object)
+        array[:] = items
+        return cls(frame.columns, array, columns or cls.COLUMNS)
+
+    def filter(self, mask):
+        """
+        Select rows of the frame.
+
+        Parameters
+        ----------
+        mask : numpy.ndarray
+            Boolean mask or indices of the rows.
+
+        Returns
+        -------
+        frame : MarketFrame object
+            Frame with the selected rows.
+
+        """
+        return type(self)({key: column[mask]
+                           for key, column in self.columns.items()},
+                          None if self.items is None else self.items[mask],
+                          self.kinds)
+
+    def values(self, path, kind, rows):
+        """
+        Extract values of a field for some rows.
+
+        Parameters
+        ----------
+        path : str
+            Key or path of a nested field, e.g. 'LoanTransfers.-1.Date'.
+        kind : str
+            Kind of the values: FLOAT, DATE, or OBJECT.
+        rows : numpy.ndarray
+            Indices of the rows.
+
+        Returns
+        -------
+        values : numpy.ndarray
+            Values of the rows, missing values are NaN, NaT, or None.
+
+        """
+        if path in self.columns and self.kinds.get(path) == kind:
+            return self.columns[path][rows]
+
+        keys = [int(key) if key.lstrip('-').isdigit() else key
+                for key in path.split('.')]
+        values = []
+        for item in self.items[rows]:
+            value = item
+            try:
+                for key in keys:
+                    value = value[key]
+            except (KeyError, IndexError, TypeError):
+                value = None
+            values.append(value)
+
+        if kind == FLOAT:
+            return np.array([np.nan if value is None else value
+                             for value in values], dtype=float)
+        if kind == DATE:
+            return parse_dates(values)
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return array
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of a local balance ledger."""
+
+import time
+import threading
+from setup_logger import logger
+from setup_metrics import BALANCE_AVAILABLE, BALANCE_SYNCS
+
+# seconds between synchronizations with Bondora API
+SYNC_INTERVAL = 300
+# minimal seconds between synchronizations after discrepancies
+MIN_SYNC_INTERVAL = 10
+# difference of balances considered as discrepancy
+TOLERANCE = 0.01
+# outcomes of reservations
+RESERVED = 'reserved'
+DUPLICATE = 'duplicate'
+UNAFFORDABLE = 'unaffordable'
+
+
+class BalanceLedger:
+    """
+    Local ledger of funds available for buying.
+
+    The ledger is seeded from `BondoraApi.get_balance`. Buying an item
+    reserves its price, which is settled, if the buy is accepted, or
+    released otherwise. So the buy path knows without any request,
+    whether an item can be afforded::
+
+        if ledger.reserve(item_id, price) == RESERVED:
+            ...
+            ledger.settle(item_id)  # or ledger.release(item_id)
+
+    The ledger is synchronized with Bondora API at the first
+    reservation, and then every `sync_interval` seconds or after
+    a failed buy in background. Reservations in flight are kept over
+    synchronizations, so the available funds are rather under- than
+    overestimated. If the balance is unknown, e.g. the API is not
+    reachable, reservations are granted and the buy is left to Bondora.
+
+    """
+
+    def __init__(self, api, sync_interval=SYNC_INTERVAL,
+                 min_sync_interval=MIN_SYNC_INTERVAL):
+        """
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to get the balance from.
+        sync_interval : float, optional
+            Seconds between synchronizations. The default is SYNC_INTERVAL.
+        min_sync_interval : float, optional
+            Minimal seconds between synchronizations after discrepancies.
+            The default is MIN_SYNC_INTERVAL.
+
+        """
+        self.api = api
+        self.sync_interval = sync_interval
+        self.min_sync_interval = min_sync_interval
+        self.balance = None
+        self.reserved = {}
+        self.reserved_total = 0.0
+        self.synced_at = None
+        self.discrepancy = False
+        self.syncing = False
+        self.lock = threading.Lock()
+        self.sync_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """Get available funds, or None, if the balance is unknown."""
+        with self.lock:
+            return self._available()
+
+    def _available(self):
+        """Get available funds without locking."""
+        if self.balance is None:
+            return None
+        return self.balance - self.reserved_total
+
+    def sync(self, reason='manual'):
+        """
+        Synchronize the balance with Bondora API.
+
+        Parameters
+        ----------
+        reason : str, optional
+            Reason of the synchronization for metrics.
+            The default is 'manual'.
+
+        Returns
+        -------
+        synced : bool
+            True, if the balance was received.
+
+        """
+        with self.sync_lock:
+            if reason == 'initial' and self.synced_at is not None:
+                # seeded by a concurrent reservation
+                return self.balance is not None
+            self.api.balance = None
+            self.api.get_balance(False)
+            balance = self.api.balance
+            BALANCE_SYNCS.labels(reason).inc()
+            with self.lock:
+                self.synced_at = time.monotonic()
+                self.syncing = False
+                if balance is None:
+                    logger.warning('Balance ledger could not be synchronized.')
+                    self.discrepancy = True
+                    return False
+                if (self.balance is not None
+                        and abs(balance - self.balance) > TOLERANCE):
+                    logger.info('Balance ledger corrected from {:.2f} to '
+                                '{:.2f} ({}).'.format(self.balance, balance,
+                                                      reason))
+                self.balance = balance
+                self.discrepancy = False
+                BALANCE_AVAILABLE.set(self._available())
+            return True
+
+    def _sync_due(self):
+        """Get reason of a due synchronization, or None."""
+        if self.syncing:
+            return None
+        elapsed = time.monotonic() - self.synced_at
+        if self.discrepancy and elapsed >= self.min_sync_interval:
+            return 'discrepancy'
+        if elapsed >= self.sync_interval:
+            return 'interval'
+        return None
+
+    def reserve(self, key, amount):
+        """
+        Reserve funds for buying an item.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the reservation, e.g. secondary market item ID.
+        amount : float
+            Funds to reserve, e.g. price of the item.
+
+        Returns
+        -------
+        outcome : str
+            RESERVED, DUPLICATE, if funds are already reserved for `key`,
+            e.g. by a concurrent webhook of the same item, or UNAFFORDABLE,
+            if the funds are not available.
+
+        """
+        if self.synced_at is None:
+            # seed the ledger before the first buy
+            self.sync('initial')
+        with self.lock:
+            reason = self._sync_due()
+            if reason is not None:
+                self.syncing = True
+                threading.Thread(target=self.sync, args=(reason,),
+                                 name='balance-sync', daemon=True).start()
+            if key in self.reserved:
+                return DUPLICATE
+            available = self._available()
+            if available is not None and amount > available + TOLERANCE:
+                return UNAFFORDABLE
+            self.reserved[key] = amount
+            self.reserved_total += amount
+            if available is not None:
+                BALANCE_AVAILABLE.set(available - amount)
+            return RESERVED
+
+    def settle(self, key):
+        """
+        Spend reserved funds of an accepted buy.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the reservation.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            amount = self.reserved.pop(key, 0.0)
+            self.reserved_total -= amount
+            if self.balance is not None:
+                self.balance -= amount
+
+    def release(self, key, discrepancy=False):
+        """
+        Release reserved funds of a failed or canceled buy.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the reservation.
+        discrepancy : bool, optional
+            Synchronize the balance soon, e.g. because the buy failed
+            although the funds seemed to be available.
+            The default is False.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            amount = self.reserved.pop(key, 0.0)
+            self.reserved_total -= amount
+            if discrepancy:
+                self.discrepancy = True
+            available = self._available()
+            if available is not None:
+                BALANCE_AVAILABLE.set(available)
+
+    def invalidate(self):
+        """
+        Synchronize the balance soon, e.g. after funds were returned.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            self.discrepancy = True
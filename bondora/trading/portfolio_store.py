@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of a local portfolio store."""
+
+import json
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from setup_logger import logger
+from trading.frame import PortfolioFrame
+
+PATH_PORTFOLIO = '/var/www/flask/bondora/portfolio.db'
+
+# filters of investments changed since a date
+CHANGE_FILTERS = ('PurchaseDateFrom', 'LastPaymentDateFrom',
+                  'DebtOccuredOnFrom', 'ReScheduledOnFrom')
+# filters of investments sold since a date
+SOLD_FILTERS = ('SoldDateFrom',)
+# days of overlap with the previous sync, since the filters are dates
+OVERLAP_DAYS = 1
+# days between full syncs correcting changes missed by the filters
+FULL_SYNC_DAYS = 7
+
+# indexed fields of investments, dates are stored without time
+COLUMNS = {'LoanStatusCode': 'INTEGER',
+           'LoanDebtManagementStageType': 'INTEGER',
+           'NextPaymentDate': 'DATE',
+           'LastPaymentDate': 'DATE',
+           'DebtOccuredOn': 'DATE'}
+# loan status code of current loans, loans in any other status may change
+# status or debt management stage without a date matching the filters
+CURRENT_STATUS = 2
+# fields of loans not current refreshed from their loan part info
+REFRESHED_FIELDS = ('LoanStatusCode', 'LoanDebtManagementStageType')
+
+
+def _condition(key):
+    """Get indexed field and operator of a condition or None."""
+    if key in COLUMNS:
+        return key, '='
+    if key.endswith('From') and key[:-4] in COLUMNS:
+        return key[:-4], '>='
+    if key.endswith('To') and key[:-2] in COLUMNS:
+        return key[:-2], '<='
+    return None
+
+
+class PortfolioStore:
+    """
+    Local SQLite store of the investments, synced incrementally.
+
+    The first sync loads all investments. Later syncs load only the
+    investments purchased, paid, defaulted, rescheduled, or sold since
+    the watermark of the previous sync (CHANGE_FILTERS, SOLD_FILTERS),
+    and every `full_sync_days` days all investments are loaded again.
+    Queries use the names of the request information of
+    `get_investments` for the indexed fields (COLUMNS), e.g.::
+
+        store.sync(api)
+        store.investments(NextPaymentDateTo='2021-03-01')
+
+    A current loan falling behind is detected by its debt date, but
+    later changes of the loan status or debt management stage (e.g.
+    a write-off) have no date filter. So each incremental sync also
+    refreshes these fields (REFRESHED_FIELDS) of all stored loans not
+    current from their loan part info, requested in batches of IDs.
+
+    """
+
+    def __init__(self, path=PATH_PORTFOLIO, full_sync_days=FULL_SYNC_DAYS):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            Path of the SQLite database. The default is PATH_PORTFOLIO.
+        full_sync_days : float, optional
+            Days between full syncs. The default is FULL_SYNC_DAYS.
+
+        """
+        self.path = path
+        self.full_sync_days = full_sync_days
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS investments ('
+                'LoanPartId TEXT PRIMARY KEY, {}, Payload TEXT NOT NULL)'
+                .format(', '.join('{} {}'.format(name, kind)
+                                  for name, kind in COLUMNS.items())))
+            for name in COLUMNS:
+                self.connection.execute(
+                    'CREATE INDEX IF NOT EXISTS investments_{0} '
+                    'ON investments ({0})'.format(name))
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS sync_state ('
+                'Key TEXT PRIMARY KEY, Value TEXT)')
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM investments').fetchone()[0]
+
+    def _state(self, key):
+        """Get date of sync state or None."""
+        row = self.connection.execute(
+            'SELECT Value FROM sync_state WHERE Key = ?', (key,)).fetchone()
+        return None if row is None else datetime.fromisoformat(row[0])
+
+    @property
+    def watermark(self):
+        """Get start time of the last successful sync or None."""
+        with self.lock:
+            return self._state('watermark')
+
+    @staticmethod
+    def _row(investment):
+        """Convert investment to a row of the table."""
+        if hasattr(investment, 'to_dict'):
+            investment = investment.to_dict()
+        values = []
+        for name, kind in COLUMNS.items():
+            value = investment.get(name)
+            if kind == 'DATE' and value:
+                value = str(value)[:10]
+            values.append(value)
+        return (investment['LoanPartId'], *values,
+                json.dumps(investment, default=str))
+
+    def sync(self, api, retry=False, full=False):
+        """
+        Bring the store up to date with the investments of the account.
+
+        The watermark is advanced only, if all requests succeeded,
+        so a failed sync is repeated from the same watermark.
+
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to load the investments.
+        retry : bool, optional
+            Retry to execute the requests. The default is False.
+        full : bool, optional
+            Load all investments. The default is False, i.e. only
+            the changes, if the last full sync is not too old.
+
+        Returns
+        -------
+        summary : dict
+            Kind of the sync, number of updated and removed investments,
+            and number of stored investments, or None, if the
+            investments could not be loaded.
+
+        """
+        started = datetime.now()
+        with self.lock:
+            watermark = self._state('watermark')
+            full_sync = self._state('full_sync')
+        full = (full or watermark is None or full_sync is None
+                or started - full_sync > timedelta(days=self.full_sync_days))
+
+        if full:
+            investments = self._load(api, retry, {})
+            if investments is None:
+                return None
+            # only investments without sale date are kept
+            changed = [investment for investment in investments
+                       if not investment.get('SoldDate')]
+            sold = []
+        else:
+            since = (watermark - timedelta(days=OVERLAP_DAYS)).strftime(
+                '%Y-%m-%d')
+            changed = {}
+            sold = set()
+            for key in CHANGE_FILTERS + SOLD_FILTERS:
+                investments = self._load(api, retry, {key: since})
+                if investments is None:
+                    return None
+                for investment in investments:
+                    # only investments with sale date are removed
+                    if investment.get('SoldDate'):
+                        sold.add(investment['LoanPartId'])
+                    else:
+                        changed[investment['LoanPartId']] = investment
+            changed = [investment for part_id, investment in changed.items()
+                       if part_id not in sold]
+            changed.extend(self._refresh(
+                api, retry, sold.union(investment['LoanPartId']
+                                       for investment in changed)))
+
+        rows = [self._row(investment) for investment in changed]
+        with self.lock, self.connection:
+            if full:
+                self.connection.execute('DELETE FROM investments')
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO investments VALUES ({})'.format(
+                    ', '.join('?' * (len(COLUMNS) + 2))), rows)
+            self.connection.executemany(
+                'DELETE FROM investments WHERE LoanPartId = ?',
+                [(part_id,) for part_id in sold])
+            state = [('watermark', started.isoformat())]
+            if full:
+                state.append(('full_sync', started.isoformat()))
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO sync_state VALUES (?, ?)', state)
+            total = self.connection.execute(
+                'SELECT COUNT(*) FROM investments').fetchone()[0]
+
+        summary = {'sync': 'full' if full else 'incremental',
+                   'updated': len(rows),
+                   'removed': len(sold),
+                   'total': total}
+        logger.info('Synced portfolio store ({sync}): {updated} updated, '
+                    '{removed} removed, {total} investments.'
+                    .format(**summary))
+        return summary
+
+    def _refresh(self, api, retry, skip):
+        """
+        Refresh status and debt management stage of loans not current.
+
+        Parameters
+        ----------
+        api : BondoraApi object
+            API to load the loan parts.
+        retry : bool
+            Retry to execute the requests.
+        skip : set
+            Loan part IDs updated or removed by the sync anyway.
+
+        Returns
+        -------
+        refreshed : list
+            Stored investments, whose fields have changed.
+
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT LoanPartId, Payload FROM investments '
+                'WHERE LoanStatusCode IS NOT ?', (CURRENT_STATUS,)).fetchall()
+        stored = {part_id: json.loads(payload) for part_id, payload in rows
+                  if part_id not in skip}
+        if not stored:
+            return []
+        # loan parts not received keep their values until the next sync
+        refreshed = []
+        for loan_part in api.iter_loanparts(list(stored), retry):
+            investment = stored[loan_part['LoanPartId']]
+            changes = {field: loan_part[field] for field in REFRESHED_FIELDS
+                       if field in loan_part
+                       and loan_part[field] != investment.get(field)}
+            if changes:
+                investment.update(changes)
+                refreshed.append(investment)
+        return refreshed
+
+    @staticmethod
+    def _load(api, retry, conditions):
+        """Load all investments satisfying the conditions or None."""
+        api.investments = None
+        api.get_investments_snapshot(retry, **conditions)
+        return api.investments
+
+    @staticmethod
+    def supports(conditions):
+        """
+        Check if the store can answer a query.
+
+        Parameters
+        ----------
+        conditions : dict
+            Request information of `get_investments`.
+
+        Returns
+        -------
+        supported : bool
+            True, if all conditions refer to indexed fields.
+
+        """
+        return all(_condition(key) is not None for key in conditions)
+
+    def investments(self, **conditions):
+        """
+        Get investments from the store.
+
+        Parameters
+        ----------
+        **conditions : dict
+            Keyword arguments:
+                Values of the indexed fields, e.g. LoanStatusCode=2,
+                or ranges of them with the suffixes `From` and `To`,
+                e.g. NextPaymentDateTo='2021-03-01'.
+
+        Returns
+        -------
+        investments : list
+            List of investments.
+
+        """
+        clauses = []
+        values = []
+        for key, value in conditions.items():
+            condition = _condition(key)
+            if condition is None:
+                raise ValueError('Unknown condition {!r} of portfolio store.'
+                                 .format(key))
+            name, op = condition
+            if COLUMNS[name] == 'DATE':
+                value = str(value)[:10]
+            clauses.append('{} {} ?'.format(name, op))
+            values.append(value)
+
+        query = 'SELECT Payload FROM investments'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        with self.lock:
+            rows = self.connection.execute(query, values).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def frame(self, **conditions):
+        """
+        Get investments from the store as PortfolioFrame.
+
+        Parameters
+        ----------
+        **conditions : dict
+            Keyword arguments:
+                Conditions like in `investments`.
+
+        Returns
+        -------
+        frame : PortfolioFrame object
+            Columnar table of the investments.
+
+        """
+        return PortfolioFrame.from_items(self.investments(**conditions))
+
+    def stats(self):
+        """
+        Get number of stored investments by loan status.
+
+        Returns
+        -------
+        stats : dict
+            Dict of loan status codes with numbers of investments.
+
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT LoanStatusCode, COUNT(*) FROM investments '
+                'GROUP BY LoanStatusCode').fetchall()
+        return dict(rows)
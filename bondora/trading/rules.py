@@ -0,0 +1,638 @@
+# -*- coding: utf-8 -*-
+"""The file contains a rule engine of buying strategies."""
+
+import os
+import json
+import time
+import operator
+import numpy as np
+from datetime import date, timedelta
+from setup_logger import logger
+from trading.frame import FLOAT, DATE, OBJECT
+
+PATH_STRATEGIES = '/var/www/flask/bondora/strategies.json'
+
+# seconds between updates of time dependent thresholds and config checks
+TICK = 60
+
+# strategies used, if no config file exists, see `RuleEngine` for format
+DEFAULT_STRATEGIES = {
+    'strategies': [
+        {'name': 'green',
+         'group': 'green',
+         'rules': [
+             {'field': 'NextPaymentNr', 'op': '==', 'value': 1},
+             {'field': 'DesiredDiscountRate', 'op': '<=', 'value': 2.0},
+             {'field': 'LoanStatusCode', 'op': '==', 'value': 2},
+             {'field': 'ReScheduledOn', 'op': 'empty'},
+             {'field': 'DebtOccuredOn', 'op': 'empty'},
+             {'field': 'DebtOccuredOnForSecondary', 'op': 'empty'},
+             {'field': 'LateAmountTotal', 'op': '==', 'value': 0.0},
+             {'field': 'Amount', 'op': '<=', 'value': 5.0},
+             {'field': 'Interest', 'op': '>', 'value': 12.0},
+             {'field': 'NrOfScheduledPayments', 'op': '>', 'value': 36},
+             {'field': 'NextPaymentDate', 'op': '>', 'days': 7}]},
+        {'name': 'red_1',
+         'group': 'red',
+         'rules': [
+             {'field': 'DesiredDiscountRate', 'op': '<=', 'value': -94.0},
+             {'field': 'Price', 'op': '<=', 'value': 5.0}]},
+        {'name': 'red_2',
+         'group': 'red',
+         'rules': [
+             {'field': 'DesiredDiscountRate', 'op': '<=', 'value': -69.0},
+             {'field': 'Price', 'op': '<=', 'value': 5.0},
+             # default at least 90 days ago
+             {'field': 'DebtOccuredOn', 'op': '<', 'days': -90},
+             # at least 3 payments within last 90 days
+             {'field': 'LoanTransfers.-1.Date', 'op': '>', 'days': -90},
+             {'field': 'LoanTransfers.-2.Date', 'op': '>', 'days': -90},
+             {'field': 'LoanTransfers.-3.Date', 'op': '>', 'days': -90},
+             # last payment after last debt management event
+             {'field': 'DebtManagmentEvents.1.CreatedOn', 'op': '<',
+              'ref': 'LoanTransfers.-1.Date', 'date': True},
+             # payments p.a. are larger than 19%
+             {'feature': 'recovery_yield', 'args': {'transfer': -1},
+              'op': '>', 'value': 0.19},
+             {'feature': 'recovery_yield', 'args': {'transfer': -2},
+              'op': '>', 'value': 0.19},
+             {'feature': 'recovery_yield', 'args': {'transfer': -3},
+              'op': '>', 'value': 0.19}]},
+        ]
+    }
+
+# operators comparing a value with a threshold
+OPERATORS = {'==': '==', '!=': '!=', '<': '<', '<=': '<=', '>': '>',
+             '>=': '>=', 'in': 'in', 'not in': 'not in'}
+# operators checking a value only
+UNARY_OPERATORS = {'empty': 'not {}', 'not empty': 'bool({})'}
+
+# comparisons of vectorized rules
+COMPARISONS = {'==': operator.eq, '!=': operator.ne, '<': operator.lt,
+               '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+# evaluation errors of rules treated as not satisfied
+RULE_ERRORS = (KeyError, IndexError, TypeError, ValueError,
+               AttributeError, ZeroDivisionError)
+
+
+def parse_rule_date(value):
+    """Parse date of an ISO timestamp, malformed values raise errors."""
+    return date.fromisoformat(value[:10])
+
+
+def next_payment_days(item, today):
+    """Get number of days between today and the next payment date."""
+    return (date.fromisoformat(item['NextPaymentDate'][:10]) - today).days
+
+
+def recovery_yield(item, today, transfer=-1):
+    """
+    Get annualised yield of a loan transfer relative to the price.
+
+    Parameters
+    ----------
+    item : dict
+        Secondary market item.
+    today : datetime.date
+        Current date.
+    transfer : int, optional
+        Index of the loan transfer. The default is -1, i.e. the last one.
+
+    Returns
+    -------
+    yield : float
+        Twelve times the transfer amount divided by the discounted
+        remaining principal.
+
+    """
+    return (12.0 * item['LoanTransfers'][transfer]['TotalAmount']
+            / (item['PrincipalRemaining']
+               * (1.0 + item['DesiredDiscountRate'] / 100.0)))
+
+
+# derived features as functions of item, current date, and arguments
+FEATURES = {'next_payment_days': next_payment_days,
+            'recovery_yield': recovery_yield}
+
+
+def next_payment_days_vector(frame, rows, today):
+    """Vectorized `next_payment_days` of the rows of a MarketFrame."""
+    return ((frame.values('NextPaymentDate', DATE, rows)
+             - np.datetime64(today, 'D')) / np.timedelta64(1, 'D'))
+
+
+def recovery_yield_vector(frame, rows, today, transfer=-1):
+    """Vectorized `recovery_yield` of the rows of a MarketFrame."""
+    amount = frame.values('LoanTransfers.{}.TotalAmount'.format(transfer),
+                          FLOAT, rows)
+    price = (frame.values('PrincipalRemaining', FLOAT, rows)
+             * (1.0 + frame.values('DesiredDiscountRate', FLOAT, rows)
+                / 100.0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 12.0 * amount / price
+    # division by zero fails in the scalar feature
+    return np.where(np.isfinite(values), values, np.nan)
+
+
+# fields of items used by derived features
+FEATURE_FIELDS = {'next_payment_days': ('NextPaymentDate',),
+                  'recovery_yield': ('LoanTransfers', 'PrincipalRemaining',
+                                     'DesiredDiscountRate')}
+
+
+# vectorized derived features as functions of frame, rows, current date,
+# and arguments, features without vectorized version are computed per row
+VECTOR_FEATURES = {'next_payment_days': next_payment_days_vector,
+                   'recovery_yield': recovery_yield_vector}
+
+
+class Strategy:
+    """Buying strategy compiled into one predicate."""
+
+    def __init__(self, name, group, predicate, source, days, rules,
+                 params=None):
+        self.name = name
+        self.group = group
+        self.predicate = predicate
+        self.source = source
+        self.days = days
+        # rules in the order of evaluation
+        self.rules = rules
+        # parameters of the action, e.g. amount to bid
+        self.params = params or {}
+
+    def __repr__(self):
+        return 'Strategy({!r}, {!r})'.format(self.name, self.group)
+
+
+def _path_expression(path):
+    """Convert path like 'LoanTransfers.-1.Date' to item access code."""
+    expression = 'p'
+    cost = 0
+    for key in path.split('.'):
+        try:
+            expression += '[{}]'.format(int(key))
+        except ValueError:
+            expression += '[{!r}]'.format(key)
+        cost += 1
+    return expression, cost
+
+
+def compile_strategy(config, features=None):
+    """
+    Compile strategy config into a predicate.
+
+    The rules are translated into one Python expression joined by
+    `and`, so that a rejected item costs only the evaluated
+    comparisons and no function call per rule. The rules are ordered
+    by estimated cost (plain fields first, then nested fields, dates,
+    and derived features), and by their order in the config otherwise,
+    so the most selective rules should be listed first.
+
+    Parameters
+    ----------
+    config : dict
+        Strategy config with `name`, `group`, and `rules`.
+    features : dict, optional
+        Derived features by name. The default is None, i.e. FEATURES.
+
+    Returns
+    -------
+    strategy : Strategy object
+        Compiled strategy with the predicate `predicate(item, context)`.
+
+    """
+    features = FEATURES if features is None else features
+    namespace = {'d': parse_rule_date}
+    days = set()
+    checks = []
+    for i, rule in enumerate(config['rules']):
+        is_date = rule.get('date', False) or 'days' in rule
+        if 'feature' in rule:
+            name = 'f{}'.format(i)
+            feature = features[rule['feature']]
+            args = rule.get('args', {})
+            namespace[name] = (lambda item, today, feature=feature,
+                               args=args: feature(item, today, **args))
+            value, cost = '{}(p, c["today"])'.format(name), 5
+        else:
+            value, cost = _path_expression(rule['field'])
+        op = rule['op']
+        # dates are parsed, so malformed dates fail like missing ones
+        if is_date and op not in UNARY_OPERATORS:
+            value = 'd({})'.format(value)
+            cost += 1
+
+        if op in UNARY_OPERATORS:
+            check = UNARY_OPERATORS[op].format(value)
+        elif op in OPERATORS:
+            if 'days' in rule:
+                threshold = 'c[{}]'.format(int(rule['days']))
+                days.add(int(rule['days']))
+            elif 'ref' in rule:
+                threshold, ref_cost = _path_expression(rule['ref'])
+                if is_date:
+                    threshold = 'd({})'.format(threshold)
+                cost += ref_cost
+            else:
+                threshold = 'v{}'.format(i)
+                constant = rule['value']
+                if isinstance(constant, list):
+                    constant = tuple(constant)
+                namespace[threshold] = constant
+            check = '{} {} {}'.format(value, OPERATORS[op], threshold)
+        else:
+            raise ValueError('Unknown operator {!r} in strategy {!r}.'
+                             .format(op, config['name']))
+        checks.append((rule.get('cost', cost), i, check, rule))
+
+    checks.sort(key=lambda check: check[:2])
+    source = 'def predicate(p, c):\n    return ({})\n'.format(
+        '\n            and '.join(check[2] for check in checks) or 'True')
+    exec(compile(source, '<strategy {}>'.format(config['name']), 'exec'),
+         namespace)
+    return Strategy(config['name'], config.get('group', config['name']),
+                    namespace['predicate'], source, days,
+                    [check[3] for check in checks], config.get('params'))
+
+
+def _feature_values(rule, frame, rows, today, features):
+    """Compute derived feature of a rule for some rows of a frame."""
+    name = rule['feature']
+    args = rule.get('args', {})
+    if name in VECTOR_FEATURES:
+        return VECTOR_FEATURES[name](frame, rows, today, **args)
+    values = []
+    for item in frame.items[rows]:
+        try:
+            values.append(features[name](item, today, **args))
+        except RULE_ERRORS:
+            values.append(np.nan)
+    return np.array(values, dtype=float)
+
+
+def _compare(op, values, threshold):
+    """Compare array with threshold, failed comparisons are False."""
+    if values.dtype != object:
+        with np.errstate(invalid='ignore'):
+            return np.asarray(COMPARISONS[op](values, threshold), dtype=bool)
+    if not isinstance(threshold, np.ndarray):
+        threshold = [threshold] * len(values)
+    mask = np.zeros(len(values), dtype=bool)
+    for i, (value, other) in enumerate(zip(values, threshold)):
+        try:
+            mask[i] = COMPARISONS[op](value, other)
+        except RULE_ERRORS:
+            pass
+    return mask
+
+
+def rule_mask(rule, frame, rows, today, features=None):
+    """
+    Evaluate a rule on some rows of a MarketFrame at once.
+
+    Missing values do not satisfy comparisons, like items failing
+    the scalar predicate.
+
+    Parameters
+    ----------
+    rule : dict
+        Rule of a strategy config.
+    frame : MarketFrame object
+        Secondary market items.
+    rows : numpy.ndarray
+        Indices of the rows to evaluate.
+    today : datetime.date
+        Current date.
+    features : dict, optional
+        Derived features by name. The default is None, i.e. FEATURES.
+
+    Returns
+    -------
+    mask : numpy.ndarray
+        Boolean mask of the rows satisfying the rule.
+
+    """
+    features = FEATURES if features is None else features
+    op = rule['op']
+    is_date = rule.get('date', False) or 'days' in rule
+    if 'feature' in rule:
+        kind = FLOAT
+        values = _feature_values(rule, frame, rows, today, features)
+    else:
+        if op in UNARY_OPERATORS:
+            # truthiness of the raw values, malformed dates are not empty
+            kind = OBJECT
+        elif is_date:
+            kind = DATE
+        elif (op in OPERATORS and 'value' in rule
+              and isinstance(rule['value'], (int, float))
+              and not isinstance(rule['value'], bool)):
+            kind = FLOAT
+        else:
+            kind = frame.kinds.get(rule['field'], OBJECT)
+        values = frame.values(rule['field'], kind, rows)
+
+    if op in UNARY_OPERATORS:
+        if kind == DATE:
+            empty = np.isnat(values)
+        elif kind == FLOAT:
+            empty = np.isnan(values) | (values == 0)
+        else:
+            empty = ~values.astype(bool)
+        return empty if op == 'empty' else ~empty
+    if op not in OPERATORS:
+        raise ValueError('Unknown operator {!r}.'.format(op))
+
+    if 'days' in rule:
+        threshold = np.datetime64(today + timedelta(days=int(rule['days'])),
+                                  'D')
+    elif 'ref' in rule:
+        threshold = frame.values(rule['ref'], kind, rows)
+    else:
+        threshold = rule['value']
+
+    if op in ['in', 'not in']:
+        mask = np.isin(values, list(threshold))
+        return mask if op == 'in' else ~mask
+    return _compare(op, values, threshold)
+
+
+def scan_strategy(strategy, frame, rows, today, features=None):
+    """
+    Find rows of a MarketFrame satisfying a strategy.
+
+    The rules are evaluated in the order of the compiled predicate,
+    each one only on the rows satisfying all previous rules.
+
+    Parameters
+    ----------
+    strategy : Strategy object
+        Compiled strategy.
+    frame : MarketFrame object
+        Secondary market items.
+    rows : numpy.ndarray
+        Indices of the rows to evaluate.
+    today : datetime.date
+        Current date.
+    features : dict, optional
+        Derived features by name. The default is None, i.e. FEATURES.
+
+    Returns
+    -------
+    rows : numpy.ndarray
+        Indices of the rows satisfying the strategy.
+
+    """
+    for rule in strategy.rules:
+        if not len(rows):
+            break
+        rows = rows[rule_mask(rule, frame, rows, today, features)]
+    return rows
+
+
+class RuleEngine:
+    """
+    Evaluate buying strategies loaded from a config.
+
+    The config is a JSON object with the list `strategies`. Each
+    strategy has a `name`, a `group`, and a list of `rules`. A rule
+    compares a `field` of the item (nested fields as path, e.g.
+    'LoanTransfers.-1.Date') or a derived `feature` (see FEATURES,
+    with optional `args`) by the operator `op` with:
+        `value` : constant (list for 'in' and 'not in'),
+        `days` : date relative to today in days, e.g. -90,
+        `ref` : another field of the item.
+    The operators 'empty' and 'not empty' need no threshold. With
+    `date` set, only the dates of ISO timestamps are compared.
+    Optional `params` of a strategy are passed to the action, e.g.
+    the `amount` to bid on auctions.
+
+    Strategies of a group are alternatives: the first satisfied one
+    in config order is taken. Time dependent thresholds are computed
+    once per `tick` seconds, and the config is reloaded, if its file
+    has changed.
+
+    """
+
+    def __init__(self, path=PATH_STRATEGIES, config=None, tick=TICK,
+                 default=DEFAULT_STRATEGIES):
+        """
+        Parameters
+        ----------
+        path : str, optional
+            Path of the JSON config. The default is PATH_STRATEGIES.
+        config : dict, optional
+            Config to use instead of a file. The default is None.
+            If neither the file exists nor a config is provided,
+            `default` is used.
+        tick : float, optional
+            Seconds between updates of time dependent thresholds.
+            The default is TICK.
+        default : dict, optional
+            Config used, if no config file exists.
+            The default is DEFAULT_STRATEGIES.
+
+        """
+        self.path = path
+        self.tick = tick
+        self.mtime = None
+        self.strategies = []
+        self.groups = {}
+        self.fields = None
+        self._context = None
+        self._context_time = 0.0
+        if config is not None:
+            self.path = None
+            self.load(config)
+        elif not self.reload():
+            self.load(default)
+
+    def load(self, config):
+        """
+        Compile strategies of a config.
+
+        Parameters
+        ----------
+        config : dict
+            Config with the list `strategies`.
+
+        Returns
+        -------
+        None.
+
+        """
+        strategies = [compile_strategy(strategy)
+                      for strategy in config['strategies']]
+        groups = {}
+        for strategy in strategies:
+            groups.setdefault(strategy.group, []).append(strategy)
+
+        # top level fields the decisions depend on, None means all fields
+        fields = set()
+        for strategy in config['strategies']:
+            for rule in strategy['rules']:
+                if 'feature' in rule:
+                    feature_fields = FEATURE_FIELDS.get(rule['feature'])
+                    if feature_fields is None:
+                        fields = None
+                        break
+                    fields.update(feature_fields)
+                else:
+                    fields.add(rule['field'].split('.')[0])
+                    if 'ref' in rule:
+                        fields.add(rule['ref'].split('.')[0])
+            if fields is None:
+                break
+
+        self.strategies = strategies
+        self.groups = groups
+        self.fields = None if fields is None else tuple(sorted(fields))
+        self._context = None
+
+    def reload(self):
+        """
+        Load config file, if it has changed since the last load.
+
+        Returns
+        -------
+        loaded : bool
+            True, if the config file was loaded.
+
+        """
+        if self.path is None:
+            return False
+        mtime = None
+        try:
+            mtime = os.path.getmtime(self.path)
+            if mtime == self.mtime:
+                return False
+            with open(self.path, encoding='utf-8') as infile:
+                self.load(json.load(infile))
+            self.mtime = mtime
+            logger.info('Loaded {} strategies from {}.'
+                        .format(len(self.strategies), self.path))
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            # keep the current strategies, if the config is broken
+            logger.error(e)
+            self.mtime = mtime
+            return False
+
+    def context(self):
+        """
+        Get thresholds of the current tick.
+
+        Returns
+        -------
+        context : dict
+            Dates by relative days and the current date as 'today'.
+
+        """
+        now = time.monotonic()
+        if self._context is None or now - self._context_time >= self.tick:
+            self.reload()
+            today = date.today()
+            context = {'today': today}
+            for strategy in self.strategies:
+                for days in strategy.days:
+                    context[days] = today + timedelta(days=days)
+            self._context = context
+            self._context_time = now
+        return self._context
+
+    def digest(self, item, context=None):
+        """
+        Get hash of the decision relevant fields of an item.
+
+        Items with equal hashes get the same decisions on the same day.
+
+        Parameters
+        ----------
+        item : dict
+            Secondary market item.
+        context : dict, optional
+            Thresholds of the current tick. The default is None,
+            i.e. `self.context()`.
+
+        Returns
+        -------
+        digest : int
+            Hash of the fields used by the strategies and the date.
+
+        """
+        if context is None:
+            context = self.context()
+        if self.fields is None:
+            values = sorted(item.items())
+        else:
+            values = [item.get(key) for key in self.fields]
+        return hash((context['today'], repr(values)))
+
+    def evaluate(self, item, group, context=None):
+        """
+        Find the first satisfied strategy of a group.
+
+        Parameters
+        ----------
+        item : dict
+            Secondary market item.
+        group : str
+            Group of strategies.
+        context : dict, optional
+            Thresholds of the current tick. The default is None,
+            i.e. `self.context()`.
+
+        Returns
+        -------
+        strategy : Strategy object
+            Satisfied strategy or None.
+        error : bool
+            True, if any strategy could not be evaluated, e.g. because
+            of missing fields.
+
+        """
+        if context is None:
+            context = self.context()
+        error = False
+        for strategy in self.groups.get(group, ()):
+            try:
+                if strategy.predicate(item, context):
+                    return strategy, error
+            except RULE_ERRORS:
+                error = True
+        return None, error
+
+    def scan(self, frame, group, today=None):
+        """
+        Find items of a MarketFrame satisfying strategies of a group.
+
+        Like `evaluate` for single items, each item is assigned to the
+        first satisfied strategy of the group.
+
+        Parameters
+        ----------
+        frame : MarketFrame object
+            Secondary market items.
+        group : str
+            Group of strategies.
+        today : datetime.date, optional
+            Current date. The default is None, i.e. today.
+
+        Returns
+        -------
+        matches : dict
+            Dict of strategy names with indices of the satisfied rows.
+
+        """
+        today = today or self.context()['today']
+        rows = np.arange(len(frame))
+        matches = {}
+        for strategy in self.groups.get(group, ()):
+            matched = scan_strategy(strategy, frame, rows, today)
+            matches[strategy.name] = matched
+            rows = np.setdiff1d(rows, matched, assume_unique=True)
+        return matches
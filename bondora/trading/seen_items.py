@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""The file contains the class definition of an index of seen items."""
+
+import time
+import threading
+from collections import OrderedDict
+
+# maximal number of remembered items
+SEEN_SIZE = 10000
+# time in seconds to remember the decision about an item
+SEEN_TTL = 3600
+
+# outcomes of decisions
+SKIPPED = 'skip'
+FAILED_EVALUATION = 'error'
+BUYING = 'buying'
+BOUGHT = 'bought'
+BUY_FAILED = 'buy_failed'
+# outcomes kept even if the fields of the item change
+FINAL_OUTCOMES = (BUYING, BOUGHT)
+
+
+class SeenItems:
+    """
+    Bounded index of decisions about secondary market items.
+
+    Bondora sends several webhooks for the same item. The index keeps
+    the outcome of the last decision together with a hash of the
+    decision relevant fields of the item, so that a repeated webhook
+    with unchanged fields is answered by the remembered outcome
+    instead of evaluating the strategies and buying again. Items
+    being bought or bought keep their outcome even if their fields
+    change. Entries expire after `ttl` seconds, and the least recently
+    used entries are evicted first.
+
+    """
+
+    def __init__(self, maxsize=SEEN_SIZE, ttl=SEEN_TTL):
+        """
+        Parameters
+        ----------
+        maxsize : int, optional
+            Maximal number of remembered items. The default is SEEN_SIZE.
+        ttl : float, optional
+            Time in seconds to remember a decision. The default is SEEN_TTL.
+
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, digest):
+        """
+        Get the remembered outcome of an item.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the item, e.g. tuple of strategy group and item ID.
+        digest : int
+            Hash of the decision relevant fields of the item.
+
+        Returns
+        -------
+        outcome : str
+            Remembered outcome, or None, if the item is unknown,
+            expired, or its decision relevant fields have changed.
+
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if not self._valid(entry, digest, now):
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def claim(self, key, digest, outcome):
+        """
+        Remember an outcome, unless one is remembered for the same fields.
+
+        Checking and remembering are atomic, so that only one of
+        concurrent webhooks of an item proceeds.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the item.
+        digest : int
+            Hash of the decision relevant fields of the item.
+        outcome : str
+            Outcome to remember, e.g. BUYING.
+
+        Returns
+        -------
+        outcome : str
+            Remembered outcome of a previous decision, or None,
+            if `outcome` was remembered.
+
+        """
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if self._valid(entry, digest, now):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+            self._put(key, digest, outcome, now)
+            return None
+
+    def put(self, key, digest, outcome):
+        """
+        Remember the outcome of a decision.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the item.
+        digest : int
+            Hash of the decision relevant fields of the item.
+        outcome : str
+            Outcome of the decision.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            self._put(key, digest, outcome, time.monotonic())
+
+    def discard(self, key):
+        """
+        Forget the decision about an item, e.g. if its outcome is unknown.
+
+        Parameters
+        ----------
+        key : hashable
+            Key of the item.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    @staticmethod
+    def _valid(entry, digest, now):
+        """Check if entry is not expired and applies to the fields."""
+        return (entry is not None and entry[0] > now
+                and (entry[1] == digest or entry[2] in FINAL_OUTCOMES))
+
+    def _put(self, key, digest, outcome, now):
+        """Store entry and evict least recently used ones."""
+        self.entries[key] = (now + self.ttl, digest, outcome)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def stats(self):
+        """
+        Get statistics of the index.
+
+        Returns
+        -------
+        stats : dict
+            Number of entries, hits, and misses.
+
+        """
+        with self.lock:
+            return {'size': len(self.entries),
+                    'hits': self.hits,
+                    'misses': self.misses}